@@ -6,6 +6,8 @@ All constants containing the number 2 are used for the secondary LLM interaction
 
 """
 
+import os
+
 # Configuration for HAIWPA Chat Application
 LLM_SERVER_1_URL = "http://localhost:8081"
 MCP_SERVER_URL = "http://localhost:9000"
@@ -17,14 +19,84 @@ MODEL_ALIAS_1 = "Llama 3.2 3B Instruct"
 TEMPERATURE_1 = 0.7  # Less randomness, more predictable
 TEMPERATURE_2 = 0.3 # Used for extraction
 MAX_TOKEN = 2048
+# Stream the answers to the chat token by token instead of waiting for the whole answer
+STREAM_ANSWERS = True
+# Number of requests sent to the LLM server at the same time, it should match the `--parallel` slots of the server
+LLM_MAX_CONCURRENCY = 4
+# Keep the prompt of each conversation append-only and send its turns to the same slot of the server (`id_slot`),
+# so the server reuses the KV cache of the previous turns (`cache_prompt`) instead of processing the whole history again
+PROMPT_CACHE = True
+# Number of conversations whose last prompt is kept
+PROMPT_CONVERSATIONS = 1000
 
 # Gradio interface settings
 GRADIO_SERVER_URL = "127.0.0.1"
 GRADIO_SERVER_PORT = 7860
 
-# JSON extraction context file
+# SWI-Prolog rules file
+RULES_FILE = "workout_rules.pl"
+# Load the rules from their compiled form (workout_rules.qlf), compiled again when the source changes
+PRECOMPILED_RULES = True
+
+# JSON extraction context file, in JSON Lines format (one entry per line)
+# An existing `data/context.json` file (JSON array) is migrated on first use
 DATA_FOLDER = "data"
-CONTEXT_FILE = "data/context.json"
+CONTEXT_FILE = "data/context.jsonl"
+
+# Only assert the entries appended to the context file since the last validation
+# A full reload is still done when the file has been rewritten
+INCREMENTAL_INGESTION = True
+
+# Send the extracted sessions to the MCP server (`ingest_sessions` tool) instead of writing the context file
+# in the backend and reading it again in the MCP server. The MCP server saves the context file in the background.
+DIRECT_INGESTION = True
+
+# Store of the workout entries shared by the backend and the MCP server (haiwpa_store.py)
+# "jsonl" : one JSON Lines context file per user, "sqlite" : a single SQLite database in WAL mode
+CONTEXT_STORE = "jsonl"
+STORE_DB_FILE = "data/workouts.db"
+STORE_BUSY_TIMEOUT = 5.0  # Seconds to wait for another process writing to the database
+# Flush every save to the disk (os.fsync), so saved sessions survive a power loss
+STORE_FSYNC = False
+# Write the saves of concurrent requests together : one write and one fsync per file, one transaction for SQLite
+GROUP_COMMIT = False
+GROUP_COMMIT_WINDOW = 0.005  # Seconds during which the saves of other requests are collected
+
+# Only keep the history used by the Prolog rules (longest rest or injury recovery period)
+# Older completed workouts are not asserted into Prolog and are moved to an archive file next to the context file
+HISTORY_RETENTION = True
+# Number of entries appended to a context file before its stale entries are archived
+ARCHIVE_INTERVAL = 100
+
+# Compaction of the history (haiwpa_store.py) : past planned workouts become completed ones and the sessions
+# of the same muscle on the same date are merged. It also runs on a schedule with `python haiwpa_store.py compact`.
+COMPACTION = True
+# Bytes appended to a context file since its last compaction before it is compacted again
+COMPACTION_TAIL_SIZE = 512 * 1024
+
+# Columnar copy of the completed workouts used for long-term analytics (haiwpa_columnar.py, needs NumPy)
+COLUMNS_FOLDER = "data/columns"
+
+# Users of the MCP server, each one has its own context file and Prolog knowledge base
+# The default user keeps using `CONTEXT_FILE`, the other ones are saved in `data/users/`
+DEFAULT_USER_ID = "default"
+USERS_FOLDER = "data/users"
+# Knowledge bases of the least recently used users are unloaded above these limits
+KB_MAX_USERS = 1000
+KB_MAX_FACTS = 1_000_000
+
+# Maximum number of validation results kept in the MCP server cache
+VALIDATION_CACHE_SIZE = 10_000
+
+# Workout planning with the `plan_workouts` MCP tool
+PLAN_MAX_DAYS = 31
+PLAN_MAX_MUSCLES_PER_DAY = 2
+PLAN_TIME_LIMIT = 2.0  # Seconds to search the best plan before keeping the first one found
+# Planning questions of the chat ("Plan my next 5 days for chest and legs") are answered with the `plan_workouts` tool
+PLAN_FROM_CHAT = True
+
+# Number of Prolog worker processes used by the MCP server (0 to run Prolog in the MCP server process)
+PROLOG_WORKERS = os.cpu_count() or 1
 
 # Fitness-related keywords
 FITNESS_KEYWORDS = [
@@ -38,6 +110,31 @@ FITNESS_KEYWORDS = [
  "swim", "cycling", "duration", "minutes",
  "hours", "sets", "reps",]
 
+# Instructor mode of the LLM extraction : "json_schema" sends the schema to Llama.cpp, which constrains the answer with a
+# grammar, "json" only asks for a JSON object and retries when the answer does not match the schema
+EXTRACTION_MODE = "json_schema"
+# Generations of an extraction, the first one and the retries after an invalid answer
+EXTRACTION_MAX_ATTEMPTS = 3
+# Cache of the LLM extractions, by normalized message and date of the day (relative dates depend on it)
+EXTRACTION_CACHE = True
+EXTRACTION_CACHE_SIZE = 1000
+EXTRACTION_CACHE_TTL = 24 * 60 * 60  # Seconds
+# SQLite file keeping the cached extractions across restarts, None to only keep them in memory
+EXTRACTION_CACHE_FILE = "data/extraction_cache.db"
+
+# Rule-based extraction tried before the LLM for simple messages (haiwpa_fastpath.py)
+FAST_PATH_EXTRACTION = True
+# Below this confidence (0 to 1), the message is sent to the LLM extraction
+FAST_PATH_MIN_CONFIDENCE = 0.8
+# Longer messages are sent to the LLM extraction, they usually say more than the rules can read
+FAST_PATH_MAX_WORDS = 25
+# Other names of the muscle groups of the rules
+MUSCLE_ALIASES = {
+ "abs": "abdominals", "core": "abdominals", "glute": "glutes", "calf": "calves",
+ "leg": "legs", "quads": "legs", "hamstrings": "legs", "lats": "back",
+ "pecs": "chest", "bicep": "biceps", "tricep": "triceps", "shoulder": "shoulders", "delts": "shoulders",
+}
+
 # Context for the LLM's answer
 LLM_CONTEXT_FOR_ANSWER = (
  "WORKOUT VALIDATION :\n"
@@ -47,3 +144,10 @@ LLM_CONTEXT_FOR_ANSWER = (
  + "1. Do NOT make up additional medical advice if prolog_validation=True, but answers the users based on the Prolog validation.\n"
  + "2. If prolog_validation=False, use `reason` to make your answer but only based on the `reason` field from Prolog.\n"
 )
+
+LLM_CONTEXT_FOR_PLAN = (
+ "WORKOUT PLAN :\n"
+ + "RULE : \n"
+ + "The plan below was computed by Prolog from the workout history, injuries and rest days of the user.\n"
+ + "Present this plan day by day, do NOT add, move or remove a muscle group. A day without muscles is a rest day.\n"
+)
@@ -2,60 +2,200 @@
 HAIWPA Backend
 
 Project backend module with :
-- OpenAI client for LLM chat completions (Llama.cpp server)
-- Instructor client for structured JSON extraction (Pydantic models)
+- Async OpenAI client for LLM chat completions (Llama.cpp server), streamed token by token to the chat
+- Async Instructor client for structured JSON extraction (Pydantic models), after the rule-based fast path
 - FastMCP client for Prolog validation via MCP tool calls
 - Gradio message format conversion
-- Validation context building for LLM prompts
+- Validation and workout plan context building for LLM prompts
 
 Source :
 - https://github.com/abetlen/llama-cpp-python/blob/main/examples/notebooks/Functions.ipynb
 - https://llama.developer.meta.com/docs/features/compatibility/
 - https://python.useinstructor.com/blog/2024/03/07/open-source-local-structured-output-pydantic-json-openai/#groq
+- https://platform.openai.com/docs/api-reference/chat-streaming
+- https://python.useinstructor.com/concepts/async/
+- https://docs.python.org/3/library/asyncio-sync.html#asyncio.Semaphore
+- https://github.com/ggml-org/llama.cpp/tree/master/tools/server#post-completion-given-a-prompt-it-returns-the-predicted-completion
+- https://python.useinstructor.com/concepts/retrying/
+- https://github.com/ggml-org/llama.cpp/tree/master/tools/server#post-v1chatcompletions-openai-compatible-chat-completions-api
 
 Assistant : Claude
 """
 
-from openai import OpenAI
-from haiwpa_workout import MultipleFitnessExtract
+from openai import AsyncOpenAI
+from haiwpa_workout import FitnessExtract, MultipleFitnessExtract, save_sessions
+from haiwpa_fastpath import fast_extract, planning_request
+from haiwpa_cache import LRUCache, DiskCache, TieredCache, MISSING
 from haiwpa_mcp import format_suggested_workout
 from fastmcp import Client
+from tenacity import AsyncRetrying, stop_after_attempt
+import asyncio
+import datetime
 import json
+import re
+import time
 import config
 import instructor
 
 
+# Instructor modes of the extraction (`config.EXTRACTION_MODE`)
+# - json        : the model is asked for a JSON object, a flat or invalid answer is sent back with the error
+# - json_schema : the schema of `MultipleFitnessExtract` is sent in `response_format`, Llama.cpp turns it into a
+#                 grammar so the model can only write a valid answer
+EXTRACTION_MODES = {
+    "json": instructor.Mode.JSON,
+    "json_schema": instructor.Mode.JSON_SCHEMA,
+}
+
+
+# Key of a message in the extraction cache : the message without case, punctuation and extra whitespace,
+# with the date of the day, so "yesterday" is not read from the extraction of another day
+def extraction_cache_key(message: str, today: datetime.date = None) -> str:
+    today = today or datetime.date.today()
+    text = " ".join(re.sub(r"[^\w\s]", " ", message.lower()).split())
+    return f"{today.isoformat()}|{config.EXTRACTION_MODE}|{text}"
+
+
+# Cache of the LLM extractions, with a disk tier if `config.EXTRACTION_CACHE_FILE` is set
+def create_extraction_cache():
+    memory = LRUCache(config.EXTRACTION_CACHE_SIZE, ttl=config.EXTRACTION_CACHE_TTL)
+    disk = None
+    if config.EXTRACTION_CACHE_FILE:
+        disk = DiskCache(config.EXTRACTION_CACHE_FILE, config.EXTRACTION_CACHE_SIZE, ttl=config.EXTRACTION_CACHE_TTL)
+    return TieredCache(memory, disk)
+
+
+# Options of the Llama.cpp server sent with the answers of a conversation
+# `cache_prompt` reuses the KV cache of the prompt prefix already processed by the slot, `id_slot` sends every turn of
+# the conversation to the same slot, where its prefix is cached.
+def slot_options(slot: int = None):
+    if slot is None or not config.PROMPT_CACHE:
+        return {}
+    return {"extra_body": {"cache_prompt": True, "id_slot": slot}}
+
+
+# Prompt tokens of an answer and how many of them were reused from the KV cache, from the usage
+# (`prompt_tokens_details.cached_tokens`) or the timings of Llama.cpp (`cache_n`, `prompt_n`)
+def prompt_cache_usage(usage, timings):
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None)
+    evaluated_tokens = None
+
+    if timings:
+        cached_tokens = timings.get("cache_n", cached_tokens)
+        evaluated_tokens = timings.get("prompt_n")
+    if evaluated_tokens is None and prompt_tokens is not None and cached_tokens is not None:
+        evaluated_tokens = prompt_tokens - cached_tokens
+    if prompt_tokens is None and cached_tokens is not None and evaluated_tokens is not None:
+        prompt_tokens = cached_tokens + evaluated_tokens
+
+    return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "prompt_eval_tokens": evaluated_tokens}
+
+
 class HAIWPABackend:
     def __init__(self):
-        self.client = OpenAI(
+        # Async clients : the Gradio event loop keeps serving other users while a request waits for the LLM
+        self.async_client = AsyncOpenAI(
             base_url=f"{config.LLM_SERVER_1_URL}/v1", api_key=config.API_KEY
         )
+        # Time to first token and tokens per second of the last streamed answer
+        self.stream_stats = {}
 
         # Used for structured JSON extraction
         self.instructor_client = instructor.from_openai(
-            OpenAI(base_url=f"{config.LLM_SERVER_1_URL}/v1", api_key=config.API_KEY),
-            mode=instructor.Mode.JSON,
+            AsyncOpenAI(base_url=f"{config.LLM_SERVER_1_URL}/v1", api_key=config.API_KEY),
+            mode=EXTRACTION_MODES[config.EXTRACTION_MODE],
         )
+        # Number of requests sent to the LLM server at the same time (extractions and answers)
+        # It should match the number of slots of the Llama.cpp server (`--parallel`), other requests wait here.
+        self.llm_slots = asyncio.Semaphore(config.LLM_MAX_CONCURRENCY)
+        # Number and time of the extractions done by the rule-based fast path and by the LLM
+        self.extraction_stats = {"fast_path": 0, "llm": 0, "fast_path_seconds": 0.0, "llm_seconds": 0.0}
+        # Number of LLM extractions by number of retries, e.g. {0: 18, 1: 2} (each retry is a whole new generation)
+        self.extraction_retries = {}
+        self.extraction_cache = create_extraction_cache() if config.EXTRACTION_CACHE else None
         self.model_name = config.MODEL_ALIAS_1
         self.temperature = config.TEMPERATURE_1
         self.max_tokens = config.MAX_TOKEN
         self.mcp_client = Client(f"{config.MCP_SERVER_URL}/mcp")
+        # Messages sent for the last turn of each conversation, with its answer, and the slot of the conversation
+        # They are the prefix of the next turn, so the server does not process the whole history again.
+        self.conversations = LRUCache(config.PROMPT_CONVERSATIONS)
+        self.next_slot = 0
 
     # Wait for a response from the model after the prompt is sent
     # This function is based on https://github.com/abetlen/llama-cpp-python/blob/main/examples/notebooks/Functions.ipynb
-    def chat(self, messages):
+    async def chat(self, messages, slot: int = None):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-            )
+            async with self.llm_slots:
+                response = await self.async_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    **slot_options(slot),
+                )
             # Used to extract content.text from llama.cpp
             return response.choices[0].message.content
         except Exception as e:
             return f"Error: {str(e)}"
 
+    # Stream the response of the model, yielding each piece of text as soon as the server sends it
+    # Llama.cpp sends one token per chunk, the number of generated tokens is taken from the usage if it is returned.
+    # The measures are written to `stats` if it is given, to `self.stream_stats` otherwise.
+    async def chat_stream(self, messages, stats: dict = None, slot: int = None):
+        start = time.perf_counter()
+        first_token = None
+        chunks = 0
+        usage = None
+        timings = None
+
+        try:
+            # The slot is kept until the whole answer is received
+            async with self.llm_slots:
+                stream = await self.async_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **slot_options(slot),
+                )
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    # Llama.cpp adds its timings to the last chunk
+                    timings = (getattr(chunk, "model_extra", None) or {}).get("timings") or timings
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    chunks += 1
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            yield f"Error: {str(e)}"
+            return
+
+        # Tokens per second are measured from the first token, so they do not include the prompt processing
+        total = time.perf_counter() - start
+        tokens = usage.completion_tokens if usage else chunks
+        generation = total - (first_token or 0)
+        if stats is None:
+            stats = self.stream_stats = {}
+        stats.update(
+            {
+                "time_to_first_token": first_token,
+                "tokens": tokens,
+                "tokens_per_second": tokens / generation if tokens and generation > 0 else None,
+                "total_seconds": total,
+                **prompt_cache_usage(usage, timings),
+            }
+        )
+        print("Streaming stats", stats)
+
     # Check if message contains fitness-related keywords
     def is_fitness_related(self, message: str) -> bool:
         """Check if message contains fitness-related keywords"""
@@ -63,23 +203,88 @@ class HAIWPABackend:
         message_lower = message.lower()
         return any(keyword in message_lower for keyword in fitness_keywords)
 
+    # Extract fitness information from user input, with the rules of `haiwpa_fastpath.py` for simple messages
+    # The LLM extraction is only used when the rules are not confident enough.
+    async def extract_fitness_info(self, user_input):
+        if config.FAST_PATH_EXTRACTION:
+            start = time.perf_counter()
+            sessions, confidence = fast_extract(user_input)
+            if sessions and confidence >= config.FAST_PATH_MIN_CONFIDENCE:
+                self.extraction_stats["fast_path"] += 1
+                self.extraction_stats["fast_path_seconds"] += time.perf_counter() - start
+                print("Extraction stats", self.extraction_report())
+                return sessions
+
+        # The sessions are cached as dicts, new objects are returned as they are changed when they are saved
+        key = extraction_cache_key(user_input)
+        if self.extraction_cache is not None:
+            cached = self.extraction_cache.get(key)
+            if cached is not MISSING:
+                print("Extraction stats", self.extraction_report())
+                return [FitnessExtract(**session) for session in cached]
+
+        start = time.perf_counter()
+        sessions = await self.extract_fitness_info_llm(user_input)
+        self.extraction_stats["llm"] += 1
+        self.extraction_stats["llm_seconds"] += time.perf_counter() - start
+
+        # A failed extraction is not cached, the next message can be extracted
+        if self.extraction_cache is not None and sessions is not None:
+            self.extraction_cache.put(key, [session.model_dump() for session in sessions])
+        print("Extraction stats", self.extraction_report())
+        return sessions
+
+    # Hit rate of the fast path and time it saved, estimated with the average time of the LLM extractions
+    def extraction_report(self):
+        stats = self.extraction_stats
+        total = stats["fast_path"] + stats["llm"]
+        llm_average = stats["llm_seconds"] / stats["llm"] if stats["llm"] else None
+        saved = None
+        if llm_average is not None:
+            saved = stats["fast_path"] * llm_average - stats["fast_path_seconds"]
+
+        return {
+            "extractions": total,
+            "fast_path_hit_rate": stats["fast_path"] / total if total else None,
+            "fast_path_average_seconds": stats["fast_path_seconds"] / stats["fast_path"] if stats["fast_path"] else None,
+            "llm_average_seconds": llm_average,
+            "saved_seconds": saved,
+            "llm_retries": dict(sorted(self.extraction_retries.items())),
+            "llm_retries_per_request": (
+                sum(retries * count for retries, count in self.extraction_retries.items())
+                / sum(self.extraction_retries.values())
+                if self.extraction_retries else None
+            ),
+            "cache": self.extraction_cache.stats() if self.extraction_cache is not None else None,
+        }
+
     # Extract fitness information from user input using structured JSON extraction
     # This function is based on https://www.youtube.com/watch?v=VllkW63LWbY
-    def extract_fitness_info(self, user_input):
+    # The attempts are counted with the retry policy given to Instructor, one policy per request
+    async def extract_fitness_info_llm(self, user_input):
+        attempts = 0
+
+        def count_attempt(retry_state):
+            nonlocal attempts
+            attempts = retry_state.attempt_number
+
         try:
-            response = self.instructor_client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"Extract fitness information from the following input:\n{user_input} using a JSON format",
-                    }
-                ],
-                response_model=MultipleFitnessExtract,
-                temperature=config.TEMPERATURE_2,
-                max_tokens=self.max_tokens,
-                max_retries=3,
-            )
+            async with self.llm_slots:
+                response = await self.instructor_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": f"Extract fitness information from the following input:\n{user_input} using a JSON format",
+                        }
+                    ],
+                    response_model=MultipleFitnessExtract,
+                    temperature=config.TEMPERATURE_2,
+                    max_tokens=self.max_tokens,
+                    max_retries=AsyncRetrying(
+                        stop=stop_after_attempt(config.EXTRACTION_MAX_ATTEMPTS), before=count_attempt, reraise=True
+                    ),
+                )
             if response and hasattr(response, "sessions"):
                 return response.sessions
             return None
@@ -87,6 +292,10 @@ class HAIWPABackend:
             print("Not able to extract fitness information")
             print(f"\nError: {e}")
             return None
+        finally:
+            retries = max(attempts - 1, 0)
+            self.extraction_retries[retries] = self.extraction_retries.get(retries, 0) + 1
+            print(f"Extraction attempts : {attempts} ({config.EXTRACTION_MODE} mode)")
 
     # Converting Gradio response format to messages format
     # Gradio's chat interface contains more informations in content like the `type` and the actual `text` when OpenAI API format contains only a string in `content`.
@@ -132,17 +341,32 @@ class HAIWPABackend:
                     alt = format_suggested_workout(alternatives)
                     res += f"  Suggested alternatives: {alt}\n"
 
-                # Getting the max rest days
-                res += f"Use this max rest days value : {max_rest_days} which is in days for the recent workout history. \n"
+                # Getting the max rest days, None when the user has no completed workout yet
+                if max_rest_days is not None:
+                    res += f"Use this max rest days value : {max_rest_days} which is in days for the recent workout history. \n"
 
         return res #+ "Use those validation informations to answer."
 
-    # MCP client call to validate all planned workouts
-    async def validate_workout_mcp(self, file_path: str = config.CONTEXT_FILE):
+    # Convert the plan of the `plan_workouts` MCP tool to a message format for LLM context
+    def convert_plan_to_message(self, plan):
+        if not plan or not plan.get("plan"):
+            return None
+
+        res = config.LLM_CONTEXT_FOR_PLAN
+        for day in plan["plan"]:
+            muscles = ", ".join(day["muscles"]) if day["muscles"] else "rest day"
+            res += f"- {day['date']} : {muscles}\n"
+        if plan.get("invalid_targets"):
+            res += f"Unknown muscle groups that were not planned : {', '.join(plan['invalid_targets'])}\n"
+
+        return res
+
+    # MCP client call to validate all planned workouts of a user
+    async def validate_workout_mcp(self, user_id: str = config.DEFAULT_USER_ID):
         try:
             async with self.mcp_client:
                 result = await self.mcp_client.call_tool(
-                    "validate_all_planned_workouts"
+                    "validate_all_planned_workouts", {"user_id": user_id}
                 )
 
                 # Check if there is a result and returns the content from it because MCP returns a JSON format answer
@@ -153,35 +377,85 @@ class HAIWPABackend:
         except Exception as e:
             return None
 
-    # Adds the user/bot message history to the current message and gets a response
-    async def chat_with_history(self, current_message, history):
+    # MCP client call to assert the extracted sessions of a user directly into its knowledge base
+    async def ingest_sessions_mcp(self, sessions, user_input: str, user_id: str = config.DEFAULT_USER_ID):
+        try:
+            async with self.mcp_client:
+                result = await self.mcp_client.call_tool(
+                    "ingest_sessions",
+                    {
+                        "sessions": [session.model_dump() for session in sessions],
+                        "user_input": user_input,
+                        "user_id": user_id,
+                    },
+                )
+
+                if result and result.content:
+                    return json.loads(result.content[0].text)
+
+                return result
+        except Exception as e:
+            return None
+
+    # MCP client call to plan the workouts of a user for several days in a single call
+    async def plan_workouts_mcp(self, start_date: str, days: int, targets, user_id: str = config.DEFAULT_USER_ID):
+        try:
+            async with self.mcp_client:
+                result = await self.mcp_client.call_tool(
+                    "plan_workouts",
+                    {"start_date": start_date, "days": days, "targets": list(targets), "user_id": user_id},
+                )
+
+                if result and result.content:
+                    return json.loads(result.content[0].text)
+
+                return result
+        except Exception as e:
+            return None
+
+    # Build the messages sent to the LLM : the user/bot message history, the Prolog validation and the current message
+    # `user_id` is used to keep the workout history of each user separated
+    async def build_messages(self, current_message, history, user_id: str = config.DEFAULT_USER_ID):
         # Used to store Prolog validation if there is any
         validation_context = ""
 
+        # Planning questions get a plan for all their days from Prolog, their muscles are not saved as sessions
+        plan_request = planning_request(current_message) if config.PLAN_FROM_CHAT else None
+        if plan_request:
+            print("Planning request", plan_request)
+            plan = await self.plan_workouts_mcp(
+                plan_request["start_date"], plan_request["days"], plan_request["targets"], user_id
+            )
+            validation_context = self.convert_plan_to_message(plan)
+
         # Printing fitness extraction informations from user prompts only if the message is related to fitness
-        if self.is_fitness_related(current_message):
+        elif self.is_fitness_related(current_message):
             print("Starting the extraction process...")
-            fitness_sessions = self.extract_fitness_info(current_message)
+            fitness_sessions = await self.extract_fitness_info(current_message)
             if fitness_sessions:
                 for session in fitness_sessions:
                     session.print_extracted_info()
-                    session.save_to_json(current_message)
 
-                validation_results = await self.validate_workout_mcp()
+                # The sessions are sent to the MCP server, which saves them to the context file of the user
+                # They are saved here if direct ingestion is disabled or the MCP server cannot be reached
+                ingested = None
+                if config.DIRECT_INGESTION:
+                    ingested = await self.ingest_sessions_mcp(fitness_sessions, current_message, user_id)
+                if ingested is None:
+                    await asyncio.to_thread(save_sessions, fitness_sessions, current_message, user_id)
+
+                validation_results = await self.validate_workout_mcp(user_id)
                 if validation_results:
                     validation_context = self.convert_validation_to_message(
                         validation_results
                     )
 
-        # Converting Gradio history format to messages format before sending to the LLM
-        messages = []
-        if history:
-            for msg in history:
-                converted_message = self.gradio_to_messages(msg)
-                if converted_message:
-                    messages.append(converted_message)
+        # The prompt starts with the messages sent for the previous turn, so the prefix cached by the server is kept
+        chat = self.history_to_messages(history)
+        messages = self.stored_prefix(chat, user_id) or chat
 
         # role system used to add rules on how the LLM should answer
+        # It is added after the previous turns, the messages before it are the same as in the previous prompt.
         if validation_context:
             messages.append({"role": "system", "content": validation_context})
             print("Validation context \n", validation_context, "\n")
@@ -189,4 +463,113 @@ class HAIWPABackend:
         # messages contains the validation_context as well as the user message
         messages.append({"role": "user", "content": current_message})
         print("Message sent to LLM", messages)
-        return self.chat(messages)
+        return messages
+
+    # Converting Gradio history format to messages format before sending to the LLM
+    def history_to_messages(self, history):
+        messages = []
+        if history:
+            for msg in history:
+                converted_message = self.gradio_to_messages(msg)
+                if converted_message:
+                    messages.append(converted_message)
+        return messages
+
+    # Conversation of a user, created with the next slot of the server the first time
+    # Conversations get the slots in turn, a slot can be shared when there are more conversations than slots.
+    def conversation(self, user_id: str):
+        conversation = self.conversations.get(user_id, None)
+        if conversation is None:
+            conversation = {"chat": None, "messages": [], "slot": self.next_slot % config.LLM_MAX_CONCURRENCY}
+            self.next_slot += 1
+            self.conversations.put(user_id, conversation)
+        return conversation
+
+    # Messages sent for the previous turn of the conversation (with the validation contexts) and its answer,
+    # None if the Gradio history is not this turn (first message, retried or edited message, other chat)
+    def stored_prefix(self, chat, user_id: str):
+        conversation = self.conversations.get(user_id, None)
+        if not config.PROMPT_CACHE or conversation is None or not chat or conversation["chat"] != chat:
+            return None
+        return list(conversation["messages"])
+
+    # Keep the messages of a turn and its answer as the prefix of the next turn
+    def remember_turn(self, user_id: str, history, messages, answer: str):
+        if not config.PROMPT_CACHE or answer.startswith("Error:"):
+            return
+        conversation = self.conversation(user_id)
+        conversation["chat"] = self.history_to_messages(history) + [
+            {"role": "user", "content": messages[-1]["content"]},
+            {"role": "assistant", "content": answer},
+        ]
+        conversation["messages"] = messages + [{"role": "assistant", "content": answer}]
+
+    # Adds the user/bot message history to the current message and streams the response
+    # The extraction and the Prolog validation are done before the generation starts, so the validation context is
+    # in the prompt. It yields the answer received so far, as expected by `gr.ChatInterface`.
+    # With `config.STREAM_ANSWERS = False`, the whole answer is yielded once it is generated.
+    # Every turn of a conversation is sent to the same slot of the server, which keeps the KV cache of its prompt.
+    async def chat_with_history(
+        self, current_message, history, user_id: str = config.DEFAULT_USER_ID, stats: dict = None
+    ):
+        prefix = self.stored_prefix(self.history_to_messages(history), user_id)
+        messages = await self.build_messages(current_message, history, user_id)
+        slot = self.conversation(user_id)["slot"] if config.PROMPT_CACHE else None
+
+        if not config.STREAM_ANSWERS:
+            answer = await self.chat(messages, slot)
+            self.remember_turn(user_id, history, messages, answer)
+            yield answer
+            return
+
+        answer = ""
+        async for token in self.chat_stream(messages, stats, slot):
+            answer += token
+            yield answer
+
+        # Messages of the prompt that were the same as in the previous prompt of the conversation
+        stats = self.stream_stats if stats is None else stats
+        stats["reused_messages"] = len(prefix) if prefix else 0
+        stats["slot"] = slot
+        self.remember_turn(user_id, history, messages, answer)
+
+
+# Send `count` chats at the same time and compare the time they took together with the time they took one by one
+# With async clients the chats overlap, so the wall time stays close to the slowest chat (as long as the LLM server
+# has enough slots) instead of the sum of all of them.
+async def run_load_test(count: int = 4, message: str = "Give me one tip to stay motivated", backend=None):
+    backend = backend or HAIWPABackend()
+
+    async def timed_chat(i):
+        stats = {}
+        start = time.perf_counter()
+        async for _ in backend.chat_with_history(message, [], f"loadtest_{i}", stats):
+            pass
+        return time.perf_counter() - start, stats.get("time_to_first_token")
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_chat(i) for i in range(count)))
+    wall = time.perf_counter() - start
+
+    durations = [duration for duration, _ in results]
+    first_tokens = [ttft for _, ttft in results if ttft is not None]
+    report = {
+        "chats": count,
+        "concurrency": config.LLM_MAX_CONCURRENCY,
+        "wall_seconds": wall,
+        "sum_seconds": sum(durations),
+        "slowest_seconds": max(durations),
+        "overlap": sum(durations) / wall if wall > 0 else None,
+        "max_time_to_first_token": max(first_tokens) if first_tokens else None,
+    }
+    print("Load test", report)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["loadtest"]:
+        asyncio.run(run_load_test(int(sys.argv[2]) if len(sys.argv) > 2 else 4))
+    else:
+        print("Usage : python haiwpa_backend.py loadtest [chats]")
@@ -0,0 +1,214 @@
+"""
+HAIWPA Cache
+
+Bounded LRU cache with hit/miss counters, used to avoid recomputing results that did not change.
+Entries can expire after a time to live, and an optional SQLite tier keeps them on disk across restarts.
+
+Source :
+- https://docs.python.org/3/library/collections.html#collections.OrderedDict
+- https://docs.python.org/3/library/sqlite3.html
+- https://www.sqlite.org/wal.html
+
+Assistant : Claude
+"""
+
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Returned by `get` when the key is not in the cache, so None can be cached as well
+MISSING = object()
+
+
+class LRUCache:
+    # `ttl` : seconds an entry is kept after it was added, None to keep it until it is evicted
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.expiry = {}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key, default=MISSING):
+        if key in self.entries:
+            if self.ttl is not None and self.expiry[key] <= time.time():
+                self.remove(key)
+                self.expired += 1
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        self.misses += 1
+        return default
+
+    # Add a value and evict the least recently used entries above `max_size`
+    def put(self, key, value, expires: float = None):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.ttl is not None:
+            self.expiry[key] = expires if expires is not None else time.time() + self.ttl
+        while len(self.entries) > self.max_size:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+        self.expiry.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.expiry.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+# LRU cache of JSON values in a SQLite file, kept across restarts
+# The least recently used rows above `max_size` are deleted. A cache can lose its last entries if the computer stops,
+# so the commits are not synced to disk (WAL with synchronous=NORMAL) and stay fast enough to be used from the event loop.
+class DiskCache:
+    def __init__(self, file_path: str, max_size: int, ttl: float = None):
+        self.file_path = file_path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        folder = os.path.dirname(file_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(file_path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+
+    # Value and expiry time of a key, MISSING if it is not in the cache or expired
+    def get_entry(self, key: str):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return MISSING, None
+            if row[1] is not None and row[1] <= now:
+                self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.expired += 1
+                self.misses += 1
+                return MISSING, None
+
+            self.connection.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0]), row[1]
+
+    def get(self, key: str, default=MISSING):
+        value, _ = self.get_entry(key)
+        return default if value is MISSING else value
+
+    def put(self, key: str, value, expires: float = None):
+        now = time.time()
+        if expires is None and self.ttl is not None:
+            expires = now + self.ttl
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            self.connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM cache")
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+# Memory LRU cache in front of an optional disk cache
+# A value found on disk is copied to memory with the expiry time it had on disk.
+class TieredCache:
+    def __init__(self, memory: LRUCache, disk: DiskCache = None):
+        self.memory = memory
+        self.disk = disk
+        self.lock = threading.Lock()
+
+    def get(self, key: str, default=MISSING):
+        with self.lock:
+            value = self.memory.get(key)
+        if value is not MISSING or self.disk is None:
+            return default if value is MISSING else value
+
+        value, expires = self.disk.get_entry(key)
+        if value is MISSING:
+            return default
+        with self.lock:
+            self.memory.put(key, value, expires)
+        return value
+
+    def put(self, key: str, value):
+        expires = time.time() + self.memory.ttl if self.memory.ttl is not None else None
+        with self.lock:
+            self.memory.put(key, value, expires)
+        if self.disk is not None:
+            self.disk.put(key, value, expires)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    # Hit rate of both tiers together, a request is a hit if either tier had the value
+    def stats(self):
+        memory = self.memory.stats()
+        disk = self.disk.stats() if self.disk is not None else None
+        requests = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + (disk["hits"] if disk else 0)
+        return {
+            "hits": hits,
+            "misses": requests - hits,
+            "hit_rate": hits / requests if requests else 0.0,
+            "memory": memory,
+            "disk": disk,
+        }
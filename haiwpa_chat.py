@@ -3,6 +3,7 @@ HAIWPA Chat Application
 
 A Gradio-based chat interface for interacting with the HAIWPA backend.
 It uses the HAIWPABackend class to handle chat functionality with the `chat_with_history` function.
+The answers are streamed to the chat while the model generates them.
 
 Source :
 - https://www.gradio.app/guides/creating-a-chatbot-fast
@@ -17,8 +18,12 @@ import config
 backend = HAIWPABackend()
 
 # Main function which is used to answer user prompts with message history
-async def chat_function(user_input, history):
-    return await backend.chat_with_history(user_input, history)
+# The Gradio session hash is used as user id so each user gets its own workout history
+# The answer is streamed : each yielded value replaces the message shown in the chat
+async def chat_function(user_input, history, request: gr.Request = None):
+    user_id = request.session_hash if request and request.session_hash else config.DEFAULT_USER_ID
+    async for answer in backend.chat_with_history(user_input, history, user_id):
+        yield answer
 
 
 def create_interface():
@@ -0,0 +1,215 @@
+"""
+HAIWPA Columnar History
+
+Optional columnar copy of the completed workouts of a user, for long-term analytics on years of sessions.
+A list of dicts of strings (as read from the store) is heavy in memory and slow to parse, so each field is saved
+as a NumPy column in its own `.npy` file, sorted by day :
+- days      : int32, days since 1970-01-01
+- muscles   : uint8, index in the muscle dictionary (the muscle_group/1 facts first, like `VectorRuleEngine`)
+- durations : float32, minutes
+- injured   : bool, an injury was reported
+- exercises : int32, index in the exercise dictionary
+
+The columns are opened with `numpy.load(mmap_mode="r")`, so opening the history of a user does not copy it
+and only the pages of the queried days are read. Date ranges are found by binary search on the day column.
+
+Each build is written to a new version folder, and the `CURRENT` file naming it is replaced at once,
+so a reader never opens a history that is half written.
+
+Source :
+- https://numpy.org/doc/stable/reference/generated/numpy.load.html
+- https://numpy.org/doc/stable/reference/generated/numpy.memmap.html
+- https://numpy.org/doc/stable/reference/generated/numpy.searchsorted.html
+
+Assistant : Claude
+"""
+
+from haiwpa_rules import load_rule_facts
+from haiwpa_records import epoch_day, day_timestamp
+from haiwpa_store import get_store, user_file_name
+import datetime
+import json
+import os
+import shutil
+import numpy as np
+import config
+
+
+COLUMNS = {
+    "days": np.int32,
+    "muscles": np.uint8,
+    "durations": np.float32,
+    "injured": np.bool_,
+    "exercises": np.int32,
+}
+
+
+# Day of a query date, like `epoch_day()` but an invalid date is an error
+def query_day(date_str: str) -> int:
+    day = epoch_day(date_str)
+    if day is None:
+        raise ValueError(f"Invalid date : {date_str}")
+    return day
+
+
+# Folder of the columnar history of a user, named like the context file of the user
+def history_folder_for(user_id: str = config.DEFAULT_USER_ID) -> str:
+    return os.path.join(config.COLUMNS_FOLDER, user_file_name(user_id))
+
+
+# Write the completed workouts of `entries` as a new version of the columnar history in `folder`
+# Entries that are not completed or without a valid date are ignored. It returns the number of sessions written.
+def write_history(folder: str, entries, rules_file: str = config.RULES_FILE) -> int:
+    muscle_names = list(load_rule_facts(rules_file)["muscle_groups"])
+    muscle_ids = {muscle: i for i, muscle in enumerate(muscle_names)}
+    exercise_names = []
+    exercise_ids = {}
+    rows = []
+
+    for entry in entries:
+        if entry.get("entry_type") != "completed":
+            continue
+        try:
+            day = epoch_day(entry["date"])
+            muscle = entry["muscle"].lower()
+        except (AttributeError, KeyError, TypeError):
+            continue
+        if day is None:
+            continue
+
+        # Muscles and exercises are saved as indexes in a dictionary of their names
+        if muscle not in muscle_ids:
+            muscle_ids[muscle] = len(muscle_names)
+            muscle_names.append(muscle)
+        exercise = str(entry.get("exercises") or "")
+        if exercise not in exercise_ids:
+            exercise_ids[exercise] = len(exercise_names)
+            exercise_names.append(exercise)
+
+        injuries = entry.get("injuries")
+        rows.append((day, muscle_ids[muscle], entry.get("duration") or 0, bool(injuries and injuries.strip()),
+                     exercise_ids[exercise]))
+
+    if len(muscle_names) > np.iinfo(np.uint8).max + 1:
+        raise ValueError(f"Too many muscle groups for a uint8 column : {len(muscle_names)}")
+
+    # A stable sort keeps the order of the sessions of the same day
+    rows.sort(key=lambda row: row[0])
+    columns = {name: np.array([row[i] for row in rows], dtype=dtype) for i, (name, dtype) in enumerate(COLUMNS.items())}
+
+    version = f"v{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}_{os.getpid()}"
+    version_folder = os.path.join(folder, version)
+    os.makedirs(version_folder)
+    for name, column in columns.items():
+        np.save(os.path.join(version_folder, f"{name}.npy"), column)
+    with open(os.path.join(version_folder, "dictionary.json"), "w") as f:
+        json.dump({"muscles": muscle_names, "exercises": exercise_names, "sessions": len(rows)}, f)
+
+    # The new version is only used once it is complete
+    temp_file = os.path.join(folder, f"CURRENT.{os.getpid()}.tmp")
+    with open(temp_file, "w") as f:
+        f.write(version)
+    previous = current_version(folder)
+    os.replace(temp_file, os.path.join(folder, "CURRENT"))
+
+    # Readers of the previous version keep their mapped files until they close them
+    if previous and previous != version:
+        shutil.rmtree(os.path.join(folder, previous), ignore_errors=True)
+
+    return len(rows)
+
+
+# Name of the version folder used by the readers, None if no history was written
+def current_version(folder: str):
+    try:
+        with open(os.path.join(folder, "CURRENT"), "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class ColumnarHistory:
+    def __init__(self, folder: str):
+        version = current_version(folder)
+        if version is None:
+            raise FileNotFoundError(f"No columnar history in {folder}")
+        version_folder = os.path.join(folder, version)
+
+        with open(os.path.join(version_folder, "dictionary.json"), "r") as f:
+            dictionary = json.load(f)
+        self.muscle_names = dictionary["muscles"]
+        self.exercise_names = dictionary["exercises"]
+
+        # Memory-mapped columns, nothing is read before a query uses them
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(version_folder, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.days)
+
+    # Positions of the sessions from `start` to `end` (dates, both included), found by binary search on the days
+    def day_range(self, start: str = None, end: str = None):
+        first = np.searchsorted(self.days, query_day(start), side="left") if start else 0
+        last = np.searchsorted(self.days, query_day(end), side="right") if end else len(self.days)
+        return slice(first, last)
+
+    # Columns of the sessions from `start` to `end`, as views of the mapped files
+    def sessions(self, start: str = None, end: str = None):
+        positions = self.day_range(start, end)
+        return {name: getattr(self, name)[positions] for name in COLUMNS}
+
+    # Number of sessions, total duration and number of injuries of each muscle from `start` to `end`
+    def summary(self, start: str = None, end: str = None):
+        sessions = self.sessions(start, end)
+        size = len(self.muscle_names)
+        counts = np.bincount(sessions["muscles"], minlength=size)
+        durations = np.bincount(sessions["muscles"], weights=sessions["durations"], minlength=size)
+        injuries = np.bincount(sessions["muscles"], weights=sessions["injured"], minlength=size)
+
+        return {
+            muscle: {"sessions": int(counts[i]), "duration": float(durations[i]), "injuries": int(injuries[i])}
+            for i, muscle in enumerate(self.muscle_names)
+            if counts[i]
+        }
+
+    # Latest workout and injury timestamp of each muscle of `muscles` up to `end`, NaN if none
+    # The result can be given to `VectorRuleEngine.evaluate()` instead of `history_arrays()`. The timestamps are the
+    # local midnights of the days (`day_timestamp()`), like the dates converted by `convert_date_to_timestamp()`.
+    def last_timestamps(self, muscles, end: str = None):
+        sessions = self.sessions(end=end)
+        days, inverse = np.unique(sessions["days"], return_inverse=True)
+        timestamps = np.array([day_timestamp(int(day)) for day in days], dtype=float)[inverse]
+        size = len(self.muscle_names)
+
+        last_trained = np.full(size, np.nan)
+        last_injury = np.full(size, np.nan)
+        np.fmax.at(last_trained, sessions["muscles"], timestamps)
+        np.fmax.at(last_injury, sessions["muscles"][sessions["injured"]], timestamps[sessions["injured"]])
+
+        # Reordered like `muscles`, a muscle missing from the dictionary has no history
+        order = [self.muscle_names.index(muscle) if muscle in self.muscle_names else size for muscle in muscles]
+        last_trained = np.append(last_trained, np.nan)[order]
+        last_injury = np.append(last_injury, np.nan)[order]
+        return last_trained, last_injury
+
+
+# Build the columnar history of a user from the store selected by `config.CONTEXT_STORE`
+def build_user_history(user_id: str = config.DEFAULT_USER_ID) -> int:
+    sessions = get_store().sessions(user_id, entry_type="completed")
+    count = write_history(history_folder_for(user_id), sessions)
+    print(f"Built the columnar history of {user_id} : {count} sessions")
+    return count
+
+
+def open_user_history(user_id: str = config.DEFAULT_USER_ID) -> ColumnarHistory:
+    return ColumnarHistory(history_folder_for(user_id))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["build"]:
+        for user_id in sys.argv[2:] or get_store().user_ids():
+            build_user_history(user_id)
+    else:
+        print("Usage : python haiwpa_columnar.py build [user_id ...]")
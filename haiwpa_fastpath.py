@@ -0,0 +1,295 @@
+"""
+HAIWPA Fast Path Extraction
+
+Rule-based extraction of the workout sessions of simple messages such as "I trained chest yesterday",
+tried by the backend before the LLM extraction, which is a full generation with up to three Instructor retries.
+
+The vocabulary is the one of the Prolog rules (`muscle_group/1` and `exercise/2` facts of `workout_rules.pl`)
+and `config.MUSCLE_ALIASES`. The rules read :
+- the muscles and exercises, an exercise gives its muscle group
+- the dates : today, yesterday, tomorrow, N days ago, in N days, DD.MM.YYYY, DD/MM/YYYY and YYYY-MM-DD
+- the tense : the session is completed if it is in the past, planned if it is in the future
+- the duration : N minutes, N hours, an hour
+
+`planning_request()` reads the planning requests to the assistant ("Plan my next 5 days for chest and legs") with the
+same vocabulary, "I plan to train legs" is a session of the user. The requests are answered with the `plan_workouts`
+MCP tool instead of being saved as sessions.
+
+Each extraction has a confidence from 0 to 1. Messages the rules cannot read safely (injuries, negations,
+several dates, weekdays, no tense, questions about past sessions, "back" that may not be the muscle...)
+get a low confidence and are sent to the LLM extraction.
+
+Source :
+- https://docs.python.org/3/library/re.html
+- https://docs.python.org/3/library/datetime.html#date-objects
+
+Assistant : Claude
+"""
+
+from haiwpa_rules import load_rule_facts
+from haiwpa_workout import FitnessExtract
+from functools import lru_cache
+import datetime
+import re
+import config
+
+
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+           "eight": 8, "nine": 9, "ten": 10}
+NUMBER = r"(\d+|" + "|".join(NUMBERS) + r")"
+
+# Relative dates, in the order they are searched : the longest expressions first
+RELATIVE_DATES = [
+    (re.compile(r"\bday before yesterday\b"), lambda match: -2),
+    (re.compile(r"\bday after tomorrow\b"), lambda match: 2),
+    (re.compile(rf"\b{NUMBER} days? ago\b"), lambda match: -number(match.group(1))),
+    (re.compile(rf"\bin {NUMBER} days?\b"), lambda match: number(match.group(1))),
+    (re.compile(r"\b(a|one) week ago\b"), lambda match: -7),
+    (re.compile(r"\bin (a|one) week\b"), lambda match: 7),
+    (re.compile(r"\byesterday\b"), lambda match: -1),
+    (re.compile(r"\btomorrow\b"), lambda match: 1),
+    (re.compile(r"\b(today|tonight|this morning|this afternoon|this evening)\b"), lambda match: 0),
+]
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+EU_DATE = re.compile(r"\b(\d{1,2})[./](\d{1,2})[./](\d{4})\b")
+# Dates the rules do not compute, the LLM is used for them
+OTHER_DATES = re.compile(
+    r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend|week|month|last|next|ago|"
+    r"january|february|march|april|may|june|july|august|september|october|november|december)\b"
+    r"|\b\d{1,2}[./-]\d{1,2}\b"
+)
+
+PAST = re.compile(
+    r"\b(trained|did|worked|hit|was|were|went|finished|completed|done|had|yesterday|ago)\b"
+)
+FUTURE = re.compile(
+    r"\b(will|going to|gonna|plan|planning|want to|wanna|can i|could i|should i|shall i|tomorrow|later)\b"
+)
+TRAINING = re.compile(
+    r"\b(train\w*|work(ed|ing)? out|workouts?|session|exercis\w*|lift\w*|gym|hit|did|do|doing)\b"
+)
+NEGATION = re.compile(r"\b(not|no|never|skip\w*|without|cancel\w*|\w+n't|dont|didnt|cant|wont)\b")
+INJURY = re.compile(r"\b(pain\w*|injur\w*|hurt\w*|sore|strain\w*|sprain\w*|ache\w*|tendinitis|tendonitis)\b")
+# Questions : "Was it ok to train legs today?" asks about a session, it does not say it was done
+QUESTION = re.compile(r"\?|^(was|were|is|are|am|can|could|should|shall|may|did|do|does|will|would)\b")
+# Muscle names that are also common words ("I'm back"), only read as a muscle right after a training verb, "my"
+# or an exercise
+AMBIGUOUS_MUSCLES = {"back"}
+# Planning questions : a request to the assistant ("Plan my next 5 days", "Can you make me a schedule for the week"),
+# a plan word and a number of days
+PLANNING = re.compile(r"\b(plan|planning|schedule|program|programme|routine)\b")
+PLAN_REQUEST = re.compile(
+    r"^(?:(?:hey|hi|ok|okay|so),?\s+)?(?:please\s+)?"
+    r"(?:(?:can|could|would|will)\s+you\s+(?:please\s+)?|i\s+(?:need|want|would like)\s+you\s+to\s+|help\s+me\s+)?"
+    r"(?:plan|schedule|make|create|build|give|design|prepare|suggest|write|generate|set\s+up)\b"
+    r"|^what(?:\s+is|'s|\s+should\s+be)\s+my\s+(?:\w+\s+)?(?:plan|schedule|program|programme|routine)\b"
+)
+# "I plan to train legs in 3 days" is a session of the user, not a request for a plan
+OWN_PLAN = re.compile(r"\b(plan|plans|planning|planned)\s+(to|on)\b")
+PLAN_DAYS = re.compile(rf"\b{NUMBER} days?\b|\b(week|weekly)\b")
+DURATION = re.compile(r"\b(\d+(?:\.\d+)?|an?|half an?)\s*(hours?|hrs?|h|minutes?|mins?)\b")
+
+
+def number(text: str) -> int:
+    return NUMBERS[text] if text in NUMBERS else int(text)
+
+
+# Pattern of an exercise name, also matching the singular ("squat") and the dashed forms ("push-ups")
+def exercise_pattern(name: str) -> str:
+    words = name.split()
+    last = words[-1]
+    if last.endswith(("ches", "shes", "xes", "sses")):
+        last = last[:-2]
+    elif last.endswith("s"):
+        last = last[:-1]
+    words = [re.escape(word) for word in words[:-1]] + [re.escape(last) + "(?:es|s)?"]
+    return r"\b" + r"[\s-]?".join(words) + r"\b"
+
+
+# Patterns of the exercises (longest names first, so "leg curls" is found before "curls") and of the muscles
+# The vocabulary of the rules is read once.
+@lru_cache(maxsize=None)
+def vocabulary(rules_file: str = config.RULES_FILE):
+    facts = load_rule_facts(rules_file)
+    exercises = [
+        (re.compile(exercise_pattern(exercise)), exercise, muscle)
+        for exercise, muscle in sorted(facts["exercises"].items(), key=lambda item: -len(item[0]))
+    ]
+    names = {muscle: muscle for muscle in facts["muscle_groups"]}
+    names.update({alias: muscle for alias, muscle in config.MUSCLE_ALIASES.items() if muscle in names})
+    muscles = [(re.compile(rf"\b{re.escape(name)}\b"), name, muscle) for name, muscle in names.items()]
+    return exercises, muscles
+
+
+# Replace the matched text with spaces, so it is not matched again by a shorter pattern
+def blank(text: str, match) -> str:
+    return text[: match.start()] + " " * (match.end() - match.start()) + text[match.end() :]
+
+
+# Dates found in the message, as offsets from today or dates, with the message without them
+def find_dates(text: str, today: datetime.date):
+    dates = []
+    for pattern, to_date in (
+        (ISO_DATE, lambda m: datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))),
+        (EU_DATE, lambda m: datetime.date(int(m.group(3)), int(m.group(2)), int(m.group(1)))),
+    ):
+        for match in list(pattern.finditer(text)):
+            try:
+                dates.append(to_date(match))
+            except ValueError:
+                return None, text
+            text = blank(text, match)
+
+    for pattern, offset in RELATIVE_DATES:
+        for match in list(pattern.finditer(text)):
+            dates.append(today + datetime.timedelta(days=offset(match)))
+            text = blank(text, match)
+
+    return dates, text
+
+
+# Total duration of the message in minutes, None if several durations are given
+def find_duration(text: str):
+    durations = []
+    for amount, unit in DURATION.findall(text):
+        value = 0.5 if amount.startswith("half") else 1.0 if amount in ("a", "an") else float(amount)
+        durations.append(value * 60 if unit.startswith("h") else value)
+    if len(durations) > 1:
+        return None
+    return durations[0] if durations else 0.0
+
+
+# True if the word before `start` is a training verb or "my", or if an exercise ends right before it
+def follows_training_word(text: str, start: int, exercise_ends) -> bool:
+    before = text[:start]
+    if any(not before[end:].strip() for end in exercise_ends):
+        return True
+    words = before.split()
+    return bool(words) and (words[-1] == "my" or bool(TRAINING.fullmatch(words[-1])))
+
+
+# Sessions of the muscles of the message, with their exercises, in the order they are mentioned
+# It also returns True if an ambiguous muscle name was found without a training word before it.
+def find_sessions(text: str, rules_file: str = config.RULES_FILE):
+    exercises, muscles = vocabulary(rules_file)
+    found = []
+    exercise_ends = []
+    ambiguous = False
+
+    for pattern, exercise, muscle in exercises:
+        for match in list(pattern.finditer(text)):
+            found.append((match.start(), muscle, exercise))
+            exercise_ends.append(match.end())
+            text = blank(text, match)
+    for pattern, name, muscle in muscles:
+        for match in pattern.finditer(text):
+            if name in AMBIGUOUS_MUSCLES and not follows_training_word(text, match.start(), exercise_ends):
+                ambiguous = True
+                continue
+            found.append((match.start(), muscle, None))
+
+    sessions = {}
+    for _, muscle, exercise in sorted(found, key=lambda item: item[0]):
+        session = sessions.setdefault(muscle, [])
+        if exercise and exercise not in session:
+            session.append(exercise)
+    return sessions, ambiguous
+
+
+# Sessions of a simple message and the confidence of the extraction (0 to 1)
+# It returns ([], 0.0) when the message cannot be read by the rules, the LLM extraction is used for it.
+def fast_extract(message: str, today: datetime.date = None, rules_file: str = config.RULES_FILE):
+    today = today or datetime.date.today()
+    text = " ".join(message.lower().replace("’", "'").split())
+
+    # Injuries and negations change the meaning of the sessions, they are left to the LLM
+    if INJURY.search(text) or NEGATION.search(text):
+        return [], 0.0
+
+    duration = find_duration(text)
+    dates, text = find_dates(text, today)
+    # Durations are removed first, "1.5 hours" is not a date
+    if duration is None or dates is None or len(set(dates)) > 1 or OTHER_DATES.search(DURATION.sub(" ", text)):
+        return [], 0.0
+    date = dates[0] if dates else today
+
+    sessions, ambiguous = find_sessions(text, rules_file)
+    if not sessions:
+        return [], 0.5 if ambiguous else 0.0
+
+    past = bool(PAST.search(text)) or date < today
+    future = bool(FUTURE.search(text)) or date > today
+    if past == future:
+        # Both tenses contradict each other ("I will train legs yesterday"), no tense does not tell if it was done
+        return [], 0.0 if past else 0.5
+
+    # A question about a past session ("Was it ok to train legs today?") does not say it was done
+    if past and QUESTION.search(text):
+        return [], 0.0
+
+    confidence = 1.0
+    # "I'm back at the gym" may or may not be a back session, "my legs" does not say that a muscle was trained
+    if ambiguous:
+        confidence -= 0.5
+    if not TRAINING.search(text) and not any(sessions.values()):
+        confidence -= 0.5
+    if len(message.split()) > config.FAST_PATH_MAX_WORDS:
+        confidence -= 0.5
+
+    extracted = [
+        FitnessExtract(
+            muscle=muscle,
+            exercises=", ".join(exercises),
+            duration=duration,
+            date=date.isoformat(),
+            injuries="",
+            entry_type="completed" if past else "planned",
+        )
+        for muscle, exercises in sessions.items()
+    ]
+    return extracted, confidence
+
+
+# Number of days, start date and muscle groups of a planning question, None if the message is not one
+# Only a request to the assistant is a planning question, "I plan to train legs in 3 days" is extracted as a session.
+# All the muscle groups of the rules are planned when the message names none. "back" is always a muscle here.
+def planning_request(message: str, today: datetime.date = None, rules_file: str = config.RULES_FILE):
+    today = today or datetime.date.today()
+    text = " ".join(message.lower().replace("’", "'").split())
+    if not PLANNING.search(text) or not PLAN_REQUEST.search(text) or OWN_PLAN.search(text):
+        return None
+
+    # Durations are removed first, "a plan for 1.5 hours" does not give days
+    days = PLAN_DAYS.search(DURATION.sub(" ", text))
+    if days is None:
+        return None
+    days = number(days.group(1)) if days.group(1) else 7
+
+    dates, text = find_dates(text, today)
+    start = dates[0] if dates and len(set(dates)) == 1 else today
+
+    exercises, muscles = vocabulary(rules_file)
+    found = []
+    for pattern, _, muscle in exercises:
+        for match in list(pattern.finditer(text)):
+            found.append((match.start(), muscle))
+            text = blank(text, match)
+    for pattern, _, muscle in muscles:
+        found.extend((match.start(), muscle) for match in pattern.finditer(text))
+    targets = list(dict.fromkeys(muscle for _, muscle in sorted(found)))
+    if not targets:
+        targets = list(load_rule_facts(rules_file)["muscle_groups"])
+
+    return {"start_date": start.isoformat(), "days": days, "targets": targets}
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        sessions, confidence = fast_extract(" ".join(sys.argv[1:]))
+        print(f"Confidence : {confidence}")
+        for session in sessions:
+            session.print_extracted_info()
+    else:
+        print('Usage : python haiwpa_fastpath.py "I trained chest yesterday"')
@@ -14,29 +14,49 @@ Assistant : Claude
 
 from fastmcp import FastMCP
 from pyswip import Prolog
-from datetime import datetime
-import json
+from datetime import timedelta
+from collections import OrderedDict
+from haiwpa_workout import context_entry
+from haiwpa_writer import BackgroundWriter
+from haiwpa_store import FileStore, get_store, save_entries, group_committer, parse_date, retention_cutoff, is_stale_entry
+from haiwpa_pool import PrologWorkerPool
+from haiwpa_prolog import Out, solutions, run, load_compiled
+from haiwpa_cache import LRUCache, MISSING
+from haiwpa_records import record_from_dict
+import atexit
+import hashlib
+import itertools
 import config
-import os
+import time
 
 
 mcp = FastMCP("HAIWPA MCP Server")
+
+# Startup time of the Prolog engine, reported by the `server_stats` MCP tool
+startup_started = time.perf_counter()
 prolog = Prolog()
 
-# Load Prolog knowledge base
-prolog.consult("workout_rules.pl")
+# Load Prolog knowledge base, from its compiled form if enabled
+if config.PRECOMPILED_RULES:
+    rules_compiled = load_compiled(config.RULES_FILE)
+else:
+    prolog.consult(config.RULES_FILE)
+    rules_compiled = False
+
+startup_stats = {
+    "startup_seconds": time.perf_counter() - startup_started,
+    "precompiled_rules": config.PRECOMPILED_RULES,
+    "rules_compiled": rules_compiled,
+}
+print(f"Prolog rules loaded in {startup_stats['startup_seconds'] * 1000:.1f} ms")
 
 # Unit test to check if the connexion with Prolog worked
-list(prolog.query("connection_test."))
+run("user", "connection_test")
 
 
 # Used to convert a US date to UNIX timestamp
 def convert_date_to_timestamp(date_str: str):
-    # if date_str looks like "DD.MM.YYYY", convert it to the format "YYYY-MM-DD"
-    if "." in date_str:
-        day, month, year = date_str.split(".")
-        date_str = f"{year}-{month}-{day}"
-    dt = datetime.strptime(date_str, "%Y-%m-%d")
+    dt = parse_date(date_str)
     return int(dt.timestamp())  # Convert to UNIX timestamp
 
 # This function was used to format suggested workout alernatives (muscle groups) from Prolog query
@@ -50,157 +70,424 @@ def format_suggested_workout(suggested_workout):
     return res
 
 
+# Knowledge bases of the users, ordered from the least to the most recently used.
+# Each user has its own Prolog module containing its workout_history/injury facts,
+# the default user uses the `user` module in which workout_rules.pl is loaded.
+user_kbs = OrderedDict()
+
+# Version of the knowledge bases, a new one is taken each time facts are asserted or retracted.
+# A single counter is used for all users so a reloaded user never gets back an old version.
+kb_versions = itertools.count(1)
+
+# Context files written in the background after `ingest_sessions`
+context_writer = BackgroundWriter()
+
+# Number of calls of `load_json_workout_context()` by outcome, used to monitor the change detection
+# skipped : nothing saved since the last call, incremental : only the new entries asserted,
+# unchanged : source rewritten with the same content, reloaded : knowledge base cleared and fully asserted again
+context_loads = {"skipped": 0, "incremental": 0, "unchanged": 0, "reloaded": 0}
+
+# Validation and suggestion results, keyed by (kind, user, muscle, day, knowledge base version)
+# A result is reused as long as the knowledge base of the user did not change.
+validation_cache = LRUCache(config.VALIDATION_CACHE_SIZE)
+
+
+# Prolog module name of a user knowledge base
+def user_module(user_id: str):
+    if user_id == config.DEFAULT_USER_ID:
+        return "user"
+    return "kb_" + hashlib.md5(user_id.encode()).hexdigest()
+
+
+# Get the knowledge base of a user and create its Prolog module on demand
+# It also remembers which part of the user history has already been asserted into Prolog.
+# `source` is where the entries were read from (context file or database) and `count` the number of entries read.
+# `position` is returned by the store and gives where the next entries start, so only the appended ones are read.
+# `signature` and `content_hash` describe the source when it was last read, to skip reading it if it did not change.
+# `in_memory` is True once sessions are ingested directly : the knowledge base is then ahead of the store,
+# which is only written, and it is not read again until the user is evicted.
+def get_user_kb(user_id: str = config.DEFAULT_USER_ID):
+    if user_id in user_kbs:
+        user_kbs.move_to_end(user_id)
+        return user_kbs[user_id]
+
+    module = user_module(user_id)
+    run("user", "init_user_kb", module)
+
+    user_kb = {
+        "module": module,
+        "source": None,
+        "count": 0,
+        "position": None,
+        "signature": None,
+        "content_hash": None,
+        "planned_workout": [],
+        "in_memory": False,
+        "facts": 0,
+        "version": next(kb_versions),
+    }
+    user_kbs[user_id] = user_kb
+    return user_kb
+
+
+# Key of a result in `validation_cache`
+def validation_cache_key(kind: str, muscle: str, date: str, user_id: str):
+    version = get_user_kb(user_id)["version"]
+    return (kind, user_id, muscle.lower(), convert_date_to_timestamp(date), version)
+
+
+# Call a Prolog predicate in the module of a user knowledge base
+# The arguments are converted to terms by `haiwpa_prolog`, see `Out` for output arguments
+def kb_query(user_kb, name: str, *args):
+    return solutions(user_kb["module"], name, *args)
+
+
+# Evict the least recently used knowledge bases if there are too many users or facts loaded
+# The facts of an evicted user are loaded again from its context file on its next request.
+def evict_cold_users(keep_user_id: str):
+    total_facts = sum(user_kb["facts"] for user_kb in user_kbs.values())
+
+    for user_id in list(user_kbs):
+        if len(user_kbs) <= config.KB_MAX_USERS and total_facts <= config.KB_MAX_FACTS:
+            break
+        if user_id == keep_user_id:
+            continue
+
+        user_kb = user_kbs.pop(user_id)
+        kb_query(user_kb, "clear_history")
+        total_facts -= user_kb["facts"]
+
+
 # Prolog query to suggest alternative muscle groups to work on if there is an injury or insufficient rest
-def suggest_workout(muscle: str, date: str):
-    suggested_workout = list(
-        prolog.query(
-            f"suggest_alternative({muscle}, {convert_date_to_timestamp(date)}, AlternativeMuscle)."
-        )
+def suggest_workout(muscle: str, date: str, user_id: str = config.DEFAULT_USER_ID):
+    key = validation_cache_key("suggestion", muscle, date, user_id)
+    res = validation_cache.get(key)
+    if res is not MISSING:
+        return res
+
+    suggested_workout = kb_query(
+        get_user_kb(user_id),
+        "suggest_alternative",
+        muscle.lower(),
+        convert_date_to_timestamp(date),
+        Out("AlternativeMuscle"),
     )
     res = format_suggested_workout(suggested_workout)
+    validation_cache.put(key, res)
     return res
 
 
-# Load JSON workout context from file and assert into Prolog knowledge base
-def load_json_workout_context(file_path=config.CONTEXT_FILE):
-    # Check if file exists
-    if not os.path.exists(file_path):
-        return
+# Clearing previous data of a user in SWI-Prolog and forgetting what was already ingested
+def clear_workout_context(user_kb):
+    kb_query(user_kb, "clear_history")
 
-    # Clearing previous data in SWI-Prolog
-    list(prolog.query("retractall(workout_history(_, _, _, _))."))
-    list(prolog.query("retractall(injury(_, _))."))
+    user_kb["source"] = None
+    user_kb["count"] = 0
+    user_kb["position"] = None
+    user_kb["signature"] = None
+    user_kb["content_hash"] = None
+    user_kb["planned_workout"] = []
+    user_kb["facts"] = 0
+    user_kb["version"] = next(kb_versions)
 
-    planned_workout = []
 
-    # Load JSON data
-    with open(file_path, "r") as f:
-        data = json.load(f)
+# Assert a single workout record into the user knowledge base or add it to its planned workouts list
+# The record (haiwpa_records.py) was decoded once from the store, its date is already parsed.
+def ingest_workout_entry(user_kb, record):
+    muscle = record.muscle_name
 
-    # JSON data parsing
-    for entry in data:
-        date = entry["date"]
-        muscle = entry["muscle"].lower()
-        exercises = entry["exercises"]
-        duration = entry["duration"]
-        injuries = entry["injuries"]
-        entry_type = entry["entry_type"]
+    # Checking if there is at least a date and muscle group
+    if record.day is None or not muscle:
+        return
 
-        # Checking if there is at least a date and muscle group
-        if not date or not muscle:
-            continue
+    # Workout history assertion to Prolog
+    if record.entry_type == "completed":
+        kb_query(
+            user_kb,
+            "record_workout",
+            record.unix_time,
+            muscle,
+            record.exercises,
+            record.duration,
+        )
+        user_kb["facts"] += 1
+        user_kb["version"] = next(kb_versions)
+
+        # Injuries assertion to Prolog
+        if record.injuries.strip():
+            kb_query(user_kb, "record_injury", record.unix_time, muscle)
+            user_kb["facts"] += 1
+            user_kb["version"] = next(kb_versions)
+
+    # Planned workouts list
+    elif record.entry_type == "planned":
+        user_kb["planned_workout"].append(
+            {
+                "date": record.date,
+                "muscle": muscle,
+                "exercises": record.exercises,
+                "duration": record.duration,
+                "injuries": record.injuries,
+                "entry_type": record.entry_type_name,
+            }
+        )
 
-        # Workout history assertion to Prolog
-        if entry_type == "completed":
-            query = f"assertz(workout_history({convert_date_to_timestamp(date)}, '{muscle}', '{exercises}', {duration}))"
-            list(prolog.query(query))
-
-            # Injuries assertion to Prolog
-            if injuries and injuries.strip():
-                query = (
-                    f"assertz(injury({convert_date_to_timestamp(date)}, '{muscle}'))"
-                )
-                list(prolog.query(query))
-
-        # Planned workouts list
-        elif entry_type == "planned":
-            planned_workout.append(
-                {
-                    "date": date,
-                    "muscle": muscle,
-                    "exercises": exercises,
-                    "duration": duration,
-                    "injuries": injuries,
-                    "entry_type": entry_type,
-                }
-            )
-
-    return planned_workout
+# Load the workout history of a user from its store and assert it into the user Prolog knowledge base
+# By default, the store selected by `config.CONTEXT_STORE` is used, `file_path` reads a given context file instead.
+# In incremental mode, only the entries appended since the last call are asserted.
+# A full reload is done if the file has been rewritten (e.g. cleared or edited by hand).
+# Nothing is read if the signature of the source (size, modification time, ...) did not change since the last call,
+# and nothing is asserted again if a rewritten source has the same content hash.
+# With `config.HISTORY_RETENTION`, completed workouts older than the retention window are not asserted.
+def load_json_workout_context(
+    file_path=None,
+    incremental=config.INCREMENTAL_INGESTION,
+    user_id=config.DEFAULT_USER_ID,
+):
+    # Sessions ingested directly are already asserted
+    user_kb = user_kbs.get(user_id)
+    if user_kb and user_kb["in_memory"] and file_path is None:
+        user_kbs.move_to_end(user_id)
+        return list(user_kb["planned_workout"])
+
+    store = get_store() if file_path is None else FileStore(lambda _: file_path)
+
+    # The pending writes of the store are done before reading it
+    context_writer.flush()
+
+    user_kb = get_user_kb(user_id)
+    source = store.source(user_id)
+    signature = store.signature(user_id)
+
+    # Nothing was saved since the last call, the knowledge base is up to date
+    if user_kb["source"] == source and user_kb["signature"] == signature:
+        context_loads["skipped"] += 1
+        return list(user_kb["planned_workout"])
+
+    # Only the entries appended since the last call are read, all of them if the source was rewritten
+    position = user_kb["position"] if incremental and user_kb["source"] == source else None
+    new_entries, position, appended = store.read_new_records(user_id, position)
+
+    content_hash = None
+    if appended:
+        context_loads["incremental"] += 1
+    else:
+        # The hash is only kept if nothing was saved while the source was read
+        content_hash = store.content_hash(user_id)
+        if store.signature(user_id) != signature:
+            content_hash = None
+
+        # Rewritten with the same content (e.g. touched or copied back), the asserted facts are kept
+        if content_hash is not None and user_kb["source"] == source and user_kb["content_hash"] == content_hash:
+            context_loads["unchanged"] += 1
+            user_kb["signature"] = signature
+            user_kb["position"] = position
+            return list(user_kb["planned_workout"])
+
+        context_loads["reloaded"] += 1
+        clear_workout_context(user_kb)
+
+    user_kb["source"] = source
+    user_kb["count"] += len(new_entries)
+    user_kb["position"] = position
+    user_kb["signature"] = signature
+    user_kb["content_hash"] = content_hash
+
+    if config.HISTORY_RETENTION:
+        cutoff = retention_cutoff(user_kb["planned_workout"] + new_entries)
+        new_entries = [entry for entry in new_entries if not is_stale_entry(entry, cutoff)]
+
+    # Records assertion
+    for entry in new_entries:
+        ingest_workout_entry(user_kb, entry)
+
+    evict_cold_users(user_id)
+
+    return list(user_kb["planned_workout"])
+
+
+# Build the validation answer sent to the LLM from a `can_workout` reason
+# It returns {"approved": bool, "reason": str}
+def build_validation(muscle: str, reason: str, suggested_workout_res: str = "", injured_muscle_name=None):
+    # Workout allowed
+    if reason == "workout_allowed":
+        return {"approved": True, "reason": f"Approved for the muscle ({muscle})."}
+
+    # Present injury on a muscle that we want to retrain
+    elif reason == "injury_present":
+        return {
+            "approved": False,
+            "reason": f"An injury is present. Suggested alternatives : {suggested_workout_res}",
+        }
+
+    # If one of the muscles that is often trained together with the target muscle is injured
+    elif reason == "trained_together_injured":
+        # Check if we can extract the injured muscle name
+        if not injured_muscle_name:
+            return {
+                "approved": False,
+                "reason": f"Not possible to train {muscle}, because a muscle that is often trained with it is injured. Suggested alternatives : {suggested_workout_res}",
+            }
+        return {
+            "approved": False,
+            "reason": f"Not possible to train {muscle}, because the muscle {injured_muscle_name} that is often trained with it is injured. Suggested alternatives : {suggested_workout_res}",
+        }
+
+    # Not enough rest since last training
+    elif reason == "insufficient_rest":
+        return {
+            "approved": False,
+            "reason": f"Insufficient rest on the muscle group. Suggested alternatives : {suggested_workout_res}",
+        }
+
+    # Default return
+    return {"approved": False, "reason": "Unknown reason"}
 
 
 # Validate if a workout for a specific muscle group is allowed on a given date (yes/no).
+# The result is cached until the knowledge base of the user changes.
 # It returns {"approved": bool, "reason": str}
-def validate_single_workout(muscle: str, date: str):
+def validate_single_workout(muscle: str, date: str, user_id: str = config.DEFAULT_USER_ID):
+    key = validation_cache_key("validation", muscle, date, user_id)
+    validation = validation_cache.get(key)
+
+    if validation is MISSING:
+        validation = query_single_workout(muscle, date, user_id)
+        validation_cache.put(key, validation)
+
+    # Copy so the caller cannot modify the cached result
+    return dict(validation)
+
+
+# Prolog queries used by `validate_single_workout`
+def query_single_workout(muscle: str, date: str, user_id: str = config.DEFAULT_USER_ID):
     # All atoms/muscles groups, etc. are in lowercase in SWI-Prolog
     muscle = muscle.lower()
+    user_kb = get_user_kb(user_id)
 
     # Checking if muscle group is valid
-    if not list(prolog.query(f"muscle_group({muscle}).")):
+    if not kb_query(user_kb, "muscle_group", muscle):
         return {"approved": False, "reason": "invalid_muscle_group"}
 
-    query = f"can_workout({muscle}, {convert_date_to_timestamp(date)}, Reason)."
-    results = list(prolog.query(query))
+    results = kb_query(
+        user_kb, "can_workout", muscle, convert_date_to_timestamp(date), Out("Reason")
+    )
 
-    if results:
-        reason = results[0]["Reason"]
-        print(f"Prolog result : {reason}")
+    if not results:
+        return build_validation(muscle, None)
 
-        # Workout allowed
-        if reason == "workout_allowed":
-            return {"approved": True, "reason": f"Approved for the muscle ({muscle})."}
-        
-        # Present injury on a muscle that we want to retrain
-        elif reason == "injury_present":
-            suggested_workout_res = suggest_workout(muscle, date)
-            return {
-                "approved": False,
-                "reason": f"An injury is present. Suggested alternatives : {suggested_workout_res}",
-            }
-        
-        # If one of the muscles that is often trained together with the target muscle is injured 
-        elif reason == "trained_together_injured":
-            suggested_workout_res = suggest_workout(muscle, date)
-            injured_muscle = list(
-                prolog.query(
-                    f"trained_together_has_injury({muscle}, {convert_date_to_timestamp(date)}, InjuredMuscle)."
-                )
-            )
-
-            # Check if we can extract the injured muscle name
-            if not injured_muscle:
-                return {
-                    "approved": False,
-                    "reason": f"Not possible to train {muscle}, because a muscle that is often trained with it is injured. Suggested alternatives : {suggested_workout_res}",
-                }
-            else:
-                # Extracting the injured muscle name
-                injured_muscle_name = injured_muscle[0]["InjuredMuscle"]
-                return {
-                    "approved": False,
-                    "reason": f"Not possible to train {muscle}, because the muscle {injured_muscle_name} that is often trained with it is injured. Suggested alternatives : {suggested_workout_res}",
-                }
-
-        # Not enough rest since last training
-        elif reason == "insufficient_rest":
-            suggested_workout_res = suggest_workout(muscle, date)
-            return {
-                "approved": False,
-                "reason": f"Insufficient rest on the muscle group. Suggested alternatives : {suggested_workout_res}",
-            }
+    reason = results[0]["Reason"]
+    print(f"Prolog result : {reason}")
 
-    # Default return
-    return {"approved": False, "reason": "Unknown reason"}
+    if reason == "workout_allowed":
+        return build_validation(muscle, reason)
+
+    suggested_workout_res = suggest_workout(muscle, date, user_id)
+    injured_muscle_name = None
+
+    if reason == "trained_together_injured":
+        injured_muscle = kb_query(
+            user_kb,
+            "trained_together_has_injury",
+            muscle,
+            convert_date_to_timestamp(date),
+            Out("InjuredMuscle"),
+        )
+        # Extracting the injured muscle name
+        if injured_muscle:
+            injured_muscle_name = injured_muscle[0]["InjuredMuscle"]
+
+    return build_validation(muscle, reason, suggested_workout_res, injured_muscle_name)
+
+
+# Validate a list of planned workouts with a single Prolog query (`validate_batch/2`)
+# instead of several queries per workout. Only the workouts missing from the cache are sent to Prolog.
+# It returns a list of {"approved": bool, "reason": str} in the same order as `workouts`
+def validate_workouts_batch(workouts, user_id: str = config.DEFAULT_USER_ID):
+    keys = [
+        validation_cache_key("validation", workout["muscle"], workout["date"], user_id)
+        for workout in workouts
+    ]
+    validations = [validation_cache.get(key) for key in keys]
+    missing = [i for i, validation in enumerate(validations) if validation is MISSING]
+
+    if missing:
+        # Muscle-Date pairs
+        pairs = [
+            (workouts[i]["muscle"].lower(), convert_date_to_timestamp(workouts[i]["date"]))
+            for i in missing
+        ]
+        results = kb_query(get_user_kb(user_id), "validate_batch", pairs, Out("Results"))
+
+        for i, result in zip(missing, results[0]["Results"]):
+            validations[i] = batch_result_to_validation(result)
+            validation_cache.put(keys[i], validations[i])
+
+    # Copy so the caller cannot modify the cached results
+    return [dict(validation) for validation in validations]
+
+
+# Assert the sessions extracted by the backend directly into the knowledge base of a user
+# The read of `load_json_workout_context()` is avoided, the store is only written in the background.
+def ingest_user_sessions(sessions, user_input: str = "", user_id: str = config.DEFAULT_USER_ID):
+    # The history saved before is loaded once, the knowledge base is then kept up to date in memory
+    load_json_workout_context(user_id=user_id)
+    user_kb = get_user_kb(user_id)
+
+    # The knowledge base is only marked as ahead of the store once every session is asserted and its write submitted.
+    # If the ingestion fails, the backend saves the sessions itself : the knowledge base is cleared so the next load
+    # reads the store again instead of keeping a partial, stale history.
+    entries = [context_entry(session, user_input) for session in sessions]
+    try:
+        for entry in entries:
+            ingest_workout_entry(user_kb, record_from_dict(entry))
+
+        if entries:
+            user_kb["count"] += len(entries)
+            context_writer.submit(save_entries, user_id, entries)
+    except Exception:
+        clear_workout_context(user_kb)
+        user_kb["in_memory"] = False
+        raise
+
+    user_kb["in_memory"] = True
+    return {"ingested": len(entries)}
+
+
+# Convert a `validate_batch/2` result to {"approved": bool, "reason": str}
+def batch_result_to_validation(result):
+    muscle, _, reason, injured_muscle, alternatives = result
+    print(f"Prolog result : {reason}")
+
+    if reason == "invalid_muscle_group":
+        return {"approved": False, "reason": "invalid_muscle_group"}
+
+    injured_muscle_name = None if injured_muscle == "none" else injured_muscle
+    return build_validation(muscle, reason, ", ".join(alternatives), injured_muscle_name)
 
 
-# MCP Tool to validate all planned workouts from the JSON context file
+# Validate all planned workouts from the JSON context file of a user
 # It returns a list of validation results for each planned workout
-@mcp.tool()
-def validate_all_planned_workouts():
-    planned_workouts = load_json_workout_context()
+def validate_planned_workouts(user_id: str = config.DEFAULT_USER_ID):
+    planned_workouts = load_json_workout_context(user_id=user_id)
     results = []
-    max_rest_days = 0
+    max_rest_days = None
 
     if not planned_workouts:
         return results
 
     # Getting the max rest from Prolog
-    max_rest_days_query = list(prolog.query("suggested_rest_days(MaxRestDays)."))
-    max_rest_days = max_rest_days_query[0]["MaxRestDays"]
-    if not max_rest_days:
-        max_rest_days = 1
+    # It fails for a user without completed workouts : there is no rest day limit and max_rest_days stays None
+    max_rest_days_query = kb_query(
+        get_user_kb(user_id), "suggested_rest_days", Out("MaxRestDays")
+    )
+    if max_rest_days_query:
+        max_rest_days = max_rest_days_query[0]["MaxRestDays"] or 1
 
-    for workout in planned_workouts:
-        validation = validate_single_workout(workout["muscle"], workout["date"])
+    # All planned workouts are validated in a single Prolog query
+    validations = validate_workouts_batch(planned_workouts, user_id)
+
+    for workout, validation in zip(planned_workouts, validations):
         results.append(
             {
                 "date": workout["date"],
@@ -216,5 +503,110 @@ def validate_all_planned_workouts():
 
     return results
 
+
+# Plan the workouts of a user for `days` days from `start_date` with a single CLP(FD) search (`plan_workouts/5`)
+# It returns {"plan": [{"date": str, "muscles": [str]}], "invalid_targets": [str]}
+def plan_user_workouts(start_date: str, days: int, targets, user_id: str = config.DEFAULT_USER_ID):
+    load_json_workout_context(user_id=user_id)
+    user_kb = get_user_kb(user_id)
+
+    days = max(0, min(days, config.PLAN_MAX_DAYS))
+    dates = [parse_date(start_date) + timedelta(days=i) for i in range(days)]
+
+    # Unknown muscle groups cannot be planned
+    targets = list(dict.fromkeys(target.lower() for target in targets))
+    valid_targets = [target for target in targets if kb_query(user_kb, "muscle_group", target)]
+    invalid_targets = [target for target in targets if target not in valid_targets]
+
+    day_muscles = [[] for _ in dates]
+    if dates and valid_targets:
+        results = kb_query(
+            user_kb,
+            "plan_workouts",
+            [int(date.timestamp()) for date in dates],
+            valid_targets,
+            config.PLAN_MAX_MUSCLES_PER_DAY,
+            float(config.PLAN_TIME_LIMIT),
+            Out("Plan"),
+        )
+        if results:
+            day_muscles = results[0]["Plan"]
+
+    return {
+        "plan": [
+            {"date": date.strftime("%Y-%m-%d"), "muscles": muscles}
+            for date, muscles in zip(dates, day_muscles)
+        ],
+        "invalid_targets": invalid_targets,
+    }
+
+
+# Pool of Prolog worker processes, created on the first MCP request if `config.PROLOG_WORKERS` > 0
+worker_pool = None
+
+
+def get_worker_pool():
+    global worker_pool
+    if worker_pool is None and config.PROLOG_WORKERS > 0:
+        worker_pool = PrologWorkerPool(config.PROLOG_WORKERS)
+        atexit.register(worker_pool.shutdown)
+    return worker_pool
+
+
+# MCP Tool to assert the extracted sessions of a user (`FitnessExtract` dumped to dicts) into its knowledge base
+# It runs in the Prolog worker of the user, so the next validation of this user finds the sessions in memory
+@mcp.tool()
+async def ingest_sessions(
+    sessions: list[dict], user_input: str = "", user_id: str = config.DEFAULT_USER_ID
+):
+    pool = get_worker_pool()
+    if pool is None:
+        return ingest_user_sessions(sessions, user_input, user_id)
+    return await pool.run(user_id, "ingest_user_sessions", sessions, user_input, user_id)
+
+
+# MCP Tool to validate all planned workouts from the JSON context file of a user
+# The validation runs in the Prolog worker of the user, or in this process if there is no worker pool
+@mcp.tool()
+async def validate_all_planned_workouts(user_id: str = config.DEFAULT_USER_ID):
+    pool = get_worker_pool()
+    if pool is None:
+        return validate_planned_workouts(user_id)
+    return await pool.run(user_id, "validate_planned_workouts", user_id)
+
+
+# MCP Tool to plan the workouts of the next `days` days for the `targets` muscle groups
+# The whole schedule is solved in one constraint search instead of one validation per muscle and date
+@mcp.tool()
+async def plan_workouts(
+    start_date: str, days: int, targets: list[str], user_id: str = config.DEFAULT_USER_ID
+):
+    pool = get_worker_pool()
+    if pool is None:
+        return plan_user_workouts(start_date, days, targets, user_id)
+    return await pool.run(user_id, "plan_user_workouts", start_date, days, targets, user_id)
+
+
+# Statistics of this process, used to monitor the MCP server
+def local_server_stats():
+    return {
+        "startup": startup_stats,
+        "users_loaded": len(user_kbs),
+        "context_loads": dict(context_loads),
+        "validation_cache": validation_cache.stats(),
+        "context_writer": context_writer.stats(),
+        "group_commit": group_committer.stats(),
+    }
+
+
+# MCP Tool returning the statistics of the MCP server, one entry per Prolog worker if there is a worker pool
+@mcp.tool()
+async def server_stats():
+    pool = get_worker_pool()
+    if pool is None:
+        return [local_server_stats()]
+    return await pool.broadcast("local_server_stats")
+
+
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,101 @@
+"""
+HAIWPA Prolog Worker Pool
+
+A pool of worker processes used by the MCP server to run Prolog queries on several cores.
+Each worker has its own SWI-Prolog engine with `workout_rules.pl` consulted (by importing `haiwpa_mcp`),
+and runs one request at a time because a pyswip engine is not safe for concurrent use.
+
+A user is always sent to the same worker (a stable hash of its id modulo the number of workers),
+so its knowledge base stays loaded there. A worker that crashed is started again, the new worker reads the knowledge
+base of its users from the store. Read-only requests (validation, planning) are then retried once, the other ones
+(`ingest_user_sessions`) are not : the sessions may have been saved before the worker died.
+
+Source :
+- https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+- https://docs.python.org/3/library/concurrent.futures.html#concurrent.futures.process.BrokenProcessPool
+- https://docs.python.org/3/library/asyncio-future.html#asyncio.wrap_future
+- https://docs.python.org/3/library/zlib.html#zlib.crc32
+
+Assistant : Claude
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import importlib
+import multiprocessing
+import threading
+import zlib
+import config
+
+
+# Function executed in a worker process
+# The module (`haiwpa_mcp`) is only imported once per worker, the Prolog engine is then reused for every request
+def run_in_worker(module_name: str, function_name: str, args: tuple, kwargs: dict):
+    module = importlib.import_module(module_name)
+
+    return getattr(module, function_name)(*args, **kwargs)
+
+
+# Functions of `haiwpa_mcp` that do not save anything, they can be run again if the worker died before answering
+READ_ONLY_FUNCTIONS = frozenset({"validate_planned_workouts", "plan_user_workouts", "local_server_stats"})
+
+
+class PrologWorkerPool:
+    # `module` : module of the functions run in the workers, `read_only` : its functions that can be retried
+    def __init__(
+        self, size: int = config.PROLOG_WORKERS, module: str = "haiwpa_mcp", read_only=READ_ONLY_FUNCTIONS
+    ):
+        # "spawn" is used because a forked SWI-Prolog engine is not safe to use
+        self.context = multiprocessing.get_context("spawn")
+        self.module = module
+        self.read_only = read_only
+
+        # One executor with a single process per worker, so a user can be sent to a specific worker
+        self.workers = [self.new_worker() for _ in range(size)]
+        self.restarts = 0
+        self.lock = threading.Lock()
+
+    def new_worker(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, mp_context=self.context)
+
+    # Worker of a user, always the same one : the hash of Python strings changes between runs, CRC32 does not
+    def worker_for_user(self, user_id: str) -> int:
+        return zlib.crc32(user_id.encode("utf-8")) % len(self.workers)
+
+    # Replace a worker whose process died, unless another request already replaced it
+    def restart_worker(self, index: int, broken: ProcessPoolExecutor):
+        with self.lock:
+            if self.workers[index] is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.workers[index] = self.new_worker()
+                self.restarts += 1
+
+    # Run a function of the module in the worker of the user without blocking the event loop
+    # If the worker process died (crash of the Prolog engine, killed process), it is started again. A read-only
+    # request is retried once, a request that saves something is not, it may have been saved before the crash.
+    async def run(self, user_id: str, function_name: str, *args, **kwargs):
+        index = self.worker_for_user(user_id)
+        attempts = 2 if function_name in self.read_only else 1
+
+        for attempt in range(attempts):
+            worker = self.workers[index]
+            try:
+                future = worker.submit(run_in_worker, self.module, function_name, args, kwargs)
+                return await asyncio.wrap_future(future)
+            except BrokenProcessPool:
+                self.restart_worker(index, worker)
+                if attempt == attempts - 1:
+                    raise
+
+    # Run a function of the module in every worker and return the list of results
+    async def broadcast(self, function_name: str, *args, **kwargs):
+        futures = [
+            asyncio.wrap_future(worker.submit(run_in_worker, self.module, function_name, args, kwargs))
+            for worker in self.workers
+        ]
+        return await asyncio.gather(*futures)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,136 @@
+"""
+HAIWPA Prolog Query Layer
+
+Small layer on top of pyswip used to call Prolog predicates with terms built directly from Python values,
+instead of f-string queries that SWI-Prolog has to tokenise and parse on every call.
+Functors are created once and reused, and a value such as an exercise name containing a quote cannot break the query.
+
+Python values are converted as follows :
+- str -> atom
+- int, float -> number
+- list -> list
+- (Key, Value) tuple -> Key-Value pair
+- Out(name) -> variable, its value is returned under `name` in each solution (like `prolog.query` does)
+
+Rules files can also be loaded from their compiled form (Quick Load File, `.qlf`) with `load_compiled()`,
+which is much faster than consulting the source once the rules grow to thousands of clauses.
+
+Source :
+- https://pyswip.readthedocs.io/en/latest/api/easy.html
+- https://www.swi-prolog.org/pldoc/man?section=foreign-create-query
+- https://www.swi-prolog.org/pldoc/man?section=qlf
+
+Assistant : Claude
+"""
+
+from pyswip import Functor, Prolog, Query, Variable
+from pyswip.core import PL_open_foreign_frame, PL_discard_foreign_frame, PL_exception
+from pyswip.easy import getTerm
+from pyswip.prolog import PrologError, normalize_values
+import os
+
+
+# Output argument of a predicate
+class Out:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+# Functors are created once and reused for every call
+functors = {}
+
+
+def get_functor(name: str, arity: int):
+    key = (name, arity)
+    if key not in functors:
+        functors[key] = Functor(name, arity)
+    return functors[key]
+
+
+# Convert a Python value to something pyswip can put in a term
+def to_term(value):
+    # pyswip cannot put a float directly in a term, it has to be unified with a variable
+    if isinstance(value, float):
+        term = Variable()
+        term.value = value
+        return term
+    if isinstance(value, tuple):
+        key, pair_value = value
+        return get_functor("-", 2)(to_term(key), to_term(pair_value))
+    if isinstance(value, list):
+        return [to_term(v) for v in value]
+    return value
+
+
+# Call `module:name(args...)` and return all solutions as a list of dicts with the values of the `Out` arguments
+def solutions(module: str, name: str, *args, limit: int = None):
+    Prolog._init_prolog_thread()
+
+    # Term references created for the query are freed by discarding the frame
+    frame = PL_open_foreign_frame()
+    try:
+        outputs = {}
+        terms = []
+        for arg in args:
+            if isinstance(arg, Out):
+                outputs[arg.name] = Variable()
+                terms.append(outputs[arg.name])
+            else:
+                terms.append(to_term(arg))
+
+        goal = get_functor(name, len(terms))(*terms)
+        # The module is given as a str, which pyswip puts as an atom (it cannot put an `Atom` object)
+        qualified_goal = get_functor(":", 2)(module, goal)
+        query = Query(get_functor("call", 1)(qualified_goal))
+
+        results = []
+        try:
+            while (limit is None or len(results) < limit) and query.nextSolution():
+                results.append(
+                    {key: normalize_values(var.value) for key, var in outputs.items()}
+                )
+
+            exception = PL_exception(query.qid)
+            if exception:
+                raise PrologError(f"Caused by: '{module}:{name}/{len(terms)}'. Returned: '{getTerm(exception)}'.")
+        finally:
+            query.closeQuery()
+
+        return results
+    finally:
+        PL_discard_foreign_frame(frame)
+
+
+# Call `module:name(args...)` and return the first solution, or None if it fails
+def first_solution(module: str, name: str, *args):
+    results = solutions(module, name, *args, limit=1)
+    return results[0] if results else None
+
+
+# Call `module:name(args...)` only for its side effects (assert, retract, ...), returns True if it succeeded
+def run(module: str, name: str, *args) -> bool:
+    return first_solution(module, name, *args) is not None
+
+
+# Compiled form of a Prolog source file, e.g. workout_rules.pl -> workout_rules.qlf
+def compiled_file_for(source_file: str) -> str:
+    return os.path.splitext(source_file)[0] + ".qlf"
+
+
+# Load a Prolog source file from its `.qlf` file, returns True if the source had to be compiled
+# The `.qlf` file is compiled again (and loaded) by qcompile/1 when it is missing, older than the source,
+# or cannot be loaded (e.g. created by another SWI-Prolog version).
+def load_compiled(source_file: str) -> bool:
+    compiled_file = compiled_file_for(source_file)
+
+    if os.path.exists(compiled_file) and os.path.getmtime(compiled_file) >= os.path.getmtime(source_file):
+        try:
+            if run("user", "consult", compiled_file):
+                return False
+        except PrologError as e:
+            print(f"Could not load {compiled_file}, compiling it again : {e}")
+
+    run("user", "qcompile", source_file)
+    return True
@@ -0,0 +1,272 @@
+"""
+HAIWPA Workout Records
+
+Typed records of the workout entries, used by the MCP server to load the history of the users.
+Decoding an entry into a dict of strings, then pulling its fields out by key and parsing its date on every use
+is slow and heavy for long histories, so each entry is decoded once into a `WorkoutRecord` :
+- a slotted dataclass, without a `__dict__` per entry
+- the muscle and the entry type are interned as enums (`Muscle`, built from the muscle_group/1 facts, and `EntryType`)
+- the date is parsed once to a number of days since 1970-01-01
+- the texts repeated between entries (message, exercises) are shared
+
+JSON is decoded and encoded with orjson if it is installed (`uv sync --extra records`), otherwise with the json module.
+`python haiwpa_records.py benchmark 100000` compares the parse time and memory of dicts and records.
+
+Source :
+- https://docs.python.org/3/library/dataclasses.html#dataclasses.dataclass
+- https://docs.python.org/3/library/enum.html
+- https://github.com/ijl/orjson
+- https://docs.python.org/3/library/tracemalloc.html
+
+Assistant : Claude
+"""
+
+from haiwpa_rules import load_rule_facts
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+import datetime
+import json
+import sys
+import config
+
+# orjson decodes and encodes JSON several times faster than the json module, it is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+class EntryType(str, Enum):
+    COMPLETED = "completed"
+    PLANNED = "planned"
+
+
+ENTRY_TYPES = {entry_type.value: entry_type for entry_type in EntryType}
+
+
+# Enum of the muscle groups of `config.RULES_FILE`, e.g. Muscle.CHEST == "chest"
+# It is created once, so the records of every user share the same members.
+@lru_cache(maxsize=None)
+def muscle_enum():
+    muscles = load_rule_facts(config.RULES_FILE)["muscle_groups"]
+    return Enum("Muscle", {muscle.upper(): muscle for muscle in muscles}, type=str)
+
+
+# Members of `Muscle` by name, a dict lookup is much faster than calling the enum
+@lru_cache(maxsize=None)
+def muscle_members():
+    return {member.value: member for member in muscle_enum()}
+
+
+# Muscle of an entry : a `Muscle` member, or an interned string for a muscle unknown to the rules
+def intern_muscle(muscle: str):
+    members = muscle_members()
+    if muscle in members:
+        return members[muscle]
+    muscle = str(muscle or "").lower()
+    return members.get(muscle) or sys.intern(muscle)
+
+
+def intern_entry_type(entry_type: str):
+    return ENTRY_TYPES.get(entry_type) or sys.intern(str(entry_type or ""))
+
+
+# Parse a US date (YYYY-MM-DD) or an EU date (DD.MM.YYYY), the day and month can have one digit
+def parse_date(date_str: str):
+    # if date_str looks like "DD.MM.YYYY", convert it to the format "YYYY-MM-DD"
+    if "." in date_str:
+        day, month, year = date_str.split(".")
+        date_str = f"{year}-{month}-{day}"
+    return datetime.datetime.strptime(date_str, "%Y-%m-%d")
+
+
+# Number of days since 1970-01-01 of a date read by `parse_date()`, None if it is not a date
+# The same dates come back in many entries, so each one is only parsed once.
+@lru_cache(maxsize=4096)
+def epoch_day(date_str: str):
+    try:
+        return (parse_date(date_str).date() - EPOCH).days
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# UNIX timestamp of the local midnight of a day, like `convert_date_to_timestamp()` in the MCP server
+@lru_cache(maxsize=4096)
+def day_timestamp(day: int) -> int:
+    date = EPOCH + datetime.timedelta(days=day)
+    return int(datetime.datetime.combine(date, datetime.time()).timestamp())
+
+
+@dataclass(slots=True)
+class WorkoutRecord:
+    timestamp: str
+    user_input: str
+    muscle: str
+    exercises: str
+    duration: float
+    day: int
+    injuries: str
+    entry_type: str
+
+    # Date in ISO format, empty if the entry had no valid date
+    @property
+    def date(self) -> str:
+        if self.day is None:
+            return ""
+        return (EPOCH + datetime.timedelta(days=self.day)).isoformat()
+
+    # UNIX timestamp of the date, as used by the Prolog rules
+    @property
+    def unix_time(self) -> int:
+        return day_timestamp(self.day)
+
+    # Plain strings of the interned fields, e.g. to build a Prolog term
+    @property
+    def muscle_name(self) -> str:
+        return self.muscle.value if isinstance(self.muscle, Enum) else self.muscle
+
+    @property
+    def entry_type_name(self) -> str:
+        return self.entry_type.value if isinstance(self.entry_type, Enum) else self.entry_type
+
+    # Entry of a context file, e.g. to answer a MCP tool
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "user_input": self.user_input,
+            "muscle": self.muscle_name,
+            "exercises": self.exercises,
+            "duration": self.duration,
+            "date": self.date,
+            "injuries": self.injuries,
+            "entry_type": self.entry_type_name,
+        }
+
+
+# Record of a context file entry
+# `strings` shares the texts repeated between the entries decoded together (all the sessions of a message
+# have the same message, exercises are often the same).
+def record_from_dict(entry: dict, strings: dict = None) -> WorkoutRecord:
+    strings = {} if strings is None else strings
+    user_input = entry.get("user_input") or ""
+    exercises = entry.get("exercises") or ""
+    injuries = entry.get("injuries") or ""
+
+    return WorkoutRecord(
+        entry.get("timestamp") or "",
+        strings.setdefault(user_input, user_input),
+        intern_muscle(entry.get("muscle")),
+        strings.setdefault(exercises, exercises),
+        float(entry.get("duration") or 0),
+        epoch_day(entry.get("date")),
+        strings.setdefault(injuries, injuries),
+        intern_entry_type(entry.get("entry_type")),
+    )
+
+
+# Decode a JSON text (one entry, a line of a JSON Lines file) into a Python value
+def loads(text):
+    if orjson:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+# Encode an entry to a JSON Lines line, without indentation
+def dumps_line(entry: dict) -> str:
+    if orjson:
+        return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE).decode()
+    return json.dumps(entry) + "\n"
+
+
+# Records of the lines of a JSON Lines file, blank lines are ignored
+def decode_records(lines, strings: dict = None):
+    strings = {} if strings is None else strings
+    return [record_from_dict(loads(line), strings) for line in lines if line.strip()]
+
+
+def encode_records(records) -> str:
+    return "".join(dumps_line(record.to_dict()) for record in records)
+
+
+# Parse time and memory of `count` entries decoded into dicts and into records
+def benchmark(count: int):
+    import random
+    import time
+    import tracemalloc
+
+    # Entries with the cardinality of a real history : a message and a timestamp per entry, dates over three years
+    # (some in the EU format), one to three exercises of the muscle from the rules, a few injuries
+    muscles = list(muscle_enum())
+    exercises = {}
+    for exercise, muscle in load_rule_facts(config.RULES_FILE)["exercises"].items():
+        exercises.setdefault(muscle, []).append(exercise)
+    rng = random.Random(0)
+    lines = []
+    for i in range(count):
+        muscle = rng.choice(muscles).value
+        day = EPOCH + datetime.timedelta(days=rng.randrange(20000, 21095))
+        date = day.strftime("%d.%m.%Y") if rng.random() < 0.1 else day.isoformat()
+        choices = exercises.get(muscle) or [muscle]
+        done = ", ".join(rng.sample(choices, rng.randint(1, min(3, len(choices)))))
+        duration = float(rng.randrange(15, 125, 5))
+        entry = {
+            "timestamp": f"{day.isoformat()}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+                         f".{rng.randrange(10**6):06d}",
+            "user_input": f"{rng.choice(['I did', 'Today I did', 'Just finished', 'I will do'])} {done} "
+                          f"for {duration:.0f} minutes, {rng.choice(['felt great', 'was hard', 'ok'])} "
+                          f"(set {rng.randrange(1, 6)} x {rng.randrange(5, 16)} at {rng.randrange(5, 150)} kg)",
+            "muscle": muscle,
+            "exercises": done,
+            "duration": duration,
+            "date": date,
+            "injuries": rng.choice(["pain in the left elbow", "sore right knee", "shoulder strain"])
+            if rng.random() < 0.05 else "",
+            "entry_type": "completed" if rng.random() < 0.8 else "planned",
+        }
+        lines.append(json.dumps(entry) + "\n")
+
+    # The time (best of 3 runs) is measured without tracemalloc, which slows down every allocation
+    def measure(decode):
+        seconds = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            decode(lines)
+            seconds = min(seconds, time.perf_counter() - start)
+
+        tracemalloc.start()
+        decoded = decode(lines)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return seconds, memory
+
+    # Dicts with the date of each entry parsed, as the loader did before the records
+    def decode_dicts_and_dates(lines):
+        entries = [loads(line) for line in lines]
+        for entry in entries:
+            parse_date(entry["date"])
+        return entries
+
+    # All the lines except the first one are decoded with `loads()`, so they only compare dicts and records.
+    # The first line gives the effect of the JSON parser alone.
+    results = {
+        "dicts (json)": measure(lambda lines: [json.loads(line) for line in lines]),
+        "dicts": measure(lambda lines: [loads(line) for line in lines]),
+        "dicts + dates": measure(decode_dicts_and_dates),
+        "records": measure(decode_records),
+    }
+
+    print(f"{count} entries (loads() with {'orjson' if orjson else 'json'})")
+    for name, (seconds, memory) in results.items():
+        print(f"{name:<14}: {seconds * 1000:8.1f} ms {memory / 2**20:8.1f} MiB")
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["benchmark"]:
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    else:
+        print("Usage : python haiwpa_records.py benchmark [entries]")
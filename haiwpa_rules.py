@@ -0,0 +1,59 @@
+"""
+HAIWPA Rule Facts
+
+Reads the static facts of `workout_rules.pl` (muscle groups, exercises, rest days, recovery days, muscles trained together)
+without SWI-Prolog, so Python modules can use the same vocabulary and values as the Prolog rules.
+Only facts written on a single line such as `rest_day_required(chest, 2).` are read, rules are ignored.
+
+Source :
+- https://docs.python.org/3/library/re.html
+
+Assistant : Claude
+"""
+
+import functools
+import re
+import config
+
+
+# A fact on a single line : name(arg1, arg2, ...).
+FACT_PATTERN = re.compile(r"^([a-z_]+)\((.*)\)\.\s*(%.*)?$")
+# An argument : a quoted atom or anything up to the next comma
+ARGUMENT_PATTERN = re.compile(r"'((?:[^'\\]|\\.)*)'|([^,\s]+)")
+
+
+# Parse the arguments of a fact, numbers are converted to int
+def parse_arguments(arguments: str):
+    values = []
+    for quoted, unquoted in ARGUMENT_PATTERN.findall(arguments):
+        value = quoted if quoted else unquoted
+        if unquoted and unquoted.lstrip("-").isdigit():
+            value = int(unquoted)
+        values.append(value)
+    return tuple(values)
+
+
+# Read all the facts of a Prolog file, grouped by predicate name
+def read_facts(file_path: str):
+    facts = {}
+    with open(file_path, "r") as f:
+        for line in f:
+            match = FACT_PATTERN.match(line.strip())
+            if not match or ":-" in line:
+                continue
+            name, arguments = match.group(1), match.group(2)
+            facts.setdefault(name, []).append(parse_arguments(arguments))
+    return facts
+
+
+# Static facts of the workout rules, read once per file
+@functools.lru_cache(maxsize=None)
+def load_rule_facts(file_path: str = config.RULES_FILE):
+    facts = read_facts(file_path)
+    return {
+        "muscle_groups": [muscle for (muscle,) in facts.get("muscle_group", [])],
+        "exercises": {exercise: muscle for exercise, muscle in facts.get("exercise", [])},
+        "rest_days": {muscle: days for muscle, days in facts.get("rest_day_required", [])},
+        "recovery_days": {muscle: days for muscle, days in facts.get("injury_recovery_days", [])},
+        "trained_together": [tuple(pair) for pair in facts.get("trained_together", [])],
+    }
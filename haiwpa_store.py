@@ -0,0 +1,918 @@
+"""
+HAIWPA Workout Store
+
+Saves the workout entries of the users and reads them back, for both the backend (save path) and the MCP server (loader).
+Two stores with the same repository API are available, selected by `config.CONTEXT_STORE` :
+- "jsonl" : one context file per user (`FileStore`)
+- "sqlite" : a single SQLite database in WAL mode shared by the backend and the MCP server (`SQLiteStore`)
+
+Context files are JSON Lines (`.jsonl`) : one entry per line, so saving a session only appends a line to the file
+instead of loading and rewriting the whole JSON array, and the MCP server can read only the lines appended
+since its last read.
+Files with the `.json` extension are still read and written as a JSON array (legacy format).
+A legacy `context.json` file is migrated once to `context.jsonl` the first time the `.jsonl` file is used,
+and kept as `context.json.migrated`.
+
+Writes are atomic : a JSON array is written to a temporary file that replaces the old one, and the lines appended
+to a JSON Lines file are written at once, a line left incomplete by a crash being removed before the next append.
+Writers of the same file are serialised by an advisory lock (`<file>.lock`), also between processes.
+With `config.GROUP_COMMIT`, concurrent saves are written together by `GroupCommitter` (one write and one fsync per file).
+
+The SQLite database has a `sessions` and an `injuries` table, indexed by (user, muscle, date) and (user, entry type),
+so questions such as "what did this user train in the last 7 days ?" do not scan the whole history.
+
+Compaction (`compact_entries()`) keeps the history of a user bounded : planned workouts whose date has passed become
+completed ones, the sessions of the same muscle on the same date are merged into one, and stale entries are archived.
+The result is written as a new snapshot (a new context file, or new rows with a new generation in SQLite),
+after which saves are appended again. It runs when the entries appended to a context file since the last compaction
+reach `config.COMPACTION_TAIL_SIZE` bytes, or on a schedule with `python haiwpa_store.py compact` (e.g. from cron).
+
+Source :
+- https://jsonlines.org/
+- https://docs.python.org/3/library/os.html#os.replace
+- https://docs.python.org/3/library/sqlite3.html
+- https://www.sqlite.org/wal.html
+- https://docs.python.org/3/library/fcntl.html#fcntl.flock
+
+Assistant : Claude
+"""
+
+from haiwpa_rules import load_rule_facts
+from haiwpa_records import WorkoutRecord, record_from_dict, loads, dumps_line, parse_date, EPOCH
+from collections import defaultdict
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import config
+
+# Advisory file locks are not available on Windows, writers are then only serialised inside a process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# JSON Lines files are appended, the other ones are read and written as a JSON array
+def is_jsonl(file_path: str) -> bool:
+    return file_path.endswith(".jsonl")
+
+
+# Legacy JSON array file of a JSON Lines file, e.g. data/context.jsonl -> data/context.json
+def legacy_file_for(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + ".json"
+
+
+# Threads of this process holding the lock of a file, the advisory lock only excludes the other processes
+thread_locks = defaultdict(threading.RLock)
+thread_locks_guard = threading.Lock()
+held_locks = threading.local()
+
+
+# Lock a file for writing, in this process and in the other ones (backend, MCP server, workers)
+# The lock is reentrant in a thread, so an operation holding it can call another one that takes it.
+@contextlib.contextmanager
+def locked(file_path: str):
+    with thread_locks_guard:
+        thread_lock = thread_locks[os.path.abspath(file_path)]
+
+    with thread_lock:
+        held = getattr(held_locks, "paths", None)
+        if held is None:
+            held = held_locks.paths = set()
+        if file_path in held:
+            yield
+            return
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(file_path + ".lock", "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            held.add(file_path)
+            try:
+                yield
+            finally:
+                held.discard(file_path)
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Flush a written file to the disk, so a save is not lost if the machine crashes
+def sync_file(f):
+    f.flush()
+    if config.STORE_FSYNC:
+        os.fsync(f.fileno())
+
+
+# Write all the entries to a file, the file is replaced at once so a reader never sees it half written
+def write_entries(file_path: str, entries):
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_file = f"{file_path}.{os.getpid()}.tmp"
+
+    with open(temp_file, "w") as f:
+        if is_jsonl(file_path):
+            f.writelines(dumps_line(entry) for entry in entries)
+        else:
+            json.dump(list(entries), f, indent=2)
+        sync_file(f)
+
+    os.replace(temp_file, file_path)
+
+
+# Read a JSON array file, a file that cannot be parsed is kept as `<file>.corrupt` instead of being overwritten
+def read_json_array(file_path: str):
+    with open(file_path, "r") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            print(f"Could not read {file_path} ({e}), keeping it as {file_path}.corrupt")
+
+    with locked(file_path):
+        if os.path.exists(file_path):
+            os.replace(file_path, file_path + ".corrupt")
+    return []
+
+
+# Convert the legacy JSON array file of a JSON Lines file, if the JSON Lines file does not exist yet
+def migrate_legacy_file(file_path: str):
+    legacy_file = legacy_file_for(file_path)
+    if os.path.exists(file_path) or not os.path.exists(legacy_file):
+        return
+
+    with locked(file_path):
+        # Another process may have migrated it while waiting for the lock
+        if os.path.exists(file_path) or not os.path.exists(legacy_file):
+            return
+
+        entries = read_json_array(legacy_file)
+        write_entries(file_path, entries)
+        os.replace(legacy_file, legacy_file + ".migrated")
+
+    print(f"Migrated {len(entries)} workout entries from {legacy_file} to {file_path}")
+
+
+# Read all the entries of a context file, an empty list if it does not exist
+def read_entries(file_path: str):
+    entries, _, _ = read_new_entries(file_path)
+    return entries
+
+
+# Read the entries of a context file appended since `position`
+# `position` is returned by the previous call : the identity of the file and the offset of the next line to read.
+# If the file was replaced (e.g. archived or migrated) or truncated since, the whole file is read again.
+# A legacy JSON file is always parsed entirely, its position is the number of entries and the timestamp of the last one.
+# It returns (entries, position, appended), `appended` being False if the whole file was read.
+# With `records`, the entries are decoded into `WorkoutRecord` instead of dicts.
+def read_new_entries(file_path: str, position=None, records: bool = False):
+    if is_jsonl(file_path):
+        migrate_legacy_file(file_path)
+
+    if not os.path.exists(file_path):
+        return [], None, False
+
+    # Texts shared by the records decoded together
+    strings = {}
+
+    if not is_jsonl(file_path):
+        entries = read_json_array(file_path)
+
+        new_position = (len(entries), entries[-1].get("timestamp") if entries else None)
+        appended = False
+        if position and position[0] and len(entries) >= position[0]:
+            if entries[position[0] - 1].get("timestamp") == position[1]:
+                entries, appended = entries[position[0] :], True
+        if records:
+            entries = [record_from_dict(entry, strings) for entry in entries]
+        return entries, new_position, appended
+
+    stat = os.stat(file_path)
+    identity = (stat.st_dev, stat.st_ino)
+    appended = position is not None and position[0] == identity and position[1] <= stat.st_size
+    offset = position[1] if appended else 0
+
+    entries = []
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            # A line without its end of line is still being written, it is read on the next call
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    print(f"Skipping an invalid line in {file_path} at offset {offset - len(line)}")
+                    continue
+                entries.append(record_from_dict(entry, strings) if records else entry)
+
+    return entries, (identity, offset), appended
+
+
+# Signature of a file : it changes when the file is appended, rewritten or replaced, None if it does not exist
+def file_signature(file_path: str):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+# SHA-256 of the content of a file, None if it does not exist
+def file_hash(file_path: str):
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+# Remove the end of a JSON Lines file left without its end of line by a crash during an append
+# Otherwise the next line would be appended to it and both entries would be lost.
+def remove_incomplete_line(f):
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return
+
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return
+
+    # Going back to the last end of line
+    position = size
+    while position > 0:
+        start = max(0, position - 4096)
+        f.seek(start)
+        end_of_line = f.read(position - start).rfind(b"\n")
+        if end_of_line != -1:
+            position = start + end_of_line + 1
+            break
+        position = start
+
+    print(f"Removing an incomplete line at the end of {f.name}")
+    f.truncate(position)
+
+
+# Append entries to a context file, holding its lock
+# A JSON Lines file is appended with a single write, a legacy JSON file is rewritten
+def append_entries(file_path: str, entries):
+    with locked(file_path):
+        if not is_jsonl(file_path):
+            write_entries(file_path, read_entries(file_path) + list(entries))
+            return
+
+        migrate_legacy_file(file_path)
+        with open(file_path, "ab+") as f:
+            remove_incomplete_line(f)
+            f.write("".join(dumps_line(entry) for entry in entries).encode())
+            sync_file(f)
+
+
+# Name of the files of a user : the characters of the id that are safe in a file name, and the MD5 of the id so two
+# ids such as "a.b" and "a b" never share a file
+def user_file_name(user_id: str) -> str:
+    safe_user_id = re.sub(r"[^A-Za-z0-9_-]", "_", user_id)[:32]
+    return f"{safe_user_id}_{hashlib.md5(user_id.encode('utf-8')).hexdigest()}"
+
+
+# Context file of a user, the default user keeps using `config.CONTEXT_FILE`
+def context_file_for_user(user_id: str = config.DEFAULT_USER_ID) -> str:
+    if user_id == config.DEFAULT_USER_ID:
+        return config.CONTEXT_FILE
+    return os.path.join(config.USERS_FOLDER, f"{user_file_name(user_id)}.jsonl")
+
+
+# File keeping the id of the user of a context file, the file name alone does not give it back
+def id_file_for(context_file: str) -> str:
+    return os.path.splitext(context_file)[0] + ".id"
+
+
+# Rename the context file of a user named with the id only (before the MD5 was added), if the user has no new file yet
+# Ids that were mapped to the same old file ("a.b" and "a b") cannot be told apart, the first user read gets it.
+def migrate_user_file(user_id: str, context_file: str):
+    old_file = os.path.join(config.USERS_FOLDER, re.sub(r"[^A-Za-z0-9_-]", "_", user_id) + ".jsonl")
+    if os.path.exists(context_file) or not os.path.exists(old_file):
+        return
+
+    with locked(old_file):
+        # Another process may have migrated it while waiting for the lock
+        if os.path.exists(context_file) or not os.path.exists(old_file):
+            return
+        if os.path.exists(archive_file_for(old_file)):
+            os.replace(archive_file_for(old_file), archive_file_for(context_file))
+        write_user_id(context_file, user_id)
+        os.replace(old_file, context_file)
+
+    print(f"Migrated the workout entries of {user_id} from {old_file} to {context_file}")
+
+
+# Id of the user of a context file, the file name for a file saved before the ids were kept
+def read_user_id(context_file: str) -> str:
+    try:
+        with open(id_file_for(context_file), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return os.path.basename(os.path.splitext(context_file)[0])
+
+
+def write_user_id(context_file: str, user_id: str):
+    id_file = id_file_for(context_file)
+    if not os.path.exists(id_file):
+        os.makedirs(os.path.dirname(id_file) or ".", exist_ok=True)
+        with open(id_file, "w", encoding="utf-8") as f:
+            f.write(user_id)
+
+
+# Number of days of history used by the Prolog rules
+# No rule looks further back than the longest rest or injury recovery period, older entries cannot change a validation.
+def retention_days(rules_file: str = config.RULES_FILE) -> int:
+    facts = load_rule_facts(rules_file)
+    return max(list(facts["rest_days"].values()) + list(facts["recovery_days"].values()))
+
+
+# Date and entry type of a context entry, or of a typed record (`WorkoutRecord`)
+# It raises KeyError, TypeError or ValueError if the entry has no valid date.
+def entry_date_and_type(entry):
+    if isinstance(entry, WorkoutRecord):
+        if entry.day is None:
+            raise ValueError(f"Invalid date in {entry}")
+        date = EPOCH + datetime.timedelta(days=entry.day)
+        return datetime.datetime.combine(date, datetime.time()), entry.entry_type
+    return parse_date(entry["date"]), entry.get("entry_type")
+
+
+# Oldest date of the history that is still needed in Prolog
+# The window ends at the earliest day that can still be validated : today, the first planned workout,
+# or the latest completed workout if the history is older than today (e.g. test data).
+def retention_cutoff(entries):
+    reference = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    completed_dates = []
+
+    for entry in entries:
+        try:
+            date, entry_type = entry_date_and_type(entry)
+        except (KeyError, TypeError, ValueError):
+            continue
+        if entry_type == "planned":
+            reference = min(reference, date)
+        elif entry_type == "completed":
+            completed_dates.append(date)
+
+    if completed_dates:
+        reference = min(reference, max(completed_dates))
+    return reference - datetime.timedelta(days=retention_days())
+
+
+# A completed workout before the cutoff is stale, planned workouts and entries without a valid date are always kept
+def is_stale_entry(entry, cutoff) -> bool:
+    try:
+        date, entry_type = entry_date_and_type(entry)
+    except (KeyError, TypeError, ValueError):
+        return False
+    return entry_type == "completed" and date < cutoff
+
+
+# Split the entries of a context file into the stale ones and the current ones
+def split_stale_entries(entries):
+    cutoff = retention_cutoff(entries)
+    stale = [entry for entry in entries if is_stale_entry(entry, cutoff)]
+    current = [entry for entry in entries if not is_stale_entry(entry, cutoff)]
+    return stale, current
+
+
+# Archive file of a context file, e.g. data/context.jsonl -> data/context_archive.jsonl
+def archive_file_for(context_file: str) -> str:
+    return os.path.splitext(context_file)[0] + "_archive.jsonl"
+
+
+# Move the stale entries to the archive file of the context file and return the current ones
+# The archive is in JSON Lines format, so entries are only appended and the file is never read back by the server.
+def archive_stale_entries(context_file: str, entries):
+    stale, current = split_stale_entries(entries)
+    if stale:
+        append_entries(archive_file_for(context_file), stale)
+        print(f"Archived {len(stale)} workout entries to {archive_file_for(context_file)}")
+    return current
+
+
+# Number of entries appended to each JSON Lines context file since its stale entries were last archived
+appends_since_archive = {}
+
+
+# Append entries to a context file, used by `save_to_json()` and by the MCP server
+# A JSON Lines file is only appended, its stale entries are archived every `config.ARCHIVE_INTERVAL` appended entries,
+# so the cost of a save does not grow with the history. A legacy JSON file is rewritten on each save.
+def append_context_entries(context_file: str, entries):
+    with locked(context_file):
+        if not is_jsonl(context_file):
+            data = read_entries(context_file) + list(entries)
+
+            # Entries that no rule can use anymore are moved to the archive file
+            if config.HISTORY_RETENTION:
+                data = archive_stale_entries(context_file, data)
+
+            write_entries(context_file, data)
+            return
+
+        append_entries(context_file, entries)
+
+        if config.HISTORY_RETENTION:
+            count = appends_since_archive.get(context_file, 0) + len(entries)
+            if count >= config.ARCHIVE_INTERVAL:
+                archive_context_file(context_file)
+                count = 0
+            appends_since_archive[context_file] = count
+
+        if config.COMPACTION and needs_compaction(context_file):
+            compact_context_file(context_file)
+
+
+# Move the stale entries of a context file to its archive file
+def archive_context_file(context_file: str):
+    with locked(context_file):
+        data = read_entries(context_file)
+        current = archive_stale_entries(context_file, data)
+        if len(current) < len(data):
+            write_entries(context_file, current)
+
+
+# Join the distinct non-empty values of two text fields, e.g. "bench press" and "dips" -> "bench press, dips"
+def merge_text(first, second, separator: str) -> str:
+    values = []
+    for text in (first, second):
+        for value in str(text or "").split(separator):
+            if value.strip() and value.strip() not in values:
+                values.append(value.strip())
+    return separator.join(values)
+
+
+# Merge a session into the session of the same muscle and date
+# Both were extracted from different messages (e.g. "can I train chest today ?" then "I trained chest today"),
+# so the exercises and injuries of both are kept, with the longest duration and the latest message.
+def merge_sessions(kept, duplicate):
+    merged = dict(kept)
+    merged["exercises"] = merge_text(kept.get("exercises"), duplicate.get("exercises"), ", ")
+    merged["injuries"] = merge_text(kept.get("injuries"), duplicate.get("injuries"), "; ")
+    merged["duration"] = max(kept.get("duration") or 0, duplicate.get("duration") or 0)
+    merged["timestamp"] = duplicate.get("timestamp", kept.get("timestamp"))
+    merged["user_input"] = duplicate.get("user_input", kept.get("user_input"))
+    if "completed" in (kept.get("entry_type"), duplicate.get("entry_type")):
+        merged["entry_type"] = "completed"
+    return merged
+
+
+# Compact the entries of a user
+# - planned workouts dated before `today` are dropped, unless a completed session of the same muscle and date
+#   confirms them : a plan rejected by Prolog or skipped by the user is not a workout
+# - sessions of the same muscle on the same date are merged, at the place of the first one
+# Entries without a valid muscle or date are kept as they are.
+def compact_entries(entries, today=None):
+    today = today or datetime.datetime.combine(datetime.date.today(), datetime.time())
+    compacted = []
+    sessions = {}
+
+    keyed = []
+    for entry in entries:
+        try:
+            keyed.append((entry, (entry["muscle"].lower(), parse_date(entry["date"]))))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            keyed.append((entry, None))
+    confirmed = {key for entry, key in keyed if key and entry.get("entry_type") == "completed"}
+
+    for entry, key in keyed:
+        entry = dict(entry)
+        if key is None:
+            compacted.append(entry)
+            continue
+
+        if entry.get("entry_type") == "planned" and key[1] < today and key not in confirmed:
+            continue
+
+        if key in sessions:
+            compacted[sessions[key]] = merge_sessions(compacted[sessions[key]], entry)
+        else:
+            sessions[key] = len(compacted)
+            compacted.append(entry)
+
+    return compacted
+
+
+# Size of each JSON Lines context file after its last compaction, the entries appended after it are its tail
+snapshot_sizes = {}
+
+
+# Compact a context file : the compacted entries replace the file at once, new entries are then appended to it
+# It returns the number of entries before and after the compaction.
+def compact_context_file(context_file: str):
+    with locked(context_file):
+        data = read_entries(context_file)
+        compacted = compact_entries(data)
+        if config.HISTORY_RETENTION:
+            compacted = archive_stale_entries(context_file, compacted)
+
+        if compacted != data:
+            write_entries(context_file, compacted)
+        if os.path.exists(context_file):
+            snapshot_sizes[context_file] = os.path.getsize(context_file)
+
+    print(f"Compacted {context_file} : {len(data)} -> {len(compacted)} entries")
+    return len(data), len(compacted)
+
+
+# Check if the entries appended to a context file since its last compaction reached `config.COMPACTION_TAIL_SIZE`
+# The size of the last snapshot is not known after a restart, the first check then compacts a large file once.
+def needs_compaction(context_file: str) -> bool:
+    try:
+        size = os.path.getsize(context_file)
+    except FileNotFoundError:
+        return False
+    return size - snapshot_sizes.get(context_file, 0) >= config.COMPACTION_TAIL_SIZE
+
+
+# Repository of the entries saved in context files, one file per user
+class FileStore:
+    def __init__(self, file_for_user=context_file_for_user):
+        self.file_for_user = file_for_user
+
+    # Context file of a user, a file saved with the old file name of the user is renamed first
+    def file(self, user_id: str) -> str:
+        file_path = self.file_for_user(user_id)
+        if self.file_for_user is context_file_for_user and user_id != config.DEFAULT_USER_ID:
+            migrate_user_file(user_id, file_path)
+        return file_path
+
+    # Name of the source the entries are read from, used to detect that a user changed of source
+    def source(self, user_id: str) -> str:
+        return self.file(user_id)
+
+    def append(self, user_id: str, entries):
+        file_path = self.file(user_id)
+        if self.file_for_user is context_file_for_user and user_id != config.DEFAULT_USER_ID:
+            write_user_id(file_path, user_id)
+        append_context_entries(file_path, entries)
+
+    # Save the entries of several users, `batches` being a list of (user_id, entries)
+    def append_batches(self, batches):
+        for user_id, entries in batches:
+            self.append(user_id, entries)
+
+    def read_new_entries(self, user_id: str, position=None):
+        return read_new_entries(self.file(user_id), position)
+
+    # Same as `read_new_entries()`, the entries being decoded into `WorkoutRecord`
+    def read_new_records(self, user_id: str, position=None):
+        return read_new_entries(self.file(user_id), position, records=True)
+
+    # Cheap check of the changes : the signature is the same as long as nothing was saved
+    def signature(self, user_id: str):
+        return file_signature(self.file(user_id))
+
+    # Hash of the whole content, to check if a rewritten file really changed
+    def content_hash(self, user_id: str):
+        return file_hash(self.file(user_id))
+
+    def compact(self, user_id: str):
+        return compact_context_file(self.file(user_id))
+
+    # Users having a context file, the default user being the one of `config.CONTEXT_FILE`
+    def user_ids(self):
+        user_ids = [config.DEFAULT_USER_ID] if os.path.exists(config.CONTEXT_FILE) else []
+        if os.path.isdir(config.USERS_FOLDER):
+            for file_name in sorted(os.listdir(config.USERS_FOLDER)):
+                if file_name.endswith(".jsonl") and not file_name.endswith("_archive.jsonl"):
+                    user_ids.append(read_user_id(os.path.join(config.USERS_FOLDER, file_name)))
+        return user_ids
+
+    # Entries of a user, optionally only for a muscle, an entry type and from a date (YYYY-MM-DD)
+    # The whole file is read, use `SQLiteStore` to answer such questions with an index.
+    def sessions(self, user_id: str, muscle: str = None, entry_type: str = None, since: str = None):
+        return [
+            entry
+            for entry in read_entries(self.file(user_id))
+            if entry_matches(entry, muscle, entry_type, since)
+        ]
+
+
+# Check if an entry matches the filters of `sessions()`
+def entry_matches(entry, muscle=None, entry_type=None, since=None) -> bool:
+    if muscle and str(entry.get("muscle", "")).lower() != muscle.lower():
+        return False
+    if entry_type and entry.get("entry_type") != entry_type:
+        return False
+    if since:
+        try:
+            return parse_date(entry["date"]) >= parse_date(since)
+        except (KeyError, TypeError, ValueError):
+            return False
+    return True
+
+
+# Dates are saved in ISO format in SQLite so they can be compared and indexed
+def iso_date(date_str: str) -> str:
+    try:
+        return parse_date(date_str).strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return date_str
+
+
+# The muscles are saved as extracted ("Chest") and compared without the case, like in `FileStore`
+# The indexes without the NOCASE collation of the first databases are replaced.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    timestamp TEXT,
+    user_input TEXT,
+    muscle TEXT COLLATE NOCASE,
+    exercises TEXT,
+    duration REAL,
+    date TEXT,
+    injuries TEXT,
+    entry_type TEXT
+);
+CREATE TABLE IF NOT EXISTS injuries (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    user_id TEXT NOT NULL,
+    muscle TEXT COLLATE NOCASE,
+    date TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS generations (
+    user_id TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+DROP INDEX IF EXISTS sessions_user_muscle_date;
+DROP INDEX IF EXISTS injuries_user_muscle_date;
+CREATE INDEX IF NOT EXISTS sessions_user_muscle_nocase_date ON sessions(user_id, muscle COLLATE NOCASE, date);
+CREATE INDEX IF NOT EXISTS sessions_user_entry_type ON sessions(user_id, entry_type);
+CREATE INDEX IF NOT EXISTS injuries_user_muscle_nocase_date ON injuries(user_id, muscle COLLATE NOCASE, date);
+"""
+
+SESSION_COLUMNS = ["timestamp", "user_input", "muscle", "exercises", "duration", "date", "injuries", "entry_type"]
+
+
+# Repository of the entries saved in a SQLite database shared by all users
+# WAL mode lets the MCP server read while the backend writes, from several processes.
+# Each thread has its own connection because a sqlite3 connection should not be shared between threads.
+class SQLiteStore:
+    def __init__(self, db_file: str = config.STORE_DB_FILE):
+        self.db_file = db_file
+        self.local = threading.local()
+
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        with self.connection() as connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            connection = sqlite3.connect(self.db_file, timeout=config.STORE_BUSY_TIMEOUT)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return self.local.connection
+
+    def close(self):
+        if getattr(self.local, "connection", None) is not None:
+            self.local.connection.close()
+            self.local.connection = None
+
+    def source(self, user_id: str) -> str:
+        return f"sqlite:{self.db_file}"
+
+    # Save the entries of a user in a single transaction, with one row in `injuries` for each reported injury
+    def append(self, user_id: str, entries):
+        self.append_batches([(user_id, entries)])
+
+    # Save the entries of several users, `batches` being a list of (user_id, entries), in a single transaction
+    def append_batches(self, batches):
+        with self.connection() as connection:
+            for user_id, entries in batches:
+                self.insert_entries(connection, user_id, entries)
+
+    # Insert the entries of a user, with one row in `injuries` for each reported injury
+    def insert_entries(self, connection, user_id: str, entries):
+        for entry in entries:
+            values = [entry.get(column) for column in SESSION_COLUMNS]
+            values[SESSION_COLUMNS.index("date")] = iso_date(entry.get("date"))
+            cursor = connection.execute(
+                f"INSERT INTO sessions (user_id, {', '.join(SESSION_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(SESSION_COLUMNS) + 1))})",
+                [user_id] + values,
+            )
+
+            injuries = entry.get("injuries")
+            if entry.get("entry_type") == "completed" and injuries and injuries.strip():
+                connection.execute(
+                    "INSERT INTO injuries (session_id, user_id, muscle, date, description) VALUES (?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, user_id, entry.get("muscle"), iso_date(entry.get("date")), injuries),
+                )
+
+    # Generation of the rows of a user, increased each time they are rewritten by a compaction
+    def generation(self, user_id: str) -> int:
+        row = self.connection().execute("SELECT generation FROM generations WHERE user_id = ?", (user_id,)).fetchone()
+        return row["generation"] if row else 0
+
+    # Entries of a user saved since `position` (the generation of the rows and the id of the last row read)
+    # Rows are only rewritten by a compaction, which changes the generation, so all the rows are then read again.
+    def read_new_entries(self, user_id: str, position=None, records: bool = False):
+        connection = self.connection()
+        with connection:
+            # Both queries are done in the same read transaction, so they see the same rows and generation
+            connection.execute("BEGIN")
+            generation = self.generation(user_id)
+            appended = position is not None and position[0] == generation
+            rows = connection.execute(
+                f"SELECT id, {', '.join(SESSION_COLUMNS)} FROM sessions WHERE user_id = ? AND id > ? ORDER BY id",
+                (user_id, position[1] if appended else 0),
+            ).fetchall()
+
+        last_id = rows[-1]["id"] if rows else (position[1] if appended else 0)
+        entries = [row_to_entry(row) for row in rows]
+        if records:
+            strings = {}
+            entries = [record_from_dict(entry, strings) for entry in entries]
+        return entries, (generation, last_id), appended
+
+    # Same as `read_new_entries()`, the entries being decoded into `WorkoutRecord`
+    def read_new_records(self, user_id: str, position=None):
+        return self.read_new_entries(user_id, position, records=True)
+
+    # Cheap check of the changes : the generation and the id of the last row of the user
+    def signature(self, user_id: str):
+        connection = self.connection()
+        with connection:
+            connection.execute("BEGIN")
+            row = connection.execute("SELECT MAX(id) AS id FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+            return (self.generation(user_id), row["id"])
+
+    # Rows are only rewritten by a compaction, which also changes their content, so no hash is needed
+    def content_hash(self, user_id: str):
+        return None
+
+    # Compact the rows of a user in a single transaction : they are replaced by the compacted entries
+    # Stale entries are kept, they are indexed by date and are not asserted into Prolog.
+    def compact(self, user_id: str):
+        connection = self.connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+            data = [row_to_entry(row) for row in rows]
+            compacted = compact_entries(data)
+
+            if compacted != data:
+                connection.execute("DELETE FROM injuries WHERE user_id = ?", (user_id,))
+                connection.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                self.insert_entries(connection, user_id, compacted)
+                connection.execute(
+                    "INSERT INTO generations (user_id, generation) VALUES (?, 1) "
+                    "ON CONFLICT(user_id) DO UPDATE SET generation = generation + 1",
+                    (user_id,),
+                )
+
+        print(f"Compacted the sessions of {user_id} : {len(data)} -> {len(compacted)} entries")
+        return len(data), len(compacted)
+
+    def user_ids(self):
+        rows = self.connection().execute("SELECT DISTINCT user_id FROM sessions ORDER BY user_id").fetchall()
+        return [row["user_id"] for row in rows]
+
+    # Entries of a user, optionally only for a muscle, an entry type and from a date (YYYY-MM-DD)
+    def sessions(self, user_id: str, muscle: str = None, entry_type: str = None, since: str = None):
+        query = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions WHERE user_id = ?"
+        parameters = [user_id]
+
+        if muscle:
+            query += " AND muscle = ? COLLATE NOCASE"
+            parameters.append(muscle)
+        if entry_type:
+            query += " AND entry_type = ?"
+            parameters.append(entry_type)
+        if since:
+            query += " AND date >= ?"
+            parameters.append(iso_date(since))
+
+        rows = self.connection().execute(query + " ORDER BY id", parameters).fetchall()
+        return [row_to_entry(row) for row in rows]
+
+    # Injuries of a user reported from a date (YYYY-MM-DD)
+    def injuries(self, user_id: str, since: str = None):
+        rows = self.connection().execute(
+            "SELECT muscle, date, description FROM injuries WHERE user_id = ? AND date >= ? ORDER BY date",
+            (user_id, iso_date(since) if since else ""),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def row_to_entry(row) -> dict:
+    return {column: row[column] for column in SESSION_COLUMNS}
+
+
+# SQLite stores, one per database file
+sqlite_stores = {}
+
+
+# Store selected by `config.CONTEXT_STORE`
+def get_store():
+    if config.CONTEXT_STORE == "sqlite":
+        if config.STORE_DB_FILE not in sqlite_stores:
+            sqlite_stores[config.STORE_DB_FILE] = SQLiteStore(config.STORE_DB_FILE)
+        return sqlite_stores[config.STORE_DB_FILE]
+    return FileStore()
+
+
+# Group commit of the saves of concurrent requests
+# The first request waiting becomes the leader : it waits `window` seconds for other saves, then writes all of them
+# with one `append_batches()` call (one lock, one write and one fsync per file, one transaction for SQLite).
+# The other requests wait until their entries are written, so a save still returns once the entries are on disk.
+class GroupCommitter:
+    def __init__(self, window: float = config.GROUP_COMMIT_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending = []
+        self.leader = False
+        self.commits = 0
+        self.saves = 0
+
+    def save(self, store, user_id: str, entries):
+        done = threading.Event()
+        request = {"store": store, "user_id": user_id, "entries": list(entries), "done": done, "error": None}
+
+        with self.lock:
+            self.pending.append(request)
+            is_leader = not self.leader
+            self.leader = True
+
+        if is_leader:
+            time.sleep(self.window)
+            with self.lock:
+                requests, self.pending = self.pending, []
+                self.leader = False
+            self.commit(requests)
+
+        done.wait()
+        if request["error"] is not None:
+            raise request["error"]
+
+    def commit(self, requests):
+        # Entries of the same user are merged, in the order of the requests
+        groups = {}
+        for request in requests:
+            group = groups.setdefault(id(request["store"]), (request["store"], {}, []))
+            group[1].setdefault(request["user_id"], []).extend(request["entries"])
+            group[2].append(request)
+
+        for store, batches, store_requests in groups.values():
+            try:
+                store.append_batches(list(batches.items()))
+            except Exception as e:
+                for request in store_requests:
+                    request["error"] = e
+
+        with self.lock:
+            self.commits += 1
+            self.saves += len(requests)
+        for request in requests:
+            request["done"].set()
+
+    def stats(self):
+        return {"commits": self.commits, "saves": self.saves}
+
+
+group_committer = GroupCommitter()
+
+
+# Save the entries of a user in the selected store, with a single atomic write
+# With `config.GROUP_COMMIT`, the write is shared with the saves of concurrent requests.
+def save_entries(user_id: str, entries):
+    if config.GROUP_COMMIT:
+        group_committer.save(get_store(), user_id, entries)
+    else:
+        get_store().append(user_id, entries)
+
+
+# Compact the history of the given users, or of every user of the selected store
+# Used to run the compaction on a schedule, e.g. every night with cron : `python haiwpa_store.py compact`
+def compact_store(user_ids=None):
+    store = get_store()
+    return {user_id: store.compact(user_id) for user_id in (user_ids or store.user_ids())}
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["compact"]:
+        compact_store(sys.argv[2:])
+    else:
+        print("Usage : python haiwpa_store.py compact [user_id ...]")
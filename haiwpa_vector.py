@@ -0,0 +1,122 @@
+"""
+HAIWPA Vectorized Rule Engine
+
+Optional engine evaluating the rules of `workout_rules.pl` with NumPy instead of SWI-Prolog, for bulk "what-if" questions
+such as which muscles can be trained on every day of a 90-day window for thousands of users.
+Calling `can_workout/3` once per muscle, day and user is far too slow for this, so the facts are compiled once into arrays
+(rest days, recovery days, trained_together graph) and every muscle and day is evaluated at the same time.
+
+The result is a muscles x days matrix of reason codes, with the same priority as `can_workout/3` :
+injury_present, then trained_together_injured, then insufficient_rest, otherwise workout_allowed.
+Several users can be evaluated at once by adding a leading users axis to the history arrays.
+
+The history of a user is given by the latest workout and injury timestamp of each muscle (NaN if none),
+like the `last_trained/2` and `latest_injury/2` indexes in Prolog.
+
+Prolog stays the reference : `tests/test_vector_engine.py` compares both engines on randomised histories.
+
+Source :
+- https://numpy.org/doc/stable/user/basics.broadcasting.html
+- https://numpy.org/doc/stable/reference/generated/numpy.matmul.html
+
+Assistant : Claude
+"""
+
+import numpy as np
+import config
+from haiwpa_rules import load_rule_facts
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Reason codes, the names are the ones returned by can_workout/3
+WORKOUT_ALLOWED = 0
+INJURY_PRESENT = 1
+TRAINED_TOGETHER_INJURED = 2
+INSUFFICIENT_REST = 3
+
+REASONS = ["workout_allowed", "injury_present", "trained_together_injured", "insufficient_rest"]
+
+
+# Number of days between two timestamps, like days_between/3 in Prolog
+# round/1 in Prolog rounds halves away from zero, while np.round rounds them to the nearest even number
+def days_between(start, end):
+    days = (np.asarray(end, dtype=float) - np.asarray(start, dtype=float)) / SECONDS_PER_DAY
+    return np.sign(days) * np.floor(np.abs(days) + 0.5)
+
+
+class VectorRuleEngine:
+    def __init__(self, rules_file: str = config.RULES_FILE):
+        facts = load_rule_facts(rules_file)
+
+        # Muscles are kept in the order of the muscle_group/1 facts, like the alternatives found by Prolog
+        self.muscles = list(facts["muscle_groups"])
+        self.muscle_index = {muscle: i for i, muscle in enumerate(self.muscles)}
+        size = len(self.muscles)
+
+        self.rest_days = np.array([facts["rest_days"][m] for m in self.muscles], dtype=float)
+        self.recovery_days = np.array([facts["recovery_days"][m] for m in self.muscles], dtype=float)
+
+        # trained_together[i, j] is True if the fact trained_together(i, j) exists (used by alternative_muscle/2)
+        # partners[i, j] is True if i and j are trained together in either order (used by trained_together_has_injury/3)
+        self.trained_together = np.zeros((size, size), dtype=bool)
+        for first, second in facts["trained_together"]:
+            if first in self.muscle_index and second in self.muscle_index:
+                self.trained_together[self.muscle_index[first], self.muscle_index[second]] = True
+        self.partners = self.trained_together | self.trained_together.T
+
+    # Latest workout and injury timestamp of each muscle, NaN if the muscle was never trained or injured
+    # `workouts` and `injuries` are iterables of (muscle, timestamp), unknown muscles are ignored
+    def history_arrays(self, workouts, injuries=()):
+        last_trained = np.full(len(self.muscles), np.nan)
+        last_injury = np.full(len(self.muscles), np.nan)
+
+        for history, events in ((last_trained, workouts), (last_injury, injuries)):
+            for muscle, timestamp in events:
+                index = self.muscle_index.get(muscle.lower())
+                if index is not None:
+                    history[index] = np.fmax(history[index], timestamp)
+
+        return last_trained, last_injury
+
+    # Reason code of each muscle on each day
+    # `days` has shape (days,), `last_trained` and `last_injury` have shape (muscles,) or (users, muscles)
+    # The result has shape (muscles, days) or (users, muscles, days)
+    def evaluate(self, days, last_trained, last_injury):
+        days = np.asarray(days, dtype=float)
+        last_trained = np.asarray(last_trained, dtype=float)[..., :, None]
+        last_injury = np.asarray(last_injury, dtype=float)[..., :, None]
+
+        # Comparisons with NaN are False, so a muscle without history is neither injured nor resting
+        with np.errstate(invalid="ignore"):
+            injured = days_between(last_injury, days) < self.recovery_days[:, None]
+            resting = days_between(last_trained, days) < self.rest_days[:, None]
+
+        # A partner is injured if at least one muscle trained together with it is injured on that day
+        partner_injured = (self.partners.astype(np.int32) @ injured.astype(np.int32)) > 0
+
+        # Written from the lowest to the highest priority, so the first reason of can_workout/3 is kept
+        reasons = np.full(injured.shape, WORKOUT_ALLOWED, dtype=np.int8)
+        reasons[resting] = INSUFFICIENT_REST
+        reasons[partner_injured] = TRAINED_TOGETHER_INJURED
+        reasons[injured] = INJURY_PRESENT
+        return reasons
+
+    # Boolean matrix of the days on which each muscle can be trained
+    def allowed(self, days, last_trained, last_injury):
+        return self.evaluate(days, last_trained, last_injury) == WORKOUT_ALLOWED
+
+    # Alternatives suggested by suggest_alternative/3 for each muscle on each day
+    # The result has shape (..., muscles, alternatives, days)
+    # An alternative is another muscle, not trained together with the refused one, that can be trained on that day.
+    def alternatives(self, reasons):
+        size = len(self.muscles)
+        candidates = ~self.trained_together & ~np.eye(size, dtype=bool)
+
+        refused = (reasons != WORKOUT_ALLOWED)[..., :, None, :]
+        allowed = (reasons == WORKOUT_ALLOWED)[..., None, :, :]
+        return refused & allowed & candidates[:, :, None]
+
+    # Reason names of a reason code matrix, e.g. to build a report
+    def reason_names(self, reasons):
+        return np.array(REASONS)[reasons]
@@ -13,15 +13,28 @@ Assistant : Claude
 from pydantic import BaseModel, Field
 from typing import List
 import datetime
-import json
-import os
 import config
+from haiwpa_store import get_store, save_entries
 
 
 def today_date() -> str:
     return datetime.datetime.now().strftime("%Y-%m-%d")
 
 
+# Build a context file entry from an extracted session (a `FitnessExtract` dumped to a dict)
+def context_entry(session: dict, user_input: str) -> dict:
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "user_input": user_input,
+        "muscle": session.get("muscle", ""),
+        "exercises": session.get("exercises", ""),
+        "duration": session.get("duration") or 0.0,
+        "date": session.get("date") or today_date(),
+        "injuries": session.get("injuries") or "",
+        "entry_type": session.get("entry_type", ""),
+    }
+
+
 # Class to extract fitness exercises, duration limits, recent training history, injuries from user input
 # This function is based on https://www.youtube.com/watch?v=VllkW63LWbY
 class FitnessExtract(BaseModel):
@@ -74,40 +87,10 @@ class FitnessExtract(BaseModel):
         print(f'"entry_type":"{self.entry_type}"')
         print("=====================================")
 
-    # Function that saves the extracted information from the user prompt to a JSON file
+    # Function that saves the extracted information from the user prompt to the store of the user (`config.CONTEXT_STORE`)
     # This function was created using Claude
-    def save_to_json(self, user_input: str):
-        os.makedirs(config.DATA_FOLDER, exist_ok=True)
-
-        # Converts duration to 0 if it is null
-        if not self.duration:
-            self.duration = 0.0
-
-        entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "user_input": user_input,
-            "muscle": self.muscle,
-            "exercises": self.exercises,
-            "duration": self.duration,
-            "date": self.date,
-            "injuries": self.injuries,
-            "entry_type": self.entry_type,
-        }
-
-        if os.path.exists(config.CONTEXT_FILE):
-            try:
-                with open(config.CONTEXT_FILE, "r") as f:
-                    data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-        else:
-            data = []
-
-        data.append(entry)
-        with open(config.CONTEXT_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-
-        print(f"Saved workout data to {config.CONTEXT_FILE}")
+    def save_to_json(self, user_input: str, user_id: str = config.DEFAULT_USER_ID):
+        save_sessions([self], user_input, user_id)
 
 
 # Class to handle multiple training sessions extracted from user input
@@ -122,3 +105,16 @@ class MultipleFitnessExtract(BaseModel):
             "4 - Different dates = separate sessions"
         )
     )
+
+
+# Function that saves all the sessions extracted from one message with a single atomic write
+# Either all of them are saved or none, a message is never saved halfway if the process stops.
+def save_sessions(sessions, user_input: str, user_id: str = config.DEFAULT_USER_ID):
+    for session in sessions:
+        # Converts duration to 0 if it is null
+        if not session.duration:
+            session.duration = 0.0
+
+    save_entries(user_id, [context_entry(session.model_dump(), user_input) for session in sessions])
+
+    print(f"Saved {len(sessions)} workout sessions to {get_store().source(user_id)}")
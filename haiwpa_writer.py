@@ -0,0 +1,64 @@
+"""
+HAIWPA Background Writer
+
+Runs file writes in a background thread, so the MCP server can answer as soon as the sessions of a user
+are asserted into Prolog, without waiting for its context file to be saved.
+Writes are done one at a time, in the order they were submitted, so the entries of a user keep their order.
+Pending writes are done before the process exits.
+
+Source :
+- https://docs.python.org/3/library/queue.html
+- https://docs.python.org/3/library/threading.html
+
+Assistant : Claude
+"""
+
+import atexit
+import queue
+import threading
+
+
+class BackgroundWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+
+    # The thread is only started on the first write, a daemon thread does not block the process exit
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="haiwpa-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            function, args = self.queue.get()
+            try:
+                function(*args)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Background write failed : {e}")
+            finally:
+                self.queue.task_done()
+
+    # Run `function(*args)` in the writer thread
+    def submit(self, function, *args):
+        self._start()
+        self.queue.put((function, args))
+
+    # Wait until every submitted write is done, e.g. before reading a file that is being written
+    def flush(self):
+        if self.thread is not None:
+            self.queue.join()
+
+    def stats(self):
+        return {
+            "pending": self.queue.unfinished_tasks,
+            "written": self.written,
+            "errors": self.errors,
+        }
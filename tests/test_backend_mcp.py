@@ -12,17 +12,29 @@ import pytest
 import os
 import sys
 import json
+import asyncio
+import datetime
+from types import SimpleNamespace
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from haiwpa_backend import HAIWPABackend
+from haiwpa_backend import HAIWPABackend, run_load_test, extraction_cache_key, prompt_cache_usage
+from haiwpa_workout import FitnessExtract
 import config
 
 
 @pytest.fixture(scope="module")
-def backend():
+def backend(tmp_path_factory):
     """Create HAIWPABackend instance for testing"""
-    return HAIWPABackend()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(config, "EXTRACTION_CACHE_FILE", str(tmp_path_factory.mktemp("cache") / "extraction.db"))
+        return HAIWPABackend()
+
+
+@pytest.fixture(autouse=True)
+def extraction_cache_file(tmp_path, monkeypatch):
+    """Keep the extractions cached on disk by each test in its own folder"""
+    monkeypatch.setattr(config, "EXTRACTION_CACHE_FILE", str(tmp_path / "extraction_cache.db"))
 
 
 class TestIsFitnessRelated:
@@ -159,6 +171,25 @@ class TestConvertValidationToMessage:
         
         assert "max rest days" in result.lower() or "2" in result
 
+    def test_no_max_rest_days_for_new_user(self, backend):
+        """Should not mention max rest days when the user has no completed workout"""
+        validation_results = [
+            {
+                "date": "2025-01-15",
+                "muscle": "legs",
+                "exercises": "squats",
+                "duration": 60,
+                "injuries": "",
+                "entry_type": "planned",
+                "validation": {"approved": False, "reason": "Insufficient rest."},
+                "max_rest_days": None
+            }
+        ]
+
+        result = backend.convert_validation_to_message(validation_results)
+
+        assert "max rest days" not in result.lower()
+
     def test_empty_results_returns_none(self, backend):
         """Should return None for empty results"""
         result = backend.convert_validation_to_message([])
@@ -189,6 +220,511 @@ class TestConvertValidationToMessage:
         # Should include the LLM context header from config
         assert "WORKOUT VALIDATION" in result or "Prolog" in result
         
+class FakeStream:
+    """Stream of chunks like the ones sent by the Llama.cpp server"""
+
+    def __init__(self, tokens, completion_tokens=None):
+        self.chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+            for token in tokens
+        ]
+        if completion_tokens is not None:
+            self.chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(completion_tokens=completion_tokens)))
+
+    def __aiter__(self):
+        return self.stream()
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeCompletions:
+    """Completions API returning a FakeStream and keeping the request"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.request = None
+
+    async def create(self, **request):
+        self.request = request
+        return self.stream
+
+
+class TestStreaming:
+    """Tests for the streamed answers (no LLM server needed)"""
+
+    @pytest.fixture
+    def streaming_backend(self, monkeypatch):
+        backend = HAIWPABackend()
+        completions = FakeCompletions(FakeStream(["You ", "can ", "train ", "legs", ""], completion_tokens=4))
+        monkeypatch.setattr(backend, "async_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        return backend, completions
+
+    @pytest.mark.asyncio
+    async def test_tokens_are_streamed(self, streaming_backend):
+        """Should yield each token as it arrives and measure the stream"""
+        backend, completions = streaming_backend
+        tokens = [token async for token in backend.chat_stream([{"role": "user", "content": "hello"}])]
+
+        assert tokens == ["You ", "can ", "train ", "legs"]
+        assert completions.request["stream"] == True
+        assert backend.stream_stats["tokens"] == 4
+        assert backend.stream_stats["time_to_first_token"] is not None
+
+    @pytest.mark.asyncio
+    async def test_chat_with_history_yields_answer_so_far(self, streaming_backend, monkeypatch):
+        """Should yield the growing answer, with the message sent after the history"""
+        backend, completions = streaming_backend
+        monkeypatch.setattr(config, "STREAM_ANSWERS", True)
+        history = [{"role": "assistant", "content": "Hi"}]
+
+        answers = [answer async for answer in backend.chat_with_history("hello", history)]
+
+        assert answers == ["You ", "You can ", "You can train ", "You can train legs"]
+        assert completions.request["messages"] == [
+            {"role": "assistant", "content": "Hi"},
+            {"role": "user", "content": "hello"},
+        ]
+
+    @pytest.mark.asyncio
+    async def test_validation_context_before_generation(self, streaming_backend, monkeypatch):
+        """Should add the Prolog validation to the prompt before the generation starts"""
+        backend, completions = streaming_backend
+        monkeypatch.setattr(config, "STREAM_ANSWERS", True)
+        session = SimpleNamespace(print_extracted_info=lambda: None)
+        monkeypatch.setattr(backend, "extract_fitness_info", lambda message: asyncio_value([session]))
+        monkeypatch.setattr(backend, "ingest_sessions_mcp", lambda *args: asyncio_value({"ingested": 1}))
+        monkeypatch.setattr(backend, "validate_workout_mcp", lambda user_id: asyncio_value(
+            [{"muscle": "legs", "date": "2025-01-15", "validation": {"approved": True, "reason": "ok"}}]
+        ))
+        monkeypatch.setattr(config, "DIRECT_INGESTION", True)
+
+        answers = [answer async for answer in backend.chat_with_history("Can I train legs today ?", [])]
+
+        assert answers[-1] == "You can train legs"
+        assert completions.request["messages"][0]["role"] == "system"
+        assert "legs on 2025-01-15" in completions.request["messages"][0]["content"]
+
+
+class TestPlanning:
+    """Tests for the planning questions of the chat"""
+
+    def test_plan_message(self, backend):
+        """Should list the muscles of each day, the rest days and the unknown muscles"""
+        plan = {
+            "plan": [{"date": "2025-01-15", "muscles": ["chest", "legs"]}, {"date": "2025-01-16", "muscles": []}],
+            "invalid_targets": ["neck"],
+        }
+        result = backend.convert_plan_to_message(plan)
+
+        assert result.startswith(config.LLM_CONTEXT_FOR_PLAN)
+        assert "- 2025-01-15 : chest, legs" in result
+        assert "- 2025-01-16 : rest day" in result
+        assert "neck" in result
+
+    def test_empty_plan_returns_none(self, backend):
+        """Should return None without a plan"""
+        assert backend.convert_plan_to_message(None) is None
+        assert backend.convert_plan_to_message({"plan": [], "invalid_targets": []}) is None
+
+    @pytest.mark.asyncio
+    async def test_planning_question_uses_plan_tool(self, backend, monkeypatch):
+        """Should add the plan of the MCP tool to the prompt, without saving the muscles as sessions"""
+        calls = []
+
+        async def plan_workouts_mcp(start_date, days, targets, user_id):
+            calls.append((days, targets, user_id))
+            return {"plan": [{"date": start_date, "muscles": ["chest"]}], "invalid_targets": []}
+
+        async def extract_fitness_info(message):
+            raise AssertionError("A planning question should not be extracted")
+
+        monkeypatch.setattr(config, "PLAN_FROM_CHAT", True)
+        monkeypatch.setattr(backend, "plan_workouts_mcp", plan_workouts_mcp)
+        monkeypatch.setattr(backend, "extract_fitness_info", extract_fitness_info)
+
+        messages = await backend.build_messages("Plan my next 5 days for chest and legs", [], "alice")
+
+        assert calls == [(5, ["chest", "legs"], "alice")]
+        assert messages[0]["role"] == "system"
+        assert "WORKOUT PLAN" in messages[0]["content"]
+        assert messages[-1] == {"role": "user", "content": "Plan my next 5 days for chest and legs"}
+
+
+    @pytest.mark.asyncio
+    async def test_own_plan_is_validated(self, backend, monkeypatch):
+        """Should extract and validate "I plan to train legs in 3 days" instead of planning 3 days"""
+        async def plan_workouts_mcp(*args):
+            raise AssertionError("A session of the user should not be planned")
+
+        session = FitnessExtract(muscle="legs", exercises="", date="2025-01-18", entry_type="planned")
+        monkeypatch.setattr(config, "PLAN_FROM_CHAT", True)
+        monkeypatch.setattr(config, "DIRECT_INGESTION", True)
+        monkeypatch.setattr(backend, "plan_workouts_mcp", plan_workouts_mcp)
+        monkeypatch.setattr(backend, "extract_fitness_info", lambda message: asyncio_value([session]))
+        monkeypatch.setattr(backend, "ingest_sessions_mcp", lambda *args: asyncio_value({"ingested": 1}))
+        monkeypatch.setattr(backend, "validate_workout_mcp", lambda user_id: asyncio_value(
+            [{"muscle": "legs", "date": "2025-01-18", "validation": {"approved": True, "reason": "ok"}}]
+        ))
+
+        messages = await backend.build_messages("I plan to train legs in 3 days, is it ok?", [], "alice")
+
+        assert "legs on 2025-01-18" in messages[0]["content"]
+        assert "WORKOUT PLAN" not in messages[0]["content"]
+
+
+async def asyncio_value(value):
+    return value
+
+
+class SlowCompletions:
+    """Completions API waiting `delay` seconds before the stream, like a busy LLM server"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+
+    async def create(self, **request):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return FakeStream(["ok"], completion_tokens=1)
+
+
+class TestConcurrency:
+    """Tests for the concurrent chats (no LLM server needed)"""
+
+    def slow_backend(self, monkeypatch, concurrency):
+        monkeypatch.setattr(config, "LLM_MAX_CONCURRENCY", concurrency)
+        monkeypatch.setattr(config, "STREAM_ANSWERS", True)
+        backend = HAIWPABackend()
+        completions = SlowCompletions(0.2)
+        monkeypatch.setattr(backend, "async_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        return backend, completions
+
+    @pytest.mark.asyncio
+    async def test_chats_overlap(self, monkeypatch):
+        """Should run concurrent chats at the same time instead of one after another"""
+        backend, completions = self.slow_backend(monkeypatch, 4)
+        report = await run_load_test(4, "hello", backend)
+
+        assert completions.max_running == 4
+        assert report["wall_seconds"] < 0.5
+        assert report["overlap"] > 2
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, monkeypatch):
+        """Should not send more requests than `config.LLM_MAX_CONCURRENCY` to the LLM server"""
+        backend, completions = self.slow_backend(monkeypatch, 2)
+        report = await run_load_test(4, "hello", backend)
+
+        assert completions.max_running == 2
+        assert report["wall_seconds"] >= 0.4
+
+    @pytest.mark.asyncio
+    async def test_extraction_is_awaited(self, monkeypatch):
+        """Should extract the sessions with the async Instructor client"""
+        monkeypatch.setattr(config, "FAST_PATH_EXTRACTION", False)
+        backend = HAIWPABackend()
+        session = FitnessExtract(muscle="legs", exercises="", entry_type="completed")
+        completions = SimpleNamespace(create=lambda **request: asyncio_value(SimpleNamespace(sessions=[session])))
+        monkeypatch.setattr(backend, "instructor_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+        assert await backend.extract_fitness_info("I trained legs") == [session]
+
+
+class TestFastPathExtraction:
+    """Tests for the rule-based extraction tried before the LLM (no LLM server needed)"""
+
+    @pytest.fixture
+    def fast_backend(self, monkeypatch):
+        monkeypatch.setattr(config, "FAST_PATH_EXTRACTION", True)
+        backend = HAIWPABackend()
+        llm_messages = []
+
+        async def extract_with_llm(message):
+            llm_messages.append(message)
+            await asyncio.sleep(0.05)
+            return [FitnessExtract(muscle="legs", exercises="", entry_type="completed")]
+
+        monkeypatch.setattr(backend, "extract_fitness_info_llm", extract_with_llm)
+        return backend, llm_messages
+
+    @pytest.mark.asyncio
+    async def test_simple_message_skips_llm(self, fast_backend):
+        """Should extract a simple message with the rules, without calling the LLM"""
+        backend, llm_messages = fast_backend
+        sessions = await backend.extract_fitness_info("I trained chest yesterday")
+
+        assert [session.muscle for session in sessions] == ["chest"]
+        assert sessions[0].entry_type == "completed"
+        assert llm_messages == []
+        assert backend.extraction_stats["fast_path"] == 1
+
+    @pytest.mark.asyncio
+    async def test_low_confidence_uses_llm(self, fast_backend):
+        """Should send the messages the rules cannot read to the LLM"""
+        backend, llm_messages = fast_backend
+        await backend.extract_fitness_info("My knee hurts since I trained legs on monday")
+
+        assert llm_messages == ["My knee hurts since I trained legs on monday"]
+        assert backend.extraction_stats["llm"] == 1
+
+    @pytest.mark.asyncio
+    async def test_extraction_report(self, fast_backend):
+        """Should report the hit rate of the fast path and the time it saved"""
+        backend, _ = fast_backend
+        await backend.extract_fitness_info("I did squats today")
+        await backend.extract_fitness_info("I did squats today")
+        await backend.extract_fitness_info("Legs maybe")
+
+        report = backend.extraction_report()
+        assert report["extractions"] == 3
+        assert report["fast_path_hit_rate"] == pytest.approx(2 / 3)
+        assert report["llm_average_seconds"] >= 0.05
+        assert report["saved_seconds"] > 0.05
+
+
+# Chat completion of the Llama.cpp server with `content` as the answer
+def completion_response(content):
+    return {
+        "id": "test", "object": "chat.completion", "created": 0, "model": "test",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class TestExtractionRetries:
+    """Tests for the extraction modes and the retry counts, with a fake LLM server (no LLM server needed)"""
+
+    SESSIONS = {"sessions": [{"muscle": "legs", "exercises": "squats", "duration": 30.0, "date": "2025-01-15",
+                              "injuries": "", "entry_type": "completed"}]}
+    # The flat object the model often writes instead of the sessions array
+    FLAT = SESSIONS["sessions"][0]
+
+    def fake_backend(self, monkeypatch, mode, answers):
+        import httpx
+        import instructor
+        from openai import AsyncOpenAI
+        import haiwpa_backend
+
+        monkeypatch.setattr(config, "EXTRACTION_MODE", mode)
+        monkeypatch.setattr(config, "FAST_PATH_EXTRACTION", False)
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(200, json=completion_response(json.dumps(answers[len(requests) - 1])))
+
+        backend = HAIWPABackend()
+        client = AsyncOpenAI(base_url="http://llm/v1", api_key="test",
+                             http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        backend.instructor_client = instructor.from_openai(client, mode=haiwpa_backend.EXTRACTION_MODES[mode])
+        return backend, requests
+
+    @pytest.mark.asyncio
+    async def test_schema_sent_to_llm(self, monkeypatch):
+        """Should send the MultipleFitnessExtract schema to the LLM server in json_schema mode"""
+        backend, requests = self.fake_backend(monkeypatch, "json_schema", [self.SESSIONS])
+        sessions = await backend.extract_fitness_info("I trained legs")
+
+        assert [session.muscle for session in sessions] == ["legs"]
+        assert "sessions" in requests[0]["response_format"]["schema"]["properties"]
+        assert backend.extraction_retries == {0: 1}
+
+    @pytest.mark.asyncio
+    async def test_retries_are_counted(self, monkeypatch):
+        """Should count the new generation asked after a flat answer in json mode"""
+        backend, requests = self.fake_backend(monkeypatch, "json", [self.FLAT, self.SESSIONS])
+        sessions = await backend.extract_fitness_info("I trained legs")
+
+        assert len(requests) == 2
+        assert [session.muscle for session in sessions] == ["legs"]
+        assert backend.extraction_retries == {1: 1}
+        assert backend.extraction_report()["llm_retries_per_request"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_attempts_are_limited(self, monkeypatch):
+        """Should stop after config.EXTRACTION_MAX_ATTEMPTS invalid answers"""
+        monkeypatch.setattr(config, "EXTRACTION_MAX_ATTEMPTS", 2)
+        backend, requests = self.fake_backend(monkeypatch, "json", [self.FLAT, self.FLAT, self.FLAT])
+
+        assert await backend.extract_fitness_info("I trained legs") is None
+        assert len(requests) == 2
+        assert backend.extraction_retries == {1: 1}
+
+
+class TestExtractionCache:
+    """Tests for the cache of the LLM extractions (no LLM server needed)"""
+
+    @pytest.fixture
+    def cached_backend(self, monkeypatch):
+        monkeypatch.setattr(config, "FAST_PATH_EXTRACTION", False)
+        monkeypatch.setattr(config, "EXTRACTION_CACHE", True)
+        llm_messages = []
+
+        async def extract_with_llm(message):
+            llm_messages.append(message)
+            return [FitnessExtract(muscle="legs", exercises="", date="2025-01-16", entry_type="planned")]
+
+        def create_backend():
+            backend = HAIWPABackend()
+            monkeypatch.setattr(backend, "extract_fitness_info_llm", extract_with_llm)
+            return backend
+
+        return create_backend, llm_messages
+
+    def test_cache_key(self):
+        """Should ignore case, punctuation and whitespace, but not the date of the day"""
+        today = datetime.date(2025, 1, 15)
+        key = extraction_cache_key("Can I train legs tomorrow?", today)
+
+        assert extraction_cache_key("  can i train LEGS   tomorrow ", today) == key
+        assert extraction_cache_key("Can I train legs tomorrow?", datetime.date(2025, 1, 16)) != key
+        assert extraction_cache_key("Can I train chest tomorrow?", today) != key
+
+    @pytest.mark.asyncio
+    async def test_repeated_message_uses_cache(self, cached_backend):
+        """Should call the LLM once for a rephrased message and return new sessions"""
+        create_backend, llm_messages = cached_backend
+        backend = create_backend()
+
+        first = await backend.extract_fitness_info("Can I train legs tomorrow?")
+        first[0].duration = 45.0
+        second = await backend.extract_fitness_info("can i train legs tomorrow")
+
+        assert len(llm_messages) == 1
+        assert second[0].muscle == "legs" and second[0].duration == 0.0
+        assert backend.extraction_report()["cache"]["hit_rate"] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_disk_cache_survives_restart(self, cached_backend):
+        """Should find the extraction of a previous backend in the disk cache"""
+        create_backend, llm_messages = cached_backend
+        await create_backend().extract_fitness_info("Can I train legs tomorrow?")
+
+        backend = create_backend()
+        sessions = await backend.extract_fitness_info("Can I train legs tomorrow?")
+
+        assert len(llm_messages) == 1
+        assert sessions[0].muscle == "legs"
+        assert backend.extraction_report()["cache"]["disk"]["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_extraction_not_cached(self, monkeypatch):
+        """Should call the LLM again after a failed extraction"""
+        monkeypatch.setattr(config, "FAST_PATH_EXTRACTION", False)
+        backend = HAIWPABackend()
+        calls = []
+
+        async def failing_llm(message):
+            calls.append(message)
+            return None
+
+        monkeypatch.setattr(backend, "extract_fitness_info_llm", failing_llm)
+        await backend.extract_fitness_info("Can I train legs tomorrow?")
+        await backend.extract_fitness_info("Can I train legs tomorrow?")
+        assert len(calls) == 2
+
+
+class TestPromptCache:
+    """Tests for the append-only prompts and the slots of the conversations (no LLM server needed)"""
+
+    @pytest.fixture
+    def cache_backend(self, monkeypatch):
+        monkeypatch.setattr(config, "STREAM_ANSWERS", True)
+        monkeypatch.setattr(config, "PROMPT_CACHE", True)
+        monkeypatch.setattr(config, "LLM_MAX_CONCURRENCY", 2)
+        backend = HAIWPABackend()
+        stream = FakeStream(["Yes"], completion_tokens=1)
+        # Timings added by Llama.cpp to the last chunk
+        stream.chunks[-1].model_extra = {"timings": {"cache_n": 100, "prompt_n": 20}}
+        completions = FakeCompletions(stream)
+        requests = []
+
+        async def create(**request):
+            requests.append(request)
+            return await FakeCompletions.create(completions, **request)
+
+        completions.create = create
+        monkeypatch.setattr(backend, "async_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        return backend, requests
+
+    async def answer(self, backend, message, history, user_id="alice"):
+        answers = [answer async for answer in backend.chat_with_history(message, history, user_id)]
+        return answers[-1]
+
+    @pytest.mark.asyncio
+    async def test_previous_prompt_is_prefix(self, cache_backend):
+        """Should start the next prompt with the previous prompt and its answer, and report the cached tokens"""
+        backend, requests = cache_backend
+        answer = await self.answer(backend, "Hello", [])
+        history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": answer}]
+        await self.answer(backend, "Thanks", history)
+
+        assert requests[1]["messages"][:2] == requests[0]["messages"] + [{"role": "assistant", "content": "Yes"}]
+        assert backend.stream_stats["reused_messages"] == 2
+        assert backend.stream_stats["cached_tokens"] == 100
+        assert backend.stream_stats["prompt_eval_tokens"] == 20
+
+    @pytest.mark.asyncio
+    async def test_validation_context_kept_in_prefix(self, cache_backend, monkeypatch):
+        """Should keep the validation context of the previous turn where it was, instead of dropping it"""
+        backend, requests = cache_backend
+        session = SimpleNamespace(print_extracted_info=lambda: None)
+        monkeypatch.setattr(backend, "extract_fitness_info", lambda message: asyncio_value([session]))
+        monkeypatch.setattr(backend, "ingest_sessions_mcp", lambda *args: asyncio_value({"ingested": 1}))
+        monkeypatch.setattr(backend, "validate_workout_mcp", lambda user_id: asyncio_value(
+            [{"muscle": "legs", "date": "2025-01-15", "validation": {"approved": True, "reason": "ok"}}]
+        ))
+        monkeypatch.setattr(config, "DIRECT_INGESTION", True)
+
+        await self.answer(backend, "Can I train legs today ?", [])
+        history = [{"role": "user", "content": "Can I train legs today ?"}, {"role": "assistant", "content": "Yes"}]
+        await self.answer(backend, "Thanks", history)
+
+        first, second = requests[0]["messages"], requests[1]["messages"]
+        assert first[0]["role"] == "system"
+        assert second[:3] == first + [{"role": "assistant", "content": "Yes"}]
+        assert second[-1] == {"role": "user", "content": "Thanks"}
+
+    @pytest.mark.asyncio
+    async def test_changed_history_is_rebuilt(self, cache_backend):
+        """Should use the Gradio history when it is not the previous turn (retried or edited message)"""
+        backend, requests = cache_backend
+        await self.answer(backend, "Hello", [])
+        history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Yes"}]
+        await self.answer(backend, "Thanks", history)
+
+        assert requests[1]["messages"] == history + [{"role": "user", "content": "Thanks"}]
+        assert backend.stream_stats["reused_messages"] == 0
+
+    @pytest.mark.asyncio
+    async def test_conversation_keeps_its_slot(self, cache_backend):
+        """Should send every turn of a conversation to the same slot, with the prompt cache enabled"""
+        backend, requests = cache_backend
+        await self.answer(backend, "Hello", [], "alice")
+        await self.answer(backend, "Hello", [], "bob")
+        await self.answer(backend, "Hello", [], "carol")
+        await self.answer(backend, "Thanks", [], "alice")
+
+        slots = [request["extra_body"]["id_slot"] for request in requests]
+        assert slots == [0, 1, 0, 0]
+        assert all(request["extra_body"]["cache_prompt"] for request in requests)
+
+    def test_prompt_cache_usage(self):
+        """Should read the cached tokens from the usage or the timings of Llama.cpp"""
+        usage = SimpleNamespace(prompt_tokens=120, prompt_tokens_details=SimpleNamespace(cached_tokens=90))
+        assert prompt_cache_usage(usage, None) == {"prompt_tokens": 120, "cached_tokens": 90, "prompt_eval_tokens": 30}
+        assert prompt_cache_usage(None, {"cache_n": 100, "prompt_n": 20}) == {
+            "prompt_tokens": 120, "cached_tokens": 100, "prompt_eval_tokens": 20
+        }
+        assert prompt_cache_usage(None, None)["cached_tokens"] is None
+
+
 class TestBackendMCPIntegration:
     """Integration tests for backend-MCP communication"""
     
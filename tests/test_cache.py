@@ -0,0 +1,137 @@
+"""
+Unit Tests for the LRU Cache (haiwpa_cache.py)
+
+Tests eviction order, hit/miss counters, expiry, and the disk and tiered caches.
+
+Run with: pytest tests/test_cache.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_cache import LRUCache, DiskCache, TieredCache, MISSING
+
+
+class TestLRUCache:
+    """Tests for LRUCache"""
+
+    def test_get_missing_key(self):
+        """Should return MISSING for unknown keys"""
+        cache = LRUCache(max_size=2)
+        assert cache.get("chest") is MISSING
+
+    def test_none_can_be_cached(self):
+        """Should differentiate a cached None from a missing key"""
+        cache = LRUCache(max_size=2)
+        cache.put("chest", None)
+        assert cache.get("chest") is None
+
+    def test_evicts_least_recently_used(self):
+        """Should evict the least recently used entry above max_size"""
+        cache = LRUCache(max_size=2)
+        cache.put("chest", 1)
+        cache.put("back", 2)
+        cache.get("chest")
+        cache.put("legs", 3)
+
+        assert cache.get("back") is MISSING
+        assert cache.get("chest") == 1
+        assert cache.get("legs") == 3
+        assert len(cache) == 2
+
+    def test_hit_and_miss_counters(self):
+        """Should count hits and misses"""
+        cache = LRUCache(max_size=2)
+        cache.put("chest", 1)
+        cache.get("chest")
+        cache.get("chest")
+        cache.get("back")
+
+        stats = cache.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+    def test_expired_entry(self):
+        """Should not return an entry after its time to live"""
+        cache = LRUCache(max_size=2, ttl=0.05)
+        cache.put("chest", 1)
+        assert cache.get("chest") == 1
+
+        time.sleep(0.06)
+        assert cache.get("chest") is MISSING
+        assert len(cache) == 0
+        assert cache.stats()["expired"] == 1
+
+
+class TestDiskCache:
+    """Tests for DiskCache"""
+
+    def test_values_survive_reopening(self, tmp_path):
+        """Should keep the JSON values in the SQLite file"""
+        cache = DiskCache(str(tmp_path / "cache.db"), max_size=2)
+        cache.put("chest", [{"muscle": "chest"}])
+        cache.close()
+
+        assert DiskCache(str(tmp_path / "cache.db"), max_size=2).get("chest") == [{"muscle": "chest"}]
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Should delete the least recently used rows above max_size"""
+        cache = DiskCache(str(tmp_path / "cache.db"), max_size=2)
+        cache.put("chest", 1)
+        time.sleep(0.01)
+        cache.put("back", 2)
+        time.sleep(0.01)
+        cache.get("chest")
+        time.sleep(0.01)
+        cache.put("legs", 3)
+
+        assert cache.get("back") is MISSING
+        assert cache.get("chest") == 1
+        assert len(cache) == 2
+
+    def test_expired_entry(self, tmp_path):
+        """Should delete an entry after its time to live"""
+        cache = DiskCache(str(tmp_path / "cache.db"), max_size=2, ttl=0.05)
+        cache.put("chest", 1)
+        time.sleep(0.06)
+
+        assert cache.get("chest") is MISSING
+        assert len(cache) == 0
+
+
+class TestTieredCache:
+    """Tests for TieredCache"""
+
+    def test_disk_value_is_copied_to_memory(self, tmp_path):
+        """Should read a value from disk once, then from memory"""
+        disk = DiskCache(str(tmp_path / "cache.db"), max_size=10, ttl=60)
+        disk.put("chest", 1)
+        cache = TieredCache(LRUCache(max_size=10, ttl=60), disk)
+
+        assert cache.get("chest") == 1
+        assert cache.get("chest") == 1
+        assert disk.hits == 1
+
+        stats = cache.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 0
+        assert stats["memory"]["hits"] == 1
+
+    def test_memory_only(self):
+        """Should work without a disk tier"""
+        cache = TieredCache(LRUCache(max_size=10))
+        cache.put("chest", None)
+
+        assert cache.get("chest") is None
+        assert cache.get("back") is MISSING
+        assert cache.stats()["hit_rate"] == 0.5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,143 @@
+"""
+Unit Tests for the Columnar History (haiwpa_columnar.py)
+
+Tests the columns written for the completed workouts of a user, the memory-mapped reads,
+the date range queries and the history given to the vectorized rule engine.
+
+Run with: pytest tests/test_columnar.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+import time
+import datetime
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_columnar import ColumnarHistory, write_history, epoch_day, build_user_history, open_user_history
+from haiwpa_store import FileStore
+from haiwpa_records import day_timestamp
+from haiwpa_vector import VectorRuleEngine, INJURY_PRESENT, WORKOUT_ALLOWED
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "workout_rules.pl")
+
+
+def make_entry(muscle, date, entry_type="completed", exercises="test", duration=30.0, injuries=""):
+    return {"timestamp": date, "user_input": "test", "muscle": muscle, "exercises": exercises,
+            "duration": duration, "date": date, "injuries": injuries, "entry_type": entry_type}
+
+
+@pytest.fixture
+def history(tmp_path):
+    entries = [
+        make_entry("legs", "2025-01-12", exercises="squats", duration=50.0),
+        make_entry("chest", "2025-01-10", exercises="bench press"),
+        make_entry("Biceps", "11.01.2025", exercises="curls", injuries="elbow pain"),
+        make_entry("chest", "2025-01-14", exercises="bench press", duration=40.0),
+        make_entry("back", "2025-01-20", entry_type="planned"),
+    ]
+    write_history(str(tmp_path / "alice"), entries, RULES_PATH)
+    return ColumnarHistory(str(tmp_path / "alice"))
+
+
+class TestColumnarHistory:
+    """Tests for write_history and ColumnarHistory"""
+
+    def test_epoch_day(self):
+        """Should count the days since 1970-01-01 for both date formats"""
+        assert epoch_day("1970-01-02") == 1
+        assert epoch_day("15.01.2025") == epoch_day("2025-01-15")
+
+    def test_columns(self, history):
+        """Should save the completed workouts sorted by day, with compact types"""
+        assert len(history) == 4
+        assert list(history.days) == [epoch_day(d) for d in ("2025-01-10", "2025-01-11", "2025-01-12", "2025-01-14")]
+        assert history.days.dtype == np.int32
+        assert history.muscles.dtype == np.uint8
+        assert history.durations.dtype == np.float32
+        assert [history.muscle_names[m] for m in history.muscles] == ["chest", "biceps", "legs", "chest"]
+        assert [history.exercise_names[e] for e in history.exercises] == ["bench press", "curls", "squats", "bench press"]
+        assert list(history.injured) == [False, True, False, False]
+
+    def test_columns_are_memory_mapped(self, history):
+        """Should open the columns without reading them into memory"""
+        assert isinstance(history.days, np.memmap)
+        assert isinstance(history.sessions("2025-01-11", "2025-01-12")["days"], np.memmap)
+
+    def test_date_range(self, history):
+        """Should find the sessions of a date range, both dates included"""
+        assert history.day_range("2025-01-11", "2025-01-12") == slice(1, 3)
+        assert history.day_range("2025-01-13") == slice(3, 4)
+        assert history.day_range(end="2025-01-01") == slice(0, 0)
+
+    def test_summary(self, history):
+        """Should count the sessions, duration and injuries of each muscle"""
+        assert history.summary() == {
+            "chest": {"sessions": 2, "duration": 70.0, "injuries": 0},
+            "biceps": {"sessions": 1, "duration": 30.0, "injuries": 1},
+            "legs": {"sessions": 1, "duration": 50.0, "injuries": 0},
+        }
+        assert list(history.summary("2025-01-13")) == ["chest"]
+
+    def test_new_version_replaces_previous(self, tmp_path, history):
+        """Should read the new version, while the previous one stays readable by its open reader"""
+        write_history(str(tmp_path / "alice"), [make_entry("legs", "2025-02-01")], RULES_PATH)
+
+        assert len(ColumnarHistory(str(tmp_path / "alice"))) == 1
+        assert len(history.days) == 4
+        assert len(os.listdir(tmp_path / "alice")) == 2
+
+    def test_missing_history(self, tmp_path):
+        """Should raise FileNotFoundError if no history was written"""
+        with pytest.raises(FileNotFoundError):
+            ColumnarHistory(str(tmp_path / "nobody"))
+
+    @pytest.fixture
+    def local_time_zone(self, monkeypatch):
+        """Use a time zone that is not UTC, so the local midnights are not the UTC ones"""
+        monkeypatch.setenv("TZ", "America/New_York")
+        time.tzset()
+        day_timestamp.cache_clear()
+        yield
+        monkeypatch.undo()
+        time.tzset()
+        day_timestamp.cache_clear()
+
+    def test_vector_engine_history(self, history, local_time_zone):
+        """Should give the same history arrays as VectorRuleEngine.history_arrays with the local dates"""
+        engine = VectorRuleEngine(RULES_PATH)
+        last_trained, last_injury = history.last_timestamps(engine.muscles)
+
+        # Local midnight of the dates, as sent to Prolog by `convert_date_to_timestamp()`
+        day = lambda date: datetime.datetime.strptime(date, "%Y-%m-%d").timestamp()
+        assert day("2025-01-10") != epoch_day("2025-01-10") * 86400
+        expected = engine.history_arrays(
+            [("chest", day("2025-01-10")), ("biceps", day("2025-01-11")), ("legs", day("2025-01-12")),
+             ("chest", day("2025-01-14"))],
+            [("biceps", day("2025-01-11"))],
+        )
+        np.testing.assert_array_equal(last_trained, expected[0])
+        np.testing.assert_array_equal(last_injury, expected[1])
+
+        reasons = engine.evaluate([day("2025-01-12"), day("2025-02-01")], last_trained, last_injury)
+        assert reasons[engine.muscle_index["biceps"], 0] == INJURY_PRESENT
+        assert reasons[engine.muscle_index["biceps"], 1] == WORKOUT_ALLOWED
+
+    def test_build_user_history(self, tmp_path, monkeypatch):
+        """Should build the history of a user from the selected store"""
+        import config
+
+        monkeypatch.setattr(config, "CONTEXT_STORE", "jsonl")
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path / "users"))
+        monkeypatch.setattr(config, "COLUMNS_FOLDER", str(tmp_path / "columns"))
+        FileStore().append("bob", [make_entry("legs", "2025-01-10"), make_entry("back", "2025-01-11", "planned")])
+
+        assert build_user_history("bob") == 1
+        assert open_user_history("bob").summary() == {"legs": {"sessions": 1, "duration": 30.0, "injuries": 0}}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
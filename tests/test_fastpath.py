@@ -0,0 +1,158 @@
+"""
+Unit Tests for the Fast Path Extraction (haiwpa_fastpath.py)
+
+Tests the rule-based extraction of simple messages : muscles and exercises from the Prolog facts,
+relative and absolute dates, tense, duration, the low confidence of the messages left to the LLM,
+and the planning questions.
+
+Run with: pytest tests/test_fastpath.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_fastpath import fast_extract, exercise_pattern, find_duration, planning_request
+from haiwpa_workout import FitnessExtract
+import re
+import config
+
+TODAY = datetime.date(2025, 1, 15)
+
+
+def extract(message):
+    sessions, confidence = fast_extract(message, TODAY)
+    return [(s.muscle, s.exercises, s.duration, s.date, s.entry_type) for s in sessions], confidence
+
+
+class TestFastExtract:
+    """Tests for fast_extract"""
+
+    def test_completed_yesterday(self):
+        """Should read a past session of yesterday"""
+        assert extract("I trained chest yesterday") == ([("chest", "", 0.0, "2025-01-14", "completed")], 1.0)
+
+    def test_planned_tomorrow(self):
+        """Should read a question about tomorrow as a planned session"""
+        assert extract("Can I train legs tomorrow?") == ([("legs", "", 0.0, "2025-01-16", "planned")], 1.0)
+
+    def test_exercises_give_muscles(self):
+        """Should find the muscle of each exercise, with one session per muscle"""
+        sessions, _ = extract("I did squats and bench press 2 days ago for 45 minutes")
+        assert sessions == [
+            ("legs", "squats", 45.0, "2025-01-13", "completed"),
+            ("chest", "bench press", 45.0, "2025-01-13", "completed"),
+        ]
+
+    def test_longest_exercise_first(self):
+        """Should not read "leg curls" as curls for the biceps"""
+        sessions, _ = extract("I did leg curls yesterday")
+        assert sessions == [("legs", "leg curls", 0.0, "2025-01-14", "completed")]
+
+    def test_dates(self):
+        """Should compute the relative dates and convert the EU dates"""
+        assert extract("I will train back in 3 days")[0][0][3] == "2025-01-18"
+        assert extract("I trained back three days ago")[0][0][3] == "2025-01-12"
+        assert extract("I trained back on 10.01.2025")[0][0][3] == "2025-01-10"
+        assert extract("I trained back on 2025-01-11")[0][0][3] == "2025-01-11"
+
+    def test_aliases(self):
+        """Should use the muscle names of the rules for the aliases of config.MUSCLE_ALIASES"""
+        sessions, _ = extract("I trained abs this morning")
+        assert sessions[0][0] == "abdominals"
+
+    def test_returns_fitness_extract(self):
+        """Should give FitnessExtract sessions, like the LLM extraction"""
+        sessions, _ = fast_extract("I trained chest today", TODAY)
+        assert isinstance(sessions[0], FitnessExtract)
+
+    @pytest.mark.parametrize("message", [
+        "My elbow hurts after curls",
+        "I didn't train back yesterday",
+        "I trained legs on monday",
+        "I trained chest yesterday and I will train back tomorrow",
+        "Running is fun",
+        "Was it ok to train legs today?",
+        "Did I train chest yesterday?",
+    ])
+    def test_left_to_llm(self, message):
+        """Should give no session and no confidence for the messages the rules cannot read"""
+        assert extract(message) == ([], 0.0)
+
+    def test_ambiguous_back(self):
+        """Should only read "back" as a muscle after a training verb, "my" or an exercise"""
+        assert extract("I'm back at the gym and trained chest today")[1] < config.FAST_PATH_MIN_CONFIDENCE
+        assert extract("I trained back yesterday")[0][0][0] == "back"
+        assert extract("I trained my back yesterday")[1] == 1.0
+        assert extract("I did deadlifts back yesterday")[1] == 1.0
+
+    def test_low_confidence(self):
+        """Should not be confident without a tense or a training verb"""
+        assert extract("chest today")[1] < config.FAST_PATH_MIN_CONFIDENCE
+        assert extract("I was back yesterday")[1] < config.FAST_PATH_MIN_CONFIDENCE
+
+
+class TestPlanningRequest:
+    """Tests for planning_request"""
+
+    def test_days_and_targets(self):
+        """Should read the number of days and the muscles, an exercise gives its muscle"""
+        assert planning_request("Plan my next 5 days for chest, back and squats", TODAY) == {
+            "start_date": "2025-01-15", "days": 5, "targets": ["chest", "back", "legs"]
+        }
+
+    def test_week_from_tomorrow(self):
+        """Should plan a week from the date of the message"""
+        request = planning_request("Make me a workout schedule for the week starting tomorrow with legs", TODAY)
+        assert (request["start_date"], request["days"], request["targets"]) == ("2025-01-16", 7, ["legs"])
+
+    def test_questions_to_the_assistant(self):
+        """Should read the requests and questions aimed at the assistant"""
+        assert planning_request("Can you plan my week?", TODAY)["days"] == 7
+        assert planning_request("What is my workout plan for the next 4 days?", TODAY)["days"] == 4
+
+    def test_own_plan_is_a_session(self):
+        """Should extract "I plan to train legs in 3 days" as a planned legs session"""
+        message = "I plan to train legs in 3 days, is it ok?"
+        assert planning_request(message, TODAY) is None
+        assert extract(message) == ([("legs", "", 0.0, "2025-01-18", "planned")], 1.0)
+
+    def test_all_muscles_by_default(self):
+        """Should plan every muscle group of the rules when none is given"""
+        assert "chest" in planning_request("Can you plan my week?", TODAY)["targets"]
+
+    @pytest.mark.parametrize("message", [
+        "I plan to train legs tomorrow",
+        "I plan to train legs in 3 days, is it ok?",
+        "I am planning on doing chest for the week",
+        "What is a good routine?",
+        "I trained chest 2 days ago",
+    ])
+    def test_not_planning(self, message):
+        """Should not read a session of the user or a question without days as a planning question"""
+        assert planning_request(message, TODAY) is None
+
+
+class TestHelpers:
+    """Tests for the patterns and the duration"""
+
+    def test_exercise_pattern(self):
+        """Should match the singular and dashed forms of an exercise"""
+        pattern = re.compile(exercise_pattern("push ups"))
+        assert pattern.search("push-up") and pattern.search("pushups") and pattern.search("push ups")
+        assert re.search(exercise_pattern("crunches"), "one crunch")
+
+    def test_duration(self):
+        """Should convert the durations to minutes, None if several are given"""
+        assert find_duration("for an hour") == 60.0
+        assert find_duration("for 1.5 hours") == 90.0
+        assert find_duration("30 min") == 30.0
+        assert find_duration("30 min then 1 hour") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -8,6 +8,7 @@ Servers required: None
 """
 
 import pytest
+import json
 import os
 import sys
 from datetime import datetime
@@ -15,6 +16,10 @@ from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from haiwpa_mcp import convert_date_to_timestamp, format_suggested_workout, validate_single_workout
+from haiwpa_mcp import load_json_workout_context, prolog, user_kbs, validation_cache
+from haiwpa_mcp import ingest_user_sessions, validate_planned_workouts, context_writer, context_loads
+from haiwpa_store import append_entries, read_entries, get_store, FileStore, context_file_for_user
+import config
 
 
 class TestConvertDateToTimestamp:
@@ -130,13 +135,15 @@ class TestValidateSingleWorkoutReasons:
         from pyswip import Prolog
         prolog = Prolog()
         prolog.consult("workout_rules.pl")
-        list(prolog.query("retractall(workout_history(_, _, _, _))."))
-        list(prolog.query("retractall(injury(_, _))."))
+        list(prolog.query("clear_history."))
+        forget_cached_validations()
         
+        misses = validation_cache.misses
         result = validate_single_workout("chest", "2025-01-15")
         
-        if result["approved"]:
-            assert "chest" in result["reason"].lower()
+        assert validation_cache.misses == misses + 1
+        assert result["approved"] == True
+        assert "chest" in result["reason"].lower()
 
     def test_injury_reason_includes_alternatives(self):
         """Should include suggested alternatives when injury present"""
@@ -146,19 +153,298 @@ class TestValidateSingleWorkoutReasons:
         # Set up injury scenario
         prolog = Prolog()
         prolog.consult("workout_rules.pl")
-        list(prolog.query("retractall(workout_history(_, _, _, _))."))
-        list(prolog.query("retractall(injury(_, _))."))
+        list(prolog.query("clear_history."))
         
         # Add recent injury
         injury_date = datetime.now() - timedelta(days=5)
         injury_timestamp = int(injury_date.timestamp())
-        list(prolog.query(f"assertz(injury({injury_timestamp}, 'chest'))."))
+        list(prolog.query(f"record_injury({injury_timestamp}, 'chest')."))
+        forget_cached_validations()
         
+        misses = validation_cache.misses
         result = validate_single_workout("chest", datetime.now().strftime("%Y-%m-%d"))
         
-        if not result["approved"] and "injury" in result["reason"].lower():
-            assert "alternative" in result["reason"].lower() or \
-                   "suggested" in result["reason"].lower()
+        assert validation_cache.misses == misses + 1
+        assert result["approved"] == False
+        assert "alternative" in result["reason"].lower() or \
+               "suggested" in result["reason"].lower()
+
+
+def forget_cached_validations():
+    """Clear the cached validations after facts are asserted directly in Prolog, bypassing the knowledge base version"""
+    validation_cache.clear()
+
+
+def make_entry(timestamp, muscle, date, entry_type, injuries=""):
+    """Build a context.json entry"""
+    return {
+        "timestamp": timestamp,
+        "user_input": "test",
+        "muscle": muscle,
+        "exercises": "test exercise",
+        "duration": 30,
+        "date": date,
+        "injuries": injuries,
+        "entry_type": entry_type,
+    }
+
+
+def count_workout_history():
+    """Count workout_history facts asserted in Prolog"""
+    return len(list(prolog.query("workout_history(_, _, _, _).")))
+
+
+class TestLoadJsonWorkoutContext:
+    """Tests for incremental ingestion in load_json_workout_context"""
+
+    def test_appended_entries_are_asserted_once(self, tmp_path):
+        """Should only assert entries appended since the last load"""
+        context_file = str(tmp_path / "context.json")
+        data = [
+            make_entry("2025-01-10T10:00:00", "chest", "2025-01-10", "completed"),
+            make_entry("2025-01-10T10:01:00", "back", "2025-01-12", "planned"),
+        ]
+        with open(context_file, "w") as f:
+            json.dump(data, f)
+
+        planned = load_json_workout_context(context_file, incremental=True)
+        assert count_workout_history() == 1
+        assert len(planned) == 1
+
+        data.append(make_entry("2025-01-11T10:00:00", "legs", "2025-01-11", "completed"))
+        data.append(make_entry("2025-01-11T10:01:00", "legs", "2025-01-13", "planned"))
+        with open(context_file, "w") as f:
+            json.dump(data, f)
+
+        planned = load_json_workout_context(context_file, incremental=True)
+        assert count_workout_history() == 2
+        assert [p["muscle"] for p in planned] == ["back", "legs"]
+
+    def test_rewritten_file_triggers_full_reload(self, tmp_path):
+        """Should retract everything when the file has been rewritten"""
+        context_file = str(tmp_path / "context.json")
+        data = [
+            make_entry("2025-01-10T10:00:00", "chest", "2025-01-10", "completed"),
+            make_entry("2025-01-11T10:00:00", "legs", "2025-01-11", "completed"),
+        ]
+        with open(context_file, "w") as f:
+            json.dump(data, f)
+        load_json_workout_context(context_file, incremental=True)
+
+        with open(context_file, "w") as f:
+            json.dump(data[1:], f)
+        load_json_workout_context(context_file, incremental=True)
+
+        assert count_workout_history() == 1
+
+
+    def test_stale_entries_are_not_asserted(self, tmp_path):
+        """Should only assert the workouts inside the retention window"""
+        context_file = str(tmp_path / "context.json")
+        data = [
+            make_entry("2024-11-01T10:00:00", "chest", "2024-11-01", "completed"),
+            make_entry("2025-01-10T10:00:00", "legs", "2025-01-10", "completed"),
+            make_entry("2025-01-10T10:01:00", "back", "2025-01-16", "planned"),
+        ]
+        with open(context_file, "w") as f:
+            json.dump(data, f)
+
+        load_json_workout_context(context_file, incremental=False)
+
+        assert count_workout_history() == 1
+
+
+    def test_jsonl_appended_lines_are_asserted_once(self, tmp_path):
+        """Should only read and assert the lines appended to a JSON Lines file"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [make_entry("2025-01-10T10:00:00", "chest", "2025-01-10", "completed")])
+        load_json_workout_context(context_file, incremental=True)
+
+        append_entries(context_file, [make_entry("2025-01-11T10:00:00", "legs", "2025-01-11", "completed")])
+        load_json_workout_context(context_file, incremental=True)
+
+        assert count_workout_history() == 2
+
+
+    def test_unchanged_file_is_not_read(self, tmp_path, monkeypatch):
+        """Should skip reading a context file that did not change since the last load"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [make_entry("2025-01-10T10:00:00", "chest", "2025-01-10", "completed")])
+        load_json_workout_context(context_file, incremental=False)
+        skipped = context_loads["skipped"]
+
+        monkeypatch.setattr(FileStore, "read_new_records", lambda *args: pytest.fail("file read"))
+        load_json_workout_context(context_file, incremental=False)
+
+        assert context_loads["skipped"] == skipped + 1
+        assert count_workout_history() == 1
+
+
+    def test_same_content_is_not_asserted_again(self, tmp_path):
+        """Should keep the asserted facts when a file is rewritten with the same content"""
+        context_file = str(tmp_path / "context.json")
+        data = [make_entry("2025-01-10T10:00:00", "chest", "2025-01-10", "completed")]
+        with open(context_file, "w") as f:
+            json.dump(data, f)
+        load_json_workout_context(context_file, incremental=True)
+        reloaded, unchanged = context_loads["reloaded"], context_loads["unchanged"]
+
+        os.utime(context_file, ns=(0, 0))
+        load_json_workout_context(context_file, incremental=True)
+
+        assert context_loads["reloaded"] == reloaded
+        assert context_loads["unchanged"] == unchanged + 1
+        assert count_workout_history() == 1
+
+
+    def test_sqlite_store_is_loaded(self, tmp_path, monkeypatch):
+        """Should load the history of a user from the SQLite store"""
+        monkeypatch.setattr(config, "CONTEXT_STORE", "sqlite")
+        monkeypatch.setattr(config, "STORE_DB_FILE", str(tmp_path / "workouts.db"))
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        get_store().append("sqlite_user", [make_entry("2025-01-10T10:00:00", "legs", today, "completed")])
+        load_json_workout_context(user_id="sqlite_user")
+
+        assert validate_single_workout("legs", today, user_id="sqlite_user")["approved"] == False
+
+
+class TestUserKnowledgeBases:
+    """Tests for per-user knowledge bases"""
+
+    def test_users_histories_are_isolated(self, tmp_path):
+        """Should validate each user against its own workout history"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        alice_file = str(tmp_path / "alice.json")
+        bob_file = str(tmp_path / "bob.json")
+        with open(alice_file, "w") as f:
+            json.dump([make_entry("2025-01-10T10:00:00", "chest", today, "completed")], f)
+        with open(bob_file, "w") as f:
+            json.dump([], f)
+
+        load_json_workout_context(alice_file, user_id="alice")
+        load_json_workout_context(bob_file, user_id="bob")
+
+        assert validate_single_workout("chest", today, user_id="alice")["approved"] == False
+        assert validate_single_workout("chest", today, user_id="bob")["approved"] == True
+
+    def test_least_recently_used_user_is_evicted(self, tmp_path, monkeypatch):
+        """Should unload the least recently used user above KB_MAX_USERS"""
+        monkeypatch.setattr(config, "KB_MAX_USERS", 2)
+        user_kbs.clear()
+
+        for user_id in ["user_1", "user_2", "user_3"]:
+            context_file = str(tmp_path / f"{user_id}.json")
+            with open(context_file, "w") as f:
+                json.dump([make_entry("2025-01-10T10:00:00", "legs", "2025-01-10", "completed")], f)
+            load_json_workout_context(context_file, user_id=user_id)
+
+        assert list(user_kbs) == ["user_2", "user_3"]
+
+
+class TestIngestSessions:
+    """Tests for sessions ingested directly into the knowledge base"""
+
+    def test_ingested_sessions_are_validated(self, tmp_path, monkeypatch):
+        """Should validate ingested sessions and save them in the background"""
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path))
+        today = datetime.now().strftime("%Y-%m-%d")
+        sessions = [
+            {"muscle": "legs", "exercises": "squats", "duration": 30, "date": today, "injuries": "", "entry_type": "completed"},
+            {"muscle": "legs", "exercises": "lunges", "duration": 0, "date": today, "injuries": "", "entry_type": "planned"},
+        ]
+
+        assert ingest_user_sessions(sessions, "Leg day", "ingest_user") == {"ingested": 2}
+
+        results = validate_planned_workouts("ingest_user")
+        assert [r["muscle"] for r in results] == ["legs"]
+        assert results[0]["validation"]["approved"] == False
+
+        context_writer.flush()
+        data = read_entries(context_file_for_user("ingest_user"))
+        assert [e["entry_type"] for e in data] == ["completed", "planned"]
+
+    def test_new_user_has_no_rest_day_limit(self, tmp_path, monkeypatch):
+        """Should validate the first planned session of a user without completed history"""
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path))
+        today = datetime.now().strftime("%Y-%m-%d")
+        session = {"muscle": "chest", "exercises": "bench press", "duration": 0, "date": today, "injuries": "",
+                   "entry_type": "planned"}
+
+        ingest_user_sessions([session], "Chest day", "new_user")
+        results = validate_planned_workouts("new_user")
+
+        assert results[0]["validation"]["approved"] == True
+        assert results[0]["max_rest_days"] is None
+
+    def test_failed_ingestion_reads_store_again(self, tmp_path, monkeypatch):
+        """Should not keep a partial knowledge base in memory when the ingestion fails"""
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path))
+        today = datetime.now().strftime("%Y-%m-%d")
+        session = {"muscle": "legs", "exercises": "squats", "duration": 30, "date": today, "injuries": "",
+                   "entry_type": "planned"}
+
+        def failing_submit(*args):
+            raise RuntimeError("writer stopped")
+
+        monkeypatch.setattr(context_writer, "submit", failing_submit)
+        with pytest.raises(RuntimeError):
+            ingest_user_sessions([session], "Leg day", "failed_user")
+        assert user_kbs["failed_user"]["in_memory"] == False
+
+        # The backend saves the sessions itself, the next load reads them from the store
+        monkeypatch.undo()
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path))
+        append_entries(context_file_for_user("failed_user"), [dict(session, user_input="Leg day", timestamp=today)])
+        assert [w["muscle"] for w in load_json_workout_context(user_id="failed_user")] == ["legs"]
+
+
+class TestValidationCache:
+    """Tests for the versioned validation cache"""
+
+    def test_repeated_validation_is_cached(self, tmp_path):
+        """Should answer a repeated validation from the cache"""
+        context_file = str(tmp_path / "context.json")
+        with open(context_file, "w") as f:
+            json.dump([], f)
+        load_json_workout_context(context_file, user_id="cache_user")
+
+        validate_single_workout("back", "2025-01-15", user_id="cache_user")
+        hits = validation_cache.hits
+        validate_single_workout("back", "2025-01-15", user_id="cache_user")
+
+        assert validation_cache.hits == hits + 1
+
+    def test_new_facts_invalidate_cache(self, tmp_path):
+        """Should not reuse a result once new facts are asserted"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        context_file = str(tmp_path / "context.json")
+        with open(context_file, "w") as f:
+            json.dump([], f)
+        load_json_workout_context(context_file, user_id="cache_user_2")
+        assert validate_single_workout("legs", today, user_id="cache_user_2")["approved"] == True
+
+        with open(context_file, "w") as f:
+            json.dump([make_entry("2025-01-10T10:00:00", "legs", today, "completed")], f)
+        load_json_workout_context(context_file, user_id="cache_user_2")
+
+        misses = validation_cache.misses
+        assert validate_single_workout("legs", today, user_id="cache_user_2")["approved"] == False
+        assert validation_cache.misses == misses + 1
+
+    def test_direct_assert_needs_cache_clear(self):
+        """Should query Prolog again once the cache is cleared after a direct assert"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        list(prolog.query("clear_history."))
+        forget_cached_validations()
+        assert validate_single_workout("back", today)["approved"] == True
+
+        list(prolog.query(f"record_injury({int(datetime.now().timestamp())}, 'back')."))
+        forget_cached_validations()
+        misses = validation_cache.misses
+
+        assert validate_single_workout("back", today)["approved"] == False
+        assert validation_cache.misses == misses + 1
 
 
 if __name__ == "__main__":
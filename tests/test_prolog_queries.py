@@ -0,0 +1,93 @@
+"""
+Unit Tests for the Prolog Query Layer (haiwpa_prolog.py)
+
+Tests predicate calls built from Python values instead of query strings.
+
+Run with: pytest tests/test_prolog_queries.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyswip import Prolog
+from haiwpa_prolog import Out, solutions, first_solution, run, load_compiled, compiled_file_for
+
+
+@pytest.fixture(scope="module")
+def prolog():
+    """Initialize Prolog engine and load workout rules"""
+    pl = Prolog()
+    rules_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "workout_rules.pl")
+    pl.consult(rules_path)
+    return pl
+
+
+class TestSolutions:
+    """Tests for solutions/first_solution/run"""
+
+    def test_output_arguments(self, prolog):
+        """Should return the values of the Out arguments like prolog.query"""
+        result = solutions("user", "rest_day_required", "chest", Out("Days"))
+        assert result == [{"Days": 2}]
+
+    def test_failing_goal(self, prolog):
+        """Should return no solution and None when the goal fails"""
+        assert solutions("user", "muscle_group", "neck") == []
+        assert first_solution("user", "muscle_group", "neck") is None
+
+    def test_all_solutions(self, prolog):
+        """Should return every solution"""
+        result = solutions("user", "exercise", Out("Exercise"), "biceps")
+        assert [r["Exercise"] for r in result] == ["curls", "hammer curls", "preacher curls"]
+
+    def test_quote_in_atom(self, prolog):
+        """Should assert values containing quotes without breaking the query"""
+        today = int(datetime.now().timestamp())
+        run("user", "clear_history")
+
+        assert run("user", "record_workout", today, "chest", "farmer's walk", 45.5)
+
+        result = list(prolog.query("workout_history(_, chest, Exercise, Duration)."))
+        assert result == [{"Exercise": "farmer's walk", "Duration": 45.5}]
+
+    def test_pairs_list(self, prolog):
+        """Should convert tuples to Key-Value pairs"""
+        run("user", "clear_history")
+        today = int(datetime.now().timestamp())
+
+        result = first_solution("user", "validate_batch", [("chest", today)], Out("Results"))
+        assert result["Results"][0][2] == "workout_allowed"
+
+
+class TestLoadCompiled:
+    """Tests for rules loaded from their .qlf file"""
+
+    def test_compiled_file_name(self):
+        """Should use the .qlf extension next to the source file"""
+        assert compiled_file_for("rules/workout_rules.pl") == "rules/workout_rules.qlf"
+
+    def test_compiled_once(self, prolog, tmp_path):
+        """Should only compile again when the source file is newer"""
+        source_file = tmp_path / "compiled_rules.pl"
+        source_file.write_text("compiled_fact(1).\n")
+
+        assert load_compiled(str(source_file)) == True
+        assert os.path.exists(compiled_file_for(str(source_file)))
+        assert load_compiled(str(source_file)) == False
+        assert first_solution("user", "compiled_fact", Out("X")) == {"X": 1}
+
+        source_file.write_text("compiled_fact(2).\n")
+        future = os.path.getmtime(compiled_file_for(str(source_file))) + 10
+        os.utime(source_file, (future, future))
+
+        assert load_compiled(str(source_file)) == True
+        assert first_solution("user", "compiled_fact", Out("X")) == {"X": 2}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -255,11 +255,10 @@ class TestSuggestAlternative:
     def test_suggests_alternative_when_injured(self, prolog):
         """Should suggest alternative muscles when target is injured"""
         # Clear and set up injury
-        list(prolog.query("retractall(workout_history(_, _, _, _))."))
-        list(prolog.query("retractall(injury(_, _))."))
+        list(prolog.query("clear_history."))
         
         injury_date = days_ago_timestamp(5)
-        list(prolog.query(f"assertz(injury({injury_date}, 'chest'))."))
+        list(prolog.query(f"record_injury({injury_date}, 'chest')."))
         
         today = today_timestamp()
         result = list(prolog.query(f"suggest_alternative(chest, {today}, Alternative)."))
@@ -276,11 +275,10 @@ class TestSuggestAlternative:
     def test_suggests_alternative_when_insufficient_rest(self, prolog):
         """Should suggest alternative muscles when insufficient rest"""
         # Clear and set up recent workout
-        list(prolog.query("retractall(workout_history(_, _, _, _))."))
-        list(prolog.query("retractall(injury(_, _))."))
+        list(prolog.query("clear_history."))
         
         yesterday = days_ago_timestamp(1)
-        list(prolog.query(f"assertz(workout_history({yesterday}, 'legs', 'squats', 60))."))
+        list(prolog.query(f"record_workout({yesterday}, 'legs', 'squats', 60)."))
         
         today = today_timestamp()
         result = list(prolog.query(f"suggest_alternative(legs, {today}, Alternative)."))
@@ -291,16 +289,100 @@ class TestSuggestAlternative:
         assert "legs" not in alternatives
 
 
+class TestValidateBatch:
+    """Tests for validate_batch/2 predicate"""
+
+    def test_batch_returns_one_result_per_workout(self, prolog):
+        """Should return a result for each Muscle-Date pair in the same order"""
+        list(prolog.query("clear_history."))
+
+        today = today_timestamp()
+        result = list(prolog.query(f"validate_batch([chest-{today}, legs-{today}], Results)."))
+
+        assert len(result) == 1
+        results = result[0]["Results"]
+        assert [r[0] for r in results] == ["chest", "legs"]
+        assert [r[2] for r in results] == ["workout_allowed", "workout_allowed"]
+
+    def test_batch_matches_can_workout(self, prolog):
+        """Should give the same reason as can_workout/3 and the injured partner"""
+        list(prolog.query("clear_history."))
+
+        injury_date = days_ago_timestamp(5)
+        list(prolog.query(f"record_injury({injury_date}, 'biceps')."))
+
+        today = today_timestamp()
+        result = list(prolog.query(f"validate_batch([back-{today}], Results)."))
+        muscle, _, reason, injured_muscle, alternatives = result[0]["Results"][0]
+
+        assert muscle == "back"
+        assert reason == "trained_together_injured"
+        assert injured_muscle == "biceps"
+        assert "back" not in alternatives
+        assert len(alternatives) > 0
+
+    def test_batch_invalid_muscle_group(self, prolog):
+        """Should mark unknown muscle groups as invalid"""
+        today = today_timestamp()
+        result = list(prolog.query(f"validate_batch([neck-{today}], Results)."))
+
+        assert result[0]["Results"][0][2] == "invalid_muscle_group"
+
+
+class TestPlanWorkouts:
+    """Tests for plan_workouts/5 predicate (CLP(FD) planning)"""
+
+    def plan(self, prolog, dates, targets, max_per_day=2):
+        """Run plan_workouts/5 and return the muscles planned for each day"""
+        dates_list = "[" + ", ".join(str(d) for d in dates) + "]"
+        targets_list = "[" + ", ".join(targets) + "]"
+        result = list(prolog.query(f"plan_workouts({dates_list}, {targets_list}, {max_per_day}, 2.0, Plan)."))
+        assert len(result) == 1
+        return result[0]["Plan"]
+
+    def test_rest_days_between_sessions(self, prolog):
+        """Should keep rest_day_required days between two sessions of a muscle"""
+        list(prolog.query("clear_history."))
+        dates = [days_ago_timestamp(-i) for i in range(1, 5)]
+
+        plan = self.plan(prolog, dates, ["chest"])
+
+        chest_days = [i for i, muscles in enumerate(plan) if "chest" in muscles]
+        assert len(chest_days) == 2
+        assert chest_days[1] - chest_days[0] >= 2
+
+    def test_max_muscles_per_day(self, prolog):
+        """Should not plan more muscles per day than allowed"""
+        list(prolog.query("clear_history."))
+        dates = [days_ago_timestamp(-i) for i in range(1, 4)]
+
+        plan = self.plan(prolog, dates, ["biceps", "legs", "calves"], max_per_day=1)
+
+        assert all(len(muscles) <= 1 for muscles in plan)
+        assert sum(len(muscles) for muscles in plan) == 3
+
+    def test_injured_muscle_not_planned(self, prolog):
+        """Should not plan a muscle with an active injury"""
+        list(prolog.query("clear_history."))
+        list(prolog.query(f"record_injury({days_ago_timestamp(2)}, 'back')."))
+        dates = [days_ago_timestamp(-i) for i in range(1, 4)]
+
+        plan = self.plan(prolog, dates, ["back", "legs"])
+
+        assert all("back" not in muscles for muscles in plan)
+        assert any("legs" in muscles for muscles in plan)
+
+
 class TestHasInjury:
     """Tests for has_injury/2 predicate with date arithmetic"""
 
     def test_has_injury_within_recovery_period(self, prolog):
         """Should detect injury within recovery period"""
-        list(prolog.query("retractall(injury(_, _))."))
+        list(prolog.query("clear_history."))
         
         # Injury 10 days ago (within 14-day recovery for biceps)
         injury_date = days_ago_timestamp(10)
-        list(prolog.query(f"assertz(injury({injury_date}, 'biceps'))."))
+        list(prolog.query(f"record_injury({injury_date}, 'biceps')."))
         
         today = today_timestamp()
         result = list(prolog.query(f"has_injury(biceps, {today})."))
@@ -309,11 +391,11 @@ class TestHasInjury:
 
     def test_no_injury_after_recovery_period(self, prolog):
         """Should not detect injury after recovery period"""
-        list(prolog.query("retractall(injury(_, _))."))
+        list(prolog.query("clear_history."))
         
         # Injury 20 days ago (past 14-day recovery for biceps)
         injury_date = days_ago_timestamp(20)
-        list(prolog.query(f"assertz(injury({injury_date}, 'biceps'))."))
+        list(prolog.query(f"record_injury({injury_date}, 'biceps')."))
         
         today = today_timestamp()
         result = list(prolog.query(f"has_injury(biceps, {today})."))
@@ -321,6 +403,67 @@ class TestHasInjury:
         assert result == [], "Should not detect injury after recovery period"
 
 
+class TestHistoryIndexes:
+    """Tests for last_trained/2 and latest_injury/2, kept up to date with the history facts"""
+
+    def test_last_trained_keeps_latest_date(self, prolog):
+        """Should keep only the latest workout date per muscle"""
+        list(prolog.query("clear_history."))
+
+        recent = days_ago_timestamp(1)
+        old = days_ago_timestamp(10)
+        list(prolog.query(f"record_workout({recent}, 'chest', 'bench press', 45)."))
+        list(prolog.query(f"record_workout({old}, 'chest', 'push ups', 30)."))
+
+        result = list(prolog.query("last_trained(chest, Date)."))
+        assert result == [{"Date": recent}]
+
+    def test_latest_injury_keeps_latest_date(self, prolog):
+        """Should keep only the latest injury date per muscle"""
+        list(prolog.query("clear_history."))
+
+        old = days_ago_timestamp(20)
+        recent = days_ago_timestamp(3)
+        list(prolog.query(f"record_injury({old}, 'biceps')."))
+        list(prolog.query(f"record_injury({recent}, 'biceps')."))
+
+        result = list(prolog.query("latest_injury(biceps, Date)."))
+        assert result == [{"Date": recent}]
+
+    def test_direct_assertz_rebuilds_indexes(self, prolog):
+        """Should see the workouts and injuries asserted without record_workout/4 and record_injury/2"""
+        list(prolog.query("clear_history."))
+        list(prolog.query(f"record_workout({days_ago_timestamp(10)}, 'chest', 'bench press', 45)."))
+
+        yesterday = days_ago_timestamp(1)
+        list(prolog.query(f"assertz(workout_history({yesterday}, 'chest', 'push ups', 30))."))
+        list(prolog.query(f"assertz(injury({yesterday}, 'biceps'))."))
+
+        today = today_timestamp()
+        assert list(prolog.query(f"can_workout(chest, {today}, Reason).")) == [{"Reason": "insufficient_rest"}]
+        assert list(prolog.query(f"can_workout(biceps, {today}, Reason).")) == [{"Reason": "injury_present"}]
+        assert list(prolog.query("last_trained(chest, Date).")) == [{"Date": yesterday}]
+
+    def test_direct_retract_rebuilds_indexes(self, prolog):
+        """Should forget a workout retracted without clear_history/0"""
+        list(prolog.query("clear_history."))
+        yesterday = days_ago_timestamp(1)
+        list(prolog.query(f"record_workout({yesterday}, 'legs', 'squats', 60)."))
+
+        list(prolog.query(f"retract(workout_history({yesterday}, 'legs', _, _))."))
+
+        result = list(prolog.query(f"can_workout(legs, {today_timestamp()}, Reason)."))
+        assert result == [{"Reason": "workout_allowed"}]
+
+    def test_clear_history_removes_indexes(self, prolog):
+        """Should remove the indexes together with the history"""
+        list(prolog.query(f"record_workout({today_timestamp()}, 'legs', 'squats', 60)."))
+        list(prolog.query("clear_history."))
+
+        assert list(prolog.query("last_trained(_, _).")) == []
+        assert list(prolog.query("latest_injury(_, _).")) == []
+
+
 class TestSufficientRest:
     """Tests for sufficient_rest/3 predicate"""
 
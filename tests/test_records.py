@@ -0,0 +1,144 @@
+"""
+Unit Tests for the Workout Records (haiwpa_records.py)
+
+Tests the typed records decoded from the context entries, the interned muscles and entry types,
+the dates parsed to epoch days, and the records read from the stores.
+
+Run with: pytest tests/test_records.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+import json
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_records import WorkoutRecord, EntryType, record_from_dict, decode_records, encode_records
+from haiwpa_records import muscle_enum, epoch_day, dumps_line, loads, benchmark
+import haiwpa_records
+from haiwpa_store import FileStore, SQLiteStore, append_entries, retention_cutoff, is_stale_entry
+
+
+def make_entry(muscle, date, entry_type, user_input="test", injuries=""):
+    return {"timestamp": f"{date}T10:00:00", "user_input": user_input, "muscle": muscle, "exercises": "test",
+            "duration": 30.0, "date": date, "injuries": injuries, "entry_type": entry_type}
+
+
+class TestWorkoutRecord:
+    """Tests for WorkoutRecord and record_from_dict"""
+
+    def test_record_fields(self):
+        """Should intern the muscle and entry type and parse the date once"""
+        record = record_from_dict(make_entry("Chest", "15.01.2025", "completed"))
+
+        assert record.muscle is muscle_enum().CHEST
+        assert record.entry_type is EntryType.COMPLETED
+        assert record.entry_type == "completed"
+        assert record.day == epoch_day("2025-01-15")
+        assert record.date == "2025-01-15"
+        assert record.unix_time == int(datetime(2025, 1, 15).timestamp())
+
+    def test_one_digit_dates(self):
+        """Should read the dates with a one digit day or month like the store"""
+        assert epoch_day("2025-1-5") == epoch_day("2025-01-05")
+        assert epoch_day("5.1.2025") == epoch_day("2025-01-05")
+        assert record_from_dict(make_entry("chest", "5.1.2025", "completed")).date == "2025-01-05"
+
+    def test_record_is_slotted(self):
+        """Should not have a __dict__ for each record"""
+        record = record_from_dict(make_entry("chest", "2025-01-15", "completed"))
+        assert not hasattr(record, "__dict__")
+
+    def test_unknown_values_are_kept(self):
+        """Should keep a muscle unknown to the rules and an entry without a valid date"""
+        record = record_from_dict({"muscle": "Abs", "date": "tomorrow", "entry_type": "planned", "duration": None})
+
+        assert record.muscle_name == "abs"
+        assert record.day is None
+        assert record.date == ""
+        assert record.duration == 0.0
+
+    def test_repeated_texts_are_shared(self):
+        """Should share the message of the sessions decoded together"""
+        lines = [dumps_line(make_entry(m, "2025-01-15", "completed", "".join(["Chest ", "and legs"])))
+                 for m in ("chest", "legs")]
+        first, second = decode_records(lines)
+        assert first.user_input is second.user_input
+
+    def test_round_trip(self):
+        """Should encode a record back to the same entry"""
+        entry = make_entry("legs", "2025-01-15", "planned")
+        encoded = encode_records([record_from_dict(entry)])
+
+        assert loads(encoded) == entry
+        assert encoded.endswith("\n")
+
+
+class TestStoreRecords:
+    """Tests for the records read from the stores and used by the retention window"""
+
+    def test_file_store_records(self, tmp_path):
+        """Should read the appended lines of a context file as records"""
+        store = FileStore(lambda _: str(tmp_path / "context.jsonl"))
+        store.append("alice", [make_entry("chest", "2025-01-10", "completed")])
+        records, position, _ = store.read_new_records("alice")
+
+        store.append("alice", [make_entry("legs", "2025-01-11", "completed")])
+        records, _, appended = store.read_new_records("alice", position)
+
+        assert appended == True
+        assert [r.muscle_name for r in records] == ["legs"]
+        assert isinstance(records[0], WorkoutRecord)
+
+    def test_legacy_json_records(self, tmp_path):
+        """Should read a legacy JSON file as records"""
+        context_file = str(tmp_path / "context.json")
+        append_entries(context_file, [make_entry("back", "2025-01-10", "planned")])
+
+        records, _, _ = FileStore(lambda _: context_file).read_new_records("alice")
+        assert records[0].entry_type is EntryType.PLANNED
+
+    def test_sqlite_records(self, tmp_path):
+        """Should read the rows of the SQLite store as records"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        store.append("alice", [make_entry("biceps", "2025-01-10", "completed", injuries="elbow")])
+
+        records, _, _ = store.read_new_records("alice")
+        assert records[0].injuries == "elbow"
+        assert records[0].day == epoch_day("2025-01-10")
+
+    def test_retention_with_records(self):
+        """Should give the same retention window for records and dicts"""
+        entries = [make_entry("chest", "2024-11-01", "completed"), make_entry("legs", "2025-01-10", "completed")]
+        records = [record_from_dict(entry) for entry in entries]
+
+        cutoff = retention_cutoff(entries)
+        assert retention_cutoff(records) == cutoff
+        assert [is_stale_entry(r, cutoff) for r in records] == [is_stale_entry(e, cutoff) for e in entries]
+
+
+class TestBenchmark:
+    """Tests for the benchmark of the records"""
+
+    def test_records_use_less_memory(self):
+        """Should measure less memory for records than for dicts"""
+        results = benchmark(2000)
+        assert results["records"][1] < results["dicts"][1]
+
+    def test_parser_measured_apart(self, monkeypatch):
+        """Should decode the dicts and the records with the same parser, the json module being measured apart"""
+        parsed = []
+        monkeypatch.setattr(haiwpa_records, "loads", lambda text: parsed.append(text) or json.loads(text))
+
+        results = benchmark(100)
+
+        assert list(results) == ["dicts (json)", "dicts", "dicts + dates", "records"]
+        # 4 runs (best of 3 and the memory) of dicts, dicts + dates and records
+        assert len(parsed) == 3 * 4 * 100
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
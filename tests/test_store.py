@@ -0,0 +1,522 @@
+"""
+Unit Tests for the Context Store (haiwpa_store.py)
+
+Tests the JSON Lines context files (appends, incremental reads, migration from the JSON array format),
+the retention window, the SQLite store, the atomic and locked saves, the change detection, and the compaction of the history.
+
+Run with: pytest tests/test_store.py -v
+Servers required: None
+"""
+
+import pytest
+import json
+import os
+import sys
+import datetime
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_store import append_entries, read_entries, read_new_entries, write_entries, legacy_file_for
+from haiwpa_store import retention_days, split_stale_entries, archive_file_for, append_context_entries
+from haiwpa_store import FileStore, SQLiteStore, GroupCommitter, locked, context_file_for_user
+from haiwpa_store import compact_entries, compact_context_file, compact_store, needs_compaction
+import config
+
+
+class TestJsonLines:
+    """Tests for JSON Lines context files"""
+
+    def test_append_and_read(self, tmp_path):
+        """Should append one line per entry and read them back in order"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [{"muscle": "chest"}])
+        append_entries(context_file, [{"muscle": "back"}, {"muscle": "legs"}])
+
+        with open(context_file, "r") as f:
+            assert len(f.readlines()) == 3
+        assert [e["muscle"] for e in read_entries(context_file)] == ["chest", "back", "legs"]
+
+    def test_missing_file(self, tmp_path):
+        """Should read no entries from a missing file"""
+        assert read_entries(str(tmp_path / "context.jsonl")) == []
+
+    def test_only_new_entries_are_read(self, tmp_path):
+        """Should only read the lines appended since the last position"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [{"muscle": "chest"}])
+        entries, position, appended = read_new_entries(context_file)
+        assert appended == False
+
+        append_entries(context_file, [{"muscle": "back"}])
+        entries, position, appended = read_new_entries(context_file, position)
+
+        assert appended == True
+        assert [e["muscle"] for e in entries] == ["back"]
+
+    def test_partial_line_is_not_read(self, tmp_path):
+        """Should wait for the end of a line that is still being written"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [{"muscle": "chest"}])
+        with open(context_file, "a") as f:
+            f.write('{"muscle": "ba')
+
+        entries, position, _ = read_new_entries(context_file)
+        assert [e["muscle"] for e in entries] == ["chest"]
+
+        with open(context_file, "a") as f:
+            f.write('ck"}\n')
+        entries, _, appended = read_new_entries(context_file, position)
+        assert appended == True
+        assert [e["muscle"] for e in entries] == ["back"]
+
+    def test_replaced_file_is_read_again(self, tmp_path):
+        """Should read the whole file again once it has been replaced"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [{"muscle": "chest"}, {"muscle": "back"}])
+        _, position, _ = read_new_entries(context_file)
+
+        write_entries(context_file, [{"muscle": "legs"}])
+        entries, _, appended = read_new_entries(context_file, position)
+
+        assert appended == False
+        assert [e["muscle"] for e in entries] == ["legs"]
+
+
+class TestChangeDetection:
+    """Tests for the signature and content hash of the context files"""
+
+    def test_signature_changes_on_append(self, tmp_path):
+        """Should keep the same signature until the file is appended or replaced"""
+        store = FileStore(lambda _: str(tmp_path / "context.jsonl"))
+        assert store.signature("alice") is None
+
+        store.append("alice", [{"muscle": "chest"}])
+        signature = store.signature("alice")
+        assert store.signature("alice") == signature
+
+        store.append("alice", [{"muscle": "back"}])
+        assert store.signature("alice") != signature
+
+    def test_content_hash(self, tmp_path):
+        """Should give the same hash to a file rewritten with the same content"""
+        context_file = str(tmp_path / "context.jsonl")
+        store = FileStore(lambda _: context_file)
+        write_entries(context_file, [{"muscle": "chest"}])
+        content_hash = store.content_hash("alice")
+
+        write_entries(context_file, [{"muscle": "chest"}])
+        assert store.content_hash("alice") == content_hash
+
+        write_entries(context_file, [{"muscle": "back"}])
+        assert store.content_hash("alice") != content_hash
+
+
+class TestLegacyJson:
+    """Tests for the JSON array format"""
+
+    def test_legacy_file_is_migrated(self, tmp_path):
+        """Should convert an existing JSON array file on first use"""
+        context_file = str(tmp_path / "context.jsonl")
+        with open(legacy_file_for(context_file), "w") as f:
+            json.dump([{"muscle": "chest"}], f)
+
+        append_entries(context_file, [{"muscle": "back"}])
+
+        assert [e["muscle"] for e in read_entries(context_file)] == ["chest", "back"]
+        assert not os.path.exists(legacy_file_for(context_file))
+        assert os.path.exists(legacy_file_for(context_file) + ".migrated")
+
+    def test_json_file_keeps_array_format(self, tmp_path):
+        """Should keep writing .json files as a JSON array"""
+        context_file = str(tmp_path / "context.json")
+        append_entries(context_file, [{"muscle": "chest"}])
+        append_entries(context_file, [{"muscle": "back"}])
+
+        with open(context_file, "r") as f:
+            assert [e["muscle"] for e in json.load(f)] == ["chest", "back"]
+
+
+class TestHistoryRetention:
+    """Tests for the retention window of the workout history"""
+
+    def make_entry(self, muscle, date, entry_type):
+        return {"muscle": muscle, "date": date, "entry_type": entry_type, "injuries": ""}
+
+    def test_retention_days_from_rules(self):
+        """Should use the longest injury recovery period of workout_rules.pl"""
+        assert retention_days() == 28
+
+    def test_old_completed_entries_are_stale(self):
+        """Should only mark completed workouts older than the window before the first planned one"""
+        entries = [
+            self.make_entry("chest", "2024-11-01", "completed"),
+            self.make_entry("legs", "2024-12-01", "planned"),
+            self.make_entry("back", "2025-01-10", "completed"),
+            self.make_entry("biceps", "2025-01-16", "planned"),
+        ]
+        stale, current = split_stale_entries(entries)
+        assert [e["muscle"] for e in stale] == ["chest"]
+        assert [e["muscle"] for e in current] == ["legs", "back", "biceps"]
+
+    def test_jsonl_file_archived_every_interval(self, tmp_path, monkeypatch):
+        """Should archive the stale entries of a JSON Lines file every ARCHIVE_INTERVAL entries"""
+        import config
+
+        monkeypatch.setattr(config, "ARCHIVE_INTERVAL", 2)
+        context_file = str(tmp_path / "context.jsonl")
+
+        append_context_entries(context_file, [self.make_entry("chest", "2024-11-01", "completed")])
+        assert len(read_entries(context_file)) == 1
+
+        append_context_entries(context_file, [self.make_entry("back", "2025-01-15", "completed")])
+        assert [e["muscle"] for e in read_entries(context_file)] == ["back"]
+        assert [e["muscle"] for e in read_entries(archive_file_for(context_file))] == ["chest"]
+
+
+class TestUserFiles:
+    """Tests for the context files of the users"""
+
+    @pytest.fixture
+    def users_folder(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path / "users"))
+        monkeypatch.setattr(config, "CONTEXT_FILE", str(tmp_path / "context.jsonl"))
+        return tmp_path / "users"
+
+    def entry(self, muscle):
+        return {"muscle": muscle, "date": "2025-01-10", "entry_type": "completed"}
+
+    def test_users_are_isolated(self, users_folder):
+        """Should keep the entries of ids that only differ by unsafe characters apart"""
+        store = FileStore()
+        for user_id, muscle in (("a.b", "chest"), ("a b", "legs"), ("a_b", "back")):
+            store.append(user_id, [self.entry(muscle)])
+
+        assert [e["muscle"] for e in store.sessions("a.b")] == ["chest"]
+        assert [e["muscle"] for e in store.sessions("a b")] == ["legs"]
+        assert sorted(store.user_ids()) == ["a b", "a.b", "a_b"]
+
+    def test_old_file_is_migrated(self, users_folder):
+        """Should rename the file saved with the old file name of a user"""
+        users_folder.mkdir()
+        append_entries(str(users_folder / "alice_smith.jsonl"), [self.entry("chest")])
+
+        store = FileStore()
+        assert [e["muscle"] for e in store.sessions("alice.smith")] == ["chest"]
+        assert os.path.exists(context_file_for_user("alice.smith"))
+        assert not os.path.exists(users_folder / "alice_smith.jsonl")
+        assert store.user_ids() == ["alice.smith"]
+
+
+class TestSQLiteStore:
+    """Tests for SQLiteStore"""
+
+    def make_entry(self, muscle, date, entry_type, injuries=""):
+        return {"timestamp": date, "user_input": "test", "muscle": muscle, "exercises": "test", "duration": 30.0,
+                "date": date, "injuries": injuries, "entry_type": entry_type}
+
+    def test_append_and_read(self, tmp_path):
+        """Should read back the entries of each user in order"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        store.append("alice", [self.make_entry("chest", "2025-01-10", "completed")])
+        store.append("bob", [self.make_entry("legs", "2025-01-10", "completed")])
+        store.append("alice", [self.make_entry("back", "2025-01-12", "planned")])
+
+        entries, _, appended = store.read_new_entries("alice")
+
+        assert appended == False
+        assert [e["muscle"] for e in entries] == ["chest", "back"]
+        assert entries[0] == self.make_entry("chest", "2025-01-10", "completed")
+
+    def test_only_new_entries_are_read(self, tmp_path):
+        """Should only read the rows saved since the last position"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        store.append("alice", [self.make_entry("chest", "2025-01-10", "completed")])
+        _, position, _ = store.read_new_entries("alice")
+
+        store.append("alice", [self.make_entry("back", "2025-01-11", "completed")])
+        entries, _, appended = store.read_new_entries("alice", position)
+
+        assert appended == True
+        assert [e["muscle"] for e in entries] == ["back"]
+
+    def test_sessions_query(self, tmp_path):
+        """Should filter the sessions by muscle, entry type and date"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        store.append("alice", [
+            self.make_entry("chest", "2025-01-01", "completed"),
+            self.make_entry("chest", "10.01.2025", "completed"),
+            self.make_entry("chest", "2025-01-12", "planned"),
+            self.make_entry("legs", "2025-01-10", "completed"),
+        ])
+
+        sessions = store.sessions("alice", muscle="chest", entry_type="completed", since="2025-01-05")
+
+        assert [s["date"] for s in sessions] == ["2025-01-10"]
+        assert FileStore(lambda _: str(tmp_path / "none.jsonl")).sessions("alice") == []
+
+    @pytest.mark.parametrize("muscle", ["chest", "Chest", "CHEST"])
+    def test_mixed_case_muscles_match_file_store(self, tmp_path, muscle):
+        """Should find the muscles saved as extracted ("Chest") like FileStore, whatever the case of the query"""
+        entries = [
+            self.make_entry("Chest", "2025-01-10", "completed"),
+            self.make_entry("chest", "2025-01-11", "completed"),
+            self.make_entry("CHEST", "2025-01-12", "planned"),
+            self.make_entry("Legs", "2025-01-12", "completed"),
+        ]
+        sqlite_store = SQLiteStore(str(tmp_path / "workouts.db"))
+        file_store = FileStore(lambda _: str(tmp_path / "alice.jsonl"))
+        sqlite_store.append("alice", entries)
+        file_store.append("alice", entries)
+
+        sessions = sqlite_store.sessions("alice", muscle=muscle)
+
+        assert sessions == file_store.sessions("alice", muscle=muscle)
+        assert [s["muscle"] for s in sessions] == ["Chest", "chest", "CHEST"]
+
+    def test_injuries_table(self, tmp_path):
+        """Should save an injury row for each completed workout with an injury"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        store.append("alice", [
+            self.make_entry("biceps", "2025-01-10", "completed", "pain in the elbow"),
+            self.make_entry("chest", "2025-01-11", "completed"),
+        ])
+
+        assert store.injuries("alice", since="2025-01-01") == [
+            {"muscle": "biceps", "date": "2025-01-10", "description": "pain in the elbow"}
+        ]
+
+    def test_signature(self, tmp_path):
+        """Should change the signature when rows are saved or compacted"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        empty = store.signature("alice")
+        store.append("alice", [self.make_entry("chest", "2025-01-10", "completed")] * 2)
+        saved = store.signature("alice")
+        store.append("bob", [self.make_entry("legs", "2025-01-10", "completed")])
+
+        assert saved != empty
+        assert store.signature("alice") == saved
+        store.compact("alice")
+        assert store.signature("alice") != saved
+
+    def test_wal_mode(self, tmp_path):
+        """Should use the WAL journal mode"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        assert store.connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+# Appends entries from another process, used to check the advisory lock
+def append_from_process(context_file, name, count):
+    for i in range(count):
+        append_entries(context_file, [{"muscle": name, "index": i}])
+
+
+class TestAtomicSaves:
+    """Tests for the locked, atomic and grouped saves"""
+
+    def test_concurrent_processes(self, tmp_path):
+        """Should keep every line written by concurrent processes"""
+        context_file = str(tmp_path / "context.jsonl")
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=append_from_process, args=(context_file, name, 50)) for name in ("a", "b")]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        entries = read_entries(context_file)
+        assert len(entries) == 100
+        assert [e["index"] for e in entries if e["muscle"] == "a"] == list(range(50))
+
+    def test_lock_is_reentrant(self, tmp_path):
+        """Should let a thread holding the lock of a file take it again"""
+        context_file = str(tmp_path / "context.jsonl")
+        with locked(context_file):
+            append_entries(context_file, [{"muscle": "chest"}])
+        assert read_entries(context_file) == [{"muscle": "chest"}]
+
+    def test_incomplete_line_is_removed(self, tmp_path):
+        """Should remove a line left incomplete by a crash before appending"""
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [{"muscle": "chest"}])
+        with open(context_file, "a") as f:
+            f.write('{"muscle": "ba')
+
+        append_entries(context_file, [{"muscle": "legs"}])
+
+        assert [e["muscle"] for e in read_entries(context_file)] == ["chest", "legs"]
+
+    def test_corrupt_json_file_is_kept(self, tmp_path):
+        """Should keep a JSON file that cannot be read instead of overwriting it"""
+        context_file = str(tmp_path / "context.json")
+        with open(context_file, "w") as f:
+            f.write('[{"muscle": "ch')
+
+        append_entries(context_file, [{"muscle": "legs"}])
+
+        assert read_entries(context_file) == [{"muscle": "legs"}]
+        with open(context_file + ".corrupt", "r") as f:
+            assert f.read() == '[{"muscle": "ch'
+
+    def test_sqlite_batches_in_one_transaction(self, tmp_path):
+        """Should save no entry of any batch if one of them fails"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        valid = {"muscle": "chest", "date": "2025-01-10", "entry_type": "completed"}
+
+        with pytest.raises(Exception):
+            store.append_batches([("alice", [valid]), ("bob", [{"muscle": ["not", "a", "value"]}])])
+
+        assert store.read_new_entries("alice")[0] == []
+
+    def test_group_commit(self, tmp_path):
+        """Should write the saves of concurrent requests with a single append"""
+        class CountingStore(FileStore):
+            calls = 0
+
+            def append_batches(self, batches):
+                CountingStore.calls += 1
+                super().append_batches(batches)
+
+        store = CountingStore(lambda user_id: str(tmp_path / f"{user_id}.jsonl"))
+        committer = GroupCommitter(window=0.2)
+        threads = [
+            threading.Thread(target=committer.save, args=(store, user_id, [{"muscle": muscle}]))
+            for user_id, muscle in (("alice", "chest"), ("bob", "legs"), ("alice", "back"))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert CountingStore.calls == 1
+        assert committer.stats() == {"commits": 1, "saves": 3}
+        assert sorted(e["muscle"] for e in read_entries(str(tmp_path / "alice.jsonl"))) == ["back", "chest"]
+        assert read_entries(str(tmp_path / "bob.jsonl")) == [{"muscle": "legs"}]
+
+    def test_group_commit_error(self, tmp_path):
+        """Should raise the error of a failed commit in every request of the group"""
+        class FailingStore(FileStore):
+            def append_batches(self, batches):
+                raise OSError("disk full")
+
+        with pytest.raises(OSError):
+            GroupCommitter(window=0).save(FailingStore(), "alice", [{"muscle": "chest"}])
+
+
+class TestCompaction:
+    """Tests for the compaction of the history"""
+
+    TODAY = datetime.datetime(2025, 1, 20)
+
+    def make_entry(self, muscle, date, entry_type, exercises="test", injuries="", duration=30.0):
+        return {"timestamp": date, "user_input": "test", "muscle": muscle, "exercises": exercises,
+                "duration": duration, "date": date, "injuries": injuries, "entry_type": entry_type}
+
+    def test_unconfirmed_past_plans_are_dropped(self):
+        """Should drop the past planned workouts without a completed session and keep the future ones"""
+        entries = [self.make_entry("chest", "2025-01-15", "planned"), self.make_entry("legs", "2025-01-25", "planned")]
+        compacted = compact_entries(entries, self.TODAY)
+        assert [(e["muscle"], e["entry_type"]) for e in compacted] == [("legs", "planned")]
+        assert entries[0]["entry_type"] == "planned"
+
+    def test_rejected_plan_is_not_a_workout(self):
+        """Should not count a past plan rejected by Prolog as a completed workout"""
+        entries = [
+            self.make_entry("legs", "2025-01-14", "completed"),
+            # Rejected by Prolog (legs need rest days), the user did not train legs on 2025-01-15
+            self.make_entry("legs", "2025-01-15", "planned"),
+        ]
+        compacted = compact_entries(entries, self.TODAY)
+        assert [(e["date"], e["entry_type"]) for e in compacted] == [("2025-01-14", "completed")]
+
+    def test_confirmed_past_plan_is_merged(self):
+        """Should merge a past plan into the completed session of the same muscle and date"""
+        entries = [
+            self.make_entry("back", "2025-01-15", "planned", "rows"),
+            self.make_entry("back", "2025-01-15", "completed", "pull ups"),
+        ]
+        compacted = compact_entries(entries, self.TODAY)
+        assert [(e["entry_type"], e["exercises"]) for e in compacted] == [("completed", "rows, pull ups")]
+
+    def test_duplicates_are_merged(self):
+        """Should merge the sessions of the same muscle and date"""
+        entries = [
+            self.make_entry("chest", "2025-01-15", "completed", "bench press", duration=30.0),
+            self.make_entry("legs", "2025-01-15", "completed"),
+            self.make_entry("Chest", "15.01.2025", "completed", "dips, bench press", "sore shoulder", 45.0),
+        ]
+        compacted = compact_entries(entries, self.TODAY)
+
+        assert [e["muscle"] for e in compacted] == ["chest", "legs"]
+        assert compacted[0]["exercises"] == "bench press, dips"
+        assert compacted[0]["injuries"] == "sore shoulder"
+        assert compacted[0]["duration"] == 45.0
+
+    def test_planned_and_completed_are_merged(self):
+        """Should keep a single completed session when a planned workout was done"""
+        entries = [self.make_entry("back", "2025-01-20", "planned"), self.make_entry("back", "2025-01-20", "completed")]
+        assert [e["entry_type"] for e in compact_entries(entries, self.TODAY)] == ["completed"]
+
+    def test_invalid_entries_are_kept(self):
+        """Should keep the entries without a valid muscle or date"""
+        entries = [{"muscle": "chest", "date": "", "entry_type": "planned"}, {"date": "2025-01-15"}]
+        assert compact_entries(entries, self.TODAY) == entries
+
+    def test_compacted_file_is_read_again(self, tmp_path, monkeypatch):
+        """Should replace the context file, so the MCP server reads the snapshot again"""
+        monkeypatch.setattr(config, "HISTORY_RETENTION", False)
+        context_file = str(tmp_path / "context.jsonl")
+        append_entries(context_file, [self.make_entry("chest", "2025-01-15", "completed")] * 3)
+        _, position, _ = read_new_entries(context_file)
+
+        assert compact_context_file(context_file) == (3, 1)
+        entries, _, appended = read_new_entries(context_file, position)
+
+        assert appended == False
+        assert len(entries) == 1
+
+    def test_compaction_on_tail_size(self, tmp_path, monkeypatch):
+        """Should compact a context file once the entries appended since the last compaction are large enough"""
+        monkeypatch.setattr(config, "HISTORY_RETENTION", False)
+        monkeypatch.setattr(config, "COMPACTION_TAIL_SIZE", 2000)
+        context_file = str(tmp_path / "context.jsonl")
+
+        for _ in range(20):
+            append_context_entries(context_file, [self.make_entry("chest", "2025-01-15", "completed")])
+
+        assert len(read_entries(context_file)) < 20
+        assert needs_compaction(context_file) == False
+
+    def test_sqlite_compaction(self, tmp_path):
+        """Should rewrite the rows of a user and change its generation"""
+        store = SQLiteStore(str(tmp_path / "workouts.db"))
+        store.append("alice", [
+            self.make_entry("biceps", "2025-01-10", "completed", injuries="elbow"),
+            self.make_entry("biceps", "2025-01-10", "planned"),
+        ])
+        store.append("bob", [self.make_entry("legs", "2025-01-10", "completed")])
+        _, position, _ = store.read_new_entries("alice")
+
+        assert store.compact("alice") == (2, 1)
+        entries, _, appended = store.read_new_entries("alice", position)
+
+        assert appended == False
+        assert [e["muscle"] for e in entries] == ["biceps"]
+        assert len(store.injuries("alice")) == 1
+        assert len(store.sessions("bob")) == 1
+
+    def test_compact_store(self, tmp_path, monkeypatch):
+        """Should compact the context file of every user"""
+        monkeypatch.setattr(config, "HISTORY_RETENTION", False)
+        monkeypatch.setattr(config, "CONTEXT_STORE", "jsonl")
+        monkeypatch.setattr(config, "CONTEXT_FILE", str(tmp_path / "context.jsonl"))
+        monkeypatch.setattr(config, "USERS_FOLDER", str(tmp_path / "users"))
+        append_entries(config.CONTEXT_FILE, [self.make_entry("chest", "2025-01-15", "completed")] * 2)
+        append_entries(str(tmp_path / "users" / "alice.jsonl"), [self.make_entry("legs", "2025-01-15", "completed")])
+
+        assert compact_store() == {config.DEFAULT_USER_ID: (2, 1), "alice": (1, 1)}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,176 @@
+"""
+Unit Tests for the Vectorized Rule Engine (haiwpa_vector.py and haiwpa_rules.py)
+
+Tests the rule facts read from workout_rules.pl, the muscle x day reason matrix,
+and compares the NumPy engine with the Prolog engine on randomised histories.
+
+Run with: pytest tests/test_vector_engine.py -v
+Servers required: None (SWI-Prolog for the equivalence tests)
+"""
+
+import pytest
+import os
+import sys
+import random
+np = pytest.importorskip("numpy")
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_rules import load_rule_facts, parse_arguments
+from haiwpa_vector import (
+    VectorRuleEngine,
+    days_between,
+    REASONS,
+    WORKOUT_ALLOWED,
+    INJURY_PRESENT,
+    TRAINED_TOGETHER_INJURED,
+    INSUFFICIENT_REST,
+)
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "workout_rules.pl")
+
+START = datetime(2025, 1, 15)
+
+
+def timestamp(day_offset: int):
+    return int((START + timedelta(days=day_offset)).timestamp())
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return VectorRuleEngine(RULES_PATH)
+
+
+class TestRuleFacts:
+    """Tests for the facts read from workout_rules.pl"""
+
+    def test_parse_arguments(self):
+        """Should parse quoted atoms and convert numbers"""
+        assert parse_arguments("'bench press', chest") == ("bench press", "chest")
+        assert parse_arguments("chest, 2") == ("chest", 2)
+
+    def test_rule_facts(self):
+        """Should read the values used by the Prolog rules"""
+        facts = load_rule_facts(RULES_PATH)
+        assert "chest" in facts["muscle_groups"]
+        assert facts["exercises"]["bench press"] == "chest"
+        assert facts["rest_days"]["chest"] == 2
+        assert facts["recovery_days"]["biceps"] == 14
+        assert ("biceps", "triceps") in facts["trained_together"]
+
+
+class TestVectorRuleEngine:
+    """Tests for VectorRuleEngine"""
+
+    def test_days_between_rounds_like_prolog(self):
+        """Should round halves away from zero"""
+        assert days_between(0, 1.5 * 86400) == 2
+        assert days_between(1.5 * 86400, 0) == -2
+        assert days_between(0, 2.5 * 86400) == 3
+
+    def test_no_history_allows_everything(self, engine):
+        """Should allow every muscle on every day without history"""
+        last_trained, last_injury = engine.history_arrays([])
+        days = [timestamp(d) for d in range(5)]
+        assert engine.allowed(days, last_trained, last_injury).all()
+
+    def test_insufficient_rest(self, engine):
+        """Should refuse chest until its 2 rest days have passed"""
+        last_trained, last_injury = engine.history_arrays([("chest", timestamp(0))])
+        days = [timestamp(d) for d in range(4)]
+        reasons = engine.evaluate(days, last_trained, last_injury)
+        chest = engine.muscle_index["chest"]
+        assert list(reasons[chest]) == [INSUFFICIENT_REST, INSUFFICIENT_REST, WORKOUT_ALLOWED, WORKOUT_ALLOWED]
+
+    def test_injury_priority(self, engine):
+        """Should report injury_present before insufficient_rest, and the injured partners"""
+        last_trained, last_injury = engine.history_arrays(
+            [("biceps", timestamp(0))], [("biceps", timestamp(0))]
+        )
+        reasons = engine.evaluate([timestamp(1), timestamp(14)], last_trained, last_injury)
+        assert reasons[engine.muscle_index["biceps"], 0] == INJURY_PRESENT
+        assert reasons[engine.muscle_index["triceps"], 0] == TRAINED_TOGETHER_INJURED
+        assert reasons[engine.muscle_index["back"], 0] == TRAINED_TOGETHER_INJURED
+        assert (reasons[:, 1] == WORKOUT_ALLOWED).all()
+
+    def test_keeps_latest_date(self, engine):
+        """Should keep the latest workout of each muscle, with any letter case"""
+        last_trained, _ = engine.history_arrays([("Chest", timestamp(3)), ("chest", timestamp(1))])
+        assert last_trained[engine.muscle_index["chest"]] == timestamp(3)
+
+    def test_batch_of_users(self, engine):
+        """Should evaluate several users at once"""
+        histories = [engine.history_arrays([("legs", timestamp(0))]), engine.history_arrays([])]
+        last_trained = np.stack([h[0] for h in histories])
+        last_injury = np.stack([h[1] for h in histories])
+        days = [timestamp(d) for d in range(90)]
+
+        reasons = engine.evaluate(days, last_trained, last_injury)
+
+        assert reasons.shape == (2, len(engine.muscles), 90)
+        assert reasons[0, engine.muscle_index["legs"], 0] == INSUFFICIENT_REST
+        assert (reasons[1] == WORKOUT_ALLOWED).all()
+
+    def test_alternatives(self, engine):
+        """Should suggest muscles that are allowed and not trained together with the refused one"""
+        last_trained, last_injury = engine.history_arrays([("chest", timestamp(0))])
+        reasons = engine.evaluate([timestamp(0)], last_trained, last_injury)
+        alternatives = engine.alternatives(reasons)[engine.muscle_index["chest"], :, 0]
+        names = [m for m, suggested in zip(engine.muscles, alternatives) if suggested]
+        assert "chest" not in names
+        assert "triceps" not in names
+        assert "legs" in names
+
+    def test_reason_names(self, engine):
+        """Should convert reason codes to the names used by Prolog"""
+        reasons = np.array([[WORKOUT_ALLOWED, INJURY_PRESENT]], dtype=np.int8)
+        assert engine.reason_names(reasons).tolist() == [["workout_allowed", "injury_present"]]
+
+
+@pytest.fixture(scope="module")
+def prolog():
+    """Initialize Prolog engine and load workout rules"""
+    from pyswip import Prolog
+
+    pl = Prolog()
+    pl.consult(RULES_PATH)
+    return pl
+
+
+# Random history : workouts and injuries on random days around the evaluated window
+def random_history(rng: random.Random, muscles):
+    workouts = [(rng.choice(muscles), timestamp(rng.randint(-40, 30))) for _ in range(rng.randint(0, 15))]
+    injuries = [(rng.choice(muscles), timestamp(rng.randint(-40, 30))) for _ in range(rng.randint(0, 3))]
+    return workouts, injuries
+
+
+class TestPrologEquivalence:
+    """Compares VectorRuleEngine with validate_batch/2 on randomised histories"""
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_same_results_as_prolog(self, prolog, engine, seed):
+        """Should give the same reason and alternatives as Prolog for every muscle and day"""
+        from haiwpa_prolog import Out, first_solution, run
+
+        rng = random.Random(seed)
+        workouts, injuries = random_history(rng, engine.muscles)
+        module = f"vector_check_{seed}"
+        run("user", "init_user_kb", module)
+        for muscle, date in workouts:
+            run(module, "record_workout", date, muscle, [], 0)
+        for muscle, date in injuries:
+            run(module, "record_injury", date, muscle)
+
+        days = [timestamp(d) for d in range(30)]
+        reasons = engine.evaluate(days, *engine.history_arrays(workouts, injuries))
+        alternatives = engine.alternatives(reasons)
+
+        pairs = [(muscle, day) for muscle in engine.muscles for day in days]
+        results = first_solution(module, "validate_batch", pairs, Out("Results"))["Results"]
+
+        for (muscle, day), (_, _, reason, _, suggested) in zip(pairs, results):
+            m, d = engine.muscle_index[muscle], days.index(day)
+            assert REASONS[reasons[m, d]] == reason, (muscle, day)
+            expected = [a for a, ok in zip(engine.muscles, alternatives[m, :, d]) if ok]
+            assert expected == suggested, (muscle, day)
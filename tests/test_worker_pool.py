@@ -0,0 +1,121 @@
+"""
+Unit Tests for the Prolog Worker Pool (haiwpa_pool.py)
+
+Tests how requests are dispatched to the worker processes, and runs functions of the standard library in real
+worker processes (the Prolog functions of `haiwpa_mcp` need SWI-Prolog).
+
+Run with: pytest tests/test_worker_pool.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_pool import PrologWorkerPool, READ_ONLY_FUNCTIONS
+from concurrent.futures.process import BrokenProcessPool
+import zlib
+
+
+@pytest.fixture
+def pool():
+    """Create a worker pool, no process is started until a request is submitted"""
+    worker_pool = PrologWorkerPool(size=3)
+    yield worker_pool
+    worker_pool.shutdown()
+
+
+@pytest.fixture
+def os_pool():
+    """Create a worker pool running functions of the `os` module"""
+    worker_pool = PrologWorkerPool(size=2, module="os", read_only={"getpid", "fspath", "getenv", "_exit"})
+    yield worker_pool
+    worker_pool.shutdown()
+
+
+class TestWorkerForUser:
+    """Tests for worker_for_user dispatching"""
+
+    def test_user_affinity(self, pool):
+        """Should always send a user to the same worker"""
+        first = pool.worker_for_user("alice")
+
+        assert pool.worker_for_user("alice") == first
+        assert PrologWorkerPool(size=3).worker_for_user("alice") == first
+
+    def test_stable_hash(self, pool):
+        """Should derive the worker from the user id, the same in every run of the server"""
+        assert pool.worker_for_user("bob") == zlib.crc32(b"bob") % 3
+
+    def test_no_assignment_kept(self, pool):
+        """Should not keep a map growing with the number of users"""
+        for i in range(1000):
+            assert 0 <= pool.worker_for_user(f"user_{i}") < 3
+        assert not hasattr(pool, "assignments")
+
+    def test_users_spread_over_workers(self, pool):
+        """Should spread the users over the workers"""
+        workers = {pool.worker_for_user(f"user_{i}") for i in range(30)}
+
+        assert workers == {0, 1, 2}
+
+
+class TestRun:
+    """Tests for run in the worker processes"""
+
+    @pytest.mark.asyncio
+    async def test_result_returned(self, os_pool):
+        """Should run the function in the worker of the user and return its result"""
+        pid = await os_pool.run("alice", "getpid")
+
+        assert pid != os.getpid()
+        assert await os_pool.run("alice", "getpid") == pid
+
+    @pytest.mark.asyncio
+    async def test_arguments(self, os_pool):
+        """Should pass the positional and keyword arguments to the function"""
+        assert await os_pool.run("alice", "fspath", "rules.pl") == "rules.pl"
+        assert await os_pool.run("alice", "getenv", "HAIWPA_MISSING_VARIABLE", default="none") == "none"
+
+    @pytest.mark.asyncio
+    async def test_crashed_worker_restarted(self, os_pool):
+        """Should start a crashed worker again, retry a read-only request once, and keep serving the user"""
+        pid = await os_pool.run("alice", "getpid")
+
+        # `os._exit` kills the worker on the request and on its retry
+        with pytest.raises(BrokenProcessPool):
+            await os_pool.run("alice", "_exit", 1)
+
+        assert os_pool.restarts == 2
+        new_pid = await os_pool.run("alice", "getpid")
+        assert new_pid != pid
+
+    @pytest.mark.asyncio
+    async def test_writes_not_retried(self, os_pool):
+        """Should start a crashed worker again without running a request that saves something twice"""
+        os_pool.read_only = {"getpid"}
+
+        with pytest.raises(BrokenProcessPool):
+            await os_pool.run("alice", "_exit", 1)
+
+        assert os_pool.restarts == 1
+        assert await os_pool.run("alice", "getpid") != os.getpid()
+
+    def test_ingestion_not_retried(self):
+        """Should only retry the functions of haiwpa_mcp that do not save anything"""
+        assert "validate_planned_workouts" in READ_ONLY_FUNCTIONS
+        assert "plan_user_workouts" in READ_ONLY_FUNCTIONS
+        assert "ingest_user_sessions" not in READ_ONLY_FUNCTIONS
+
+    @pytest.mark.asyncio
+    async def test_broadcast(self, os_pool):
+        """Should run the function once in every worker"""
+        pids = await os_pool.broadcast("getpid")
+
+        assert len(set(pids)) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -13,10 +13,13 @@ import os
 import sys
 import datetime
 import tempfile
+import hashlib
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from haiwpa_workout import FitnessExtract, MultipleFitnessExtract, today_date
+from haiwpa_workout import context_entry, save_sessions
+from haiwpa_store import read_entries, archive_file_for, context_file_for_user
 
 
 class TestTodayDate:
@@ -37,6 +40,34 @@ class TestTodayDate:
         assert result == expected
 
 
+class TestContextFileForUser:
+    """Tests for context_file_for_user helper function"""
+
+    def test_default_user_uses_context_file(self):
+        """Should keep using config.CONTEXT_FILE for the default user"""
+        import config
+        assert context_file_for_user(config.DEFAULT_USER_ID) == config.CONTEXT_FILE
+
+    def test_other_users_get_their_own_file(self):
+        """Should use a separate file in the users folder for other users"""
+        import config
+        result = context_file_for_user("abc123")
+        md5 = hashlib.md5(b"abc123").hexdigest()
+        assert result == os.path.join(config.USERS_FOLDER, f"abc123_{md5}.jsonl")
+
+    def test_unsafe_characters_are_replaced(self):
+        """Should not allow a user id to escape the users folder"""
+        import config
+        result = context_file_for_user("../../etc/passwd")
+        assert os.path.dirname(result) == config.USERS_FOLDER
+        assert os.path.basename(result).startswith("______etc_passwd_")
+
+    def test_no_shared_files(self):
+        """Should give different files to ids that only differ by unsafe characters"""
+        files = {context_file_for_user(user_id) for user_id in ("a.b", "a b", "a_b", "a/b")}
+        assert len(files) == 4
+
+
 class TestFitnessExtract:
     """Tests for FitnessExtract Pydantic model"""
 
@@ -197,6 +228,108 @@ class TestFitnessExtract:
                 config.DATA_FOLDER = original_data_folder
                 config.CONTEXT_FILE = original_context_file
 
+    def test_save_to_json_per_user(self):
+        """Should save the entries of a user in its own file"""
+        import config
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            original_users_folder = config.USERS_FOLDER
+            config.USERS_FOLDER = os.path.join(tmpdir, "users")
+
+            try:
+                extract = FitnessExtract(
+                    muscle="legs",
+                    exercises="squats",
+                    date="2025-01-15",
+                    entry_type="completed"
+                )
+                extract.save_to_json("Leg day", "user_a")
+
+                data = read_entries(context_file_for_user("user_a"))
+
+                assert len(data) == 1
+                assert data[0]["muscle"] == "legs"
+                assert not os.path.exists(context_file_for_user("user_b"))
+            finally:
+                config.USERS_FOLDER = original_users_folder
+
+    def test_save_to_json_archives_stale_entries(self):
+        """Should move stale entries from the context file to the archive file"""
+        import config
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            original_data_folder = config.DATA_FOLDER
+            original_context_file = config.CONTEXT_FILE
+
+            config.DATA_FOLDER = tmpdir
+            config.CONTEXT_FILE = os.path.join(tmpdir, "test_context.json")
+
+            try:
+                with open(config.CONTEXT_FILE, "w") as f:
+                    json.dump([{"muscle": "chest", "date": "2024-11-01", "entry_type": "completed", "injuries": ""}], f)
+
+                extract = FitnessExtract(
+                    muscle="back",
+                    exercises="rows",
+                    date="2025-01-15",
+                    entry_type="completed"
+                )
+                extract.save_to_json("Back day")
+
+                with open(config.CONTEXT_FILE, "r") as f:
+                    data = json.load(f)
+                with open(archive_file_for(config.CONTEXT_FILE), "r") as f:
+                    archived = [json.loads(line) for line in f]
+
+                assert [e["muscle"] for e in data] == ["back"]
+                assert [e["muscle"] for e in archived] == ["chest"]
+            finally:
+                config.DATA_FOLDER = original_data_folder
+                config.CONTEXT_FILE = original_context_file
+
+    def test_save_sessions_single_write(self, monkeypatch):
+        """Should save all the sessions of a message with a single append"""
+        import haiwpa_store
+
+        appends = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            monkeypatch.setattr(haiwpa_store.config, "USERS_FOLDER", os.path.join(tmpdir, "users"))
+            monkeypatch.setattr(haiwpa_store.config, "CONTEXT_STORE", "jsonl")
+            monkeypatch.setattr(haiwpa_store.FileStore, "append",
+                                lambda store, user_id, entries: appends.append(entries))
+
+            sessions = [
+                FitnessExtract(muscle="chest", exercises="bench press", date="2025-01-15", entry_type="completed"),
+                FitnessExtract(muscle="triceps", exercises="dips", date="2025-01-15", entry_type="completed"),
+            ]
+            save_sessions(sessions, "Chest and triceps today", "user_a")
+
+        assert len(appends) == 1
+        assert [e["muscle"] for e in appends[0]] == ["chest", "triceps"]
+        assert all(e["duration"] == 0.0 for e in appends[0])
+
+
+class TestContextEntry:
+    """Tests for context_entry helper function"""
+
+    def test_entry_from_session(self):
+        """Should build a context file entry from a dumped session"""
+        session = FitnessExtract(muscle="chest", exercises="bench press", date="2025-01-15", entry_type="planned")
+        entry = context_entry(session.model_dump(), "Can I train chest?")
+
+        assert entry["user_input"] == "Can I train chest?"
+        assert entry["muscle"] == "chest"
+        assert entry["entry_type"] == "planned"
+        assert "timestamp" in entry
+
+    def test_missing_fields_use_defaults(self):
+        """Should use the model defaults for missing fields"""
+        entry = context_entry({"muscle": "legs", "entry_type": "completed", "duration": None}, "")
+
+        assert entry["duration"] == 0.0
+        assert entry["date"] == today_date()
+        assert entry["injuries"] == ""
+
 
 class TestMultipleFitnessExtract:
     """Tests for MultipleFitnessExtract Pydantic model"""
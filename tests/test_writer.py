@@ -0,0 +1,56 @@
+"""
+Unit Tests for the Background Writer (haiwpa_writer.py)
+
+Tests write order, flush and error counters.
+
+Run with: pytest tests/test_writer.py -v
+Servers required: None
+"""
+
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from haiwpa_writer import BackgroundWriter
+
+
+class TestBackgroundWriter:
+    """Tests for BackgroundWriter"""
+
+    def test_writes_in_order(self):
+        """Should run the writes in the order they were submitted"""
+        writer = BackgroundWriter()
+        written = []
+        for i in range(100):
+            writer.submit(written.append, i)
+        writer.flush()
+
+        assert written == list(range(100))
+        assert writer.stats() == {"pending": 0, "written": 100, "errors": 0}
+
+    def test_flush_without_writes(self):
+        """Should not wait if nothing was submitted"""
+        writer = BackgroundWriter()
+        writer.flush()
+        assert writer.thread is None
+
+    def test_failed_write_is_counted(self):
+        """Should keep running after a failed write"""
+        writer = BackgroundWriter()
+        written = []
+
+        def fail():
+            raise OSError("disk full")
+
+        writer.submit(fail)
+        writer.submit(written.append, "chest")
+        writer.flush()
+
+        assert written == ["chest"]
+        assert writer.stats()["errors"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
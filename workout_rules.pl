@@ -5,6 +5,11 @@
 % Source : 
 % - https://www.swi-prolog.org/pldoc/man?predicate=findall/3
 % - https://www.swi-prolog.org/pldoc/man?predicate=max_list/2
+% - https://www.swi-prolog.org/man/clpfd.html
+% - https://www.swi-prolog.org/pldoc/man?predicate=call_with_time_limit/2
+
+:- use_module(library(clpfd)).
+:- use_module(library(time)).
 
 % =====================================
 % Connection test
@@ -129,14 +134,116 @@ trained_together(glutes, abdominals).
 :- dynamic workout_history/4.
 :- dynamic injury/2.
 
+% =====================================
+% Indexed facts derived from the workout history
+% last_trained(Muscle, Date) : date of the latest workout of Muscle
+% latest_injury(Muscle, Date) : date of the latest injury of Muscle
+% Muscle is the first argument so SWI-Prolog first argument indexing finds them directly.
+% They are updated by record_workout/4 and record_injury/2. Facts asserted or retracted directly
+% (assertz(workout_history(...))) change the generation of the history predicates, the indexes are then
+% rebuilt from the history before they are read again.
+% indexed_generations(Workouts, Injuries) : generations of the history predicates the indexes were built from
+% =====================================
+
+:- dynamic last_trained/2.
+:- dynamic latest_injury/2.
+:- dynamic indexed_generations/2.
+
+record_workout(Date, Muscle, Exercise, Duration):-
+    ensure_history_indexed,
+    assertz(workout_history(Date, Muscle, Exercise, Duration)),
+    update_last_trained(Muscle, Date),
+    save_indexed_generations.
+
+record_injury(Date, Muscle):-
+    ensure_history_indexed,
+    assertz(injury(Date, Muscle)),
+    update_latest_injury(Muscle, Date),
+    save_indexed_generations.
+
+% Database generation of the last change of each history predicate, changed by every assert and retract
+% The number of clauses is used by the versions of SWI-Prolog without last_modified_generation.
+history_generations(Workouts, Injuries):-
+    predicate_generation(workout_history(_, _, _, _), Workouts),
+    predicate_generation(injury(_, _), Injuries).
+
+predicate_generation(Head, Generation):-
+    (predicate_property(Head, last_modified_generation(Generation)) -> true
+    ; predicate_property(Head, number_of_clauses(Generation)) -> true
+    ; Generation = 0).
+
+save_indexed_generations:-
+    history_generations(Workouts, Injuries),
+    retractall(indexed_generations(_, _)),
+    assertz(indexed_generations(Workouts, Injuries)).
+
+% Rebuilding the indexes if the history was changed without record_workout/4 and record_injury/2
+ensure_history_indexed:-
+    history_generations(Workouts, Injuries),
+    (indexed_generations(Workouts, Injuries) -> true ; rebuild_history_indexes).
+
+rebuild_history_indexes:-
+    retractall(last_trained(_, _)),
+    retractall(latest_injury(_, _)),
+    forall(workout_history(Date, Muscle, _, _), update_last_trained(Muscle, Date)),
+    forall(injury(Date, Muscle), update_latest_injury(Muscle, Date)),
+    save_indexed_generations.
+
+% Only the latest date is kept, an older workout does not change the index
+update_last_trained(Muscle, Date):-
+    last_trained(Muscle, LastDate),
+    LastDate >= Date, !.
+update_last_trained(Muscle, Date):-
+    retractall(last_trained(Muscle, _)),
+    assertz(last_trained(Muscle, Date)).
+
+update_latest_injury(Muscle, Date):-
+    latest_injury(Muscle, LastDate),
+    LastDate >= Date, !.
+update_latest_injury(Muscle, Date):-
+    retractall(latest_injury(Muscle, _)),
+    assertz(latest_injury(Muscle, Date)).
+
+% Removing the whole workout history with its indexes
+clear_history:-
+    retractall(workout_history(_, _, _, _)),
+    retractall(injury(_, _)),
+    retractall(last_trained(_, _)),
+    retractall(latest_injury(_, _)),
+    save_indexed_generations.
+
+% =====================================
+% Per-user knowledge bases
+% Each user of the MCP server has its own module containing its history facts (e.g. kb_1a2b:workout_history/4).
+% The predicates using the history are module transparent : when called as Module:can_workout(...),
+% they use the facts of Module, and the static facts (rest_day_required/2, ...) are inherited from user.
+% =====================================
+
+init_user_kb(Module):-
+    dynamic([Module:workout_history/4, Module:injury/2, Module:last_trained/2, Module:latest_injury/2,
+             Module:indexed_generations/2]).
+
+:- module_transparent
+    record_workout/4, record_injury/2,
+    update_last_trained/2, update_latest_injury/2, clear_history/0,
+    history_generations/2, predicate_generation/2, save_indexed_generations/0,
+    ensure_history_indexed/0, rebuild_history_indexes/0,
+    workout_rest_days/1, max_day_required/1, suggested_rest_days/1,
+    recently_trained/2, has_injury/2, trained_together_has_injury/3,
+    can_workout/3, suggest_alternative/3,
+    validate_batch/2, validate_workout/2, injured_partner/4,
+    plan_workouts/5, target_schedule/3, allowed_by_history/3.
+
 % =====================================
 % Max rest day requirement from workout_history rest_day_required/2
 % =====================================
 
-% Saving all required rest days from workout_history `rest_day_required` function based on `Muscle` in the `RestDays` list.
+% Saving all required rest days from the trained muscles `rest_day_required` function based on `Muscle` in the `RestDays` list.
 % findall is used to collect all rest days into a list. In this case, we want to collect RestDay from each Muscle.
+% last_trained/2 has one fact per trained muscle, so the list does not grow with the history.
 workout_rest_days(RestDays):-
-    findall(RestDay, (workout_history(_, Muscle, _, _), rest_day_required(Muscle, RestDay)), RestDays).
+    ensure_history_indexed,
+    findall(RestDay, (last_trained(Muscle, _), rest_day_required(Muscle, RestDay)), RestDays).
 
 max_day_required(MaxRestDays):-
     workout_rest_days(RestDays),
@@ -162,15 +269,19 @@ sufficient_rest(Muscle, LastWorkoutDate, CurrentDate):-
 % ====================================
 
 % Check if muscle group has been trained recently
+% Only the latest workout is needed : if it is far enough, all older ones are too.
 recently_trained(Muscle, Date):-
-    workout_history(WorkoutDate, Muscle, _, _),
+    ensure_history_indexed,
+    last_trained(Muscle, WorkoutDate),
     days_between(WorkoutDate, Date, Days),
     rest_day_required(Muscle, RequiredRestDays),
     Days < RequiredRestDays.
 
 % Check if there are any injuries for a muscle group
+% Only the latest injury is needed, for the same reason as recently_trained.
 has_injury(Muscle, CurrentDate):-
-    injury(InjuryDate, Muscle),
+    ensure_history_indexed,
+    latest_injury(Muscle, InjuryDate),
     injury_recovery_days(Muscle, RecoveryDays),
     days_between(InjuryDate, CurrentDate, DaysSinceInjury),
     DaysSinceInjury < RecoveryDays.
@@ -222,6 +333,92 @@ suggest_alternative(Muscle, Date, AlternativeMuscle):-
     alternative_muscle(Muscle, AlternativeMuscle),
     can_workout(AlternativeMuscle, Date, 'workout_allowed').
 
+% ====================================
+% Batch validation
+% Validates a list of Muscle-Date pairs in a single call from FastMCP.
+% Each result is [Muscle, Date, Reason, InjuredMuscle, Alternatives]
+% InjuredMuscle is `none` if no muscle trained together with Muscle is injured.
+% ====================================
+
+validate_batch(Workouts, Results):-
+    maplist(validate_workout, Workouts, Results).
+
+% Unknown muscle groups are not validated
+validate_workout(Muscle-Date, [Muscle, Date, invalid_muscle_group, none, []]):-
+    \+ muscle_group(Muscle), !.
+
+% Only the first reason from can_workout is kept, like in the single validation
+validate_workout(Muscle-Date, [Muscle, Date, Reason, InjuredMuscle, Alternatives]):-
+    once(can_workout(Muscle, Date, Reason)),
+    injured_partner(Muscle, Date, Reason, InjuredMuscle),
+    findall(AlternativeMuscle, suggest_alternative(Muscle, Date, AlternativeMuscle), Alternatives).
+
+injured_partner(Muscle, Date, 'trained_together_injured', InjuredMuscle):-
+    trained_together_has_injury(Muscle, Date, InjuredMuscle), !.
+injured_partner(_, _, _, none).
+
+% ====================================
+% Multi-day planning with CLP(FD)
+% plan_workouts(Dates, Targets, MaxPerDay, TimeLimit, Plan)
+% Dates is the list of days to plan (UNIX timestamps) and Targets the muscles to train.
+% Plan has one list of muscles to train per day of Dates.
+% Each muscle and day is a 0/1 variable, the constraints are :
+% - the day is allowed by the workout history (injuries, rest days, can_workout/3)
+% - two sessions of a muscle are at least rest_day_required/2 days apart
+% - at most MaxPerDay muscles per day
+% The number of sessions is maximized within TimeLimit seconds.
+% ====================================
+
+plan_workouts(Dates, Targets, MaxPerDay, TimeLimit, Plan):-
+    maplist(target_schedule(Dates), Targets, Schedules),
+    transpose(Schedules, DaysSessions),
+    maplist(max_sessions_per_day(MaxPerDay), DaysSessions),
+    append(Schedules, Sessions),
+    sum(Sessions, #=, Total),
+    solve_plan(Sessions, Total, TimeLimit),
+    maplist(day_muscles(Targets), DaysSessions, Plan).
+
+% One 0/1 variable per day for a muscle
+target_schedule(Dates, Muscle, Schedule):-
+    same_length(Dates, Schedule),
+    Schedule ins 0..1,
+    maplist(allowed_by_history(Muscle), Dates, Schedule),
+    rest_day_required(Muscle, RestDays),
+    rest_windows(Schedule, RestDays).
+
+% A day is only possible if can_workout/3 allows it with the workout history
+allowed_by_history(Muscle, Date, Session):-
+    once(can_workout(Muscle, Date, Reason)),
+    (Reason == 'workout_allowed' -> true ; Session #= 0).
+
+% Any RestDays consecutive days contain at most one session
+rest_windows(Schedule, RestDays):-
+    length(Window, RestDays),
+    (append(Window, _, Schedule) ->
+        sum(Window, #=<, 1),
+        Schedule = [_|Rest],
+        rest_windows(Rest, RestDays)
+    ;
+        true
+    ).
+
+max_sessions_per_day(MaxPerDay, DaySessions):-
+    sum(DaySessions, #=<, MaxPerDay).
+
+% The best plan is searched within TimeLimit seconds, otherwise the first plan found is kept
+solve_plan(Sessions, Total, TimeLimit):-
+    catch(
+        call_with_time_limit(TimeLimit, once(labeling([max(Total), down], Sessions))),
+        time_limit_exceeded,
+        once(labeling([down], Sessions))
+    ).
+
+% Muscles with a session on a day
+day_muscles([], [], []).
+day_muscles([Muscle|Targets], [Session|Sessions], Muscles):-
+    (Session =:= 1 -> Muscles = [Muscle|Rest] ; Muscles = Rest),
+    day_muscles(Targets, Sessions, Rest).
+
 % ====================================
 % Prolog Reasoning for the LLM answer
 % ====================================